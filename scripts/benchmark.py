@@ -0,0 +1,346 @@
+﻿"""
+Benchmarks del camino /query, sin servicios externos.
+
+- Micro: cada etapa por separado (clave de caché, router, prompt, serialización).
+- Macro: /query de extremo a extremo contra dobles locales de Redis, MLflow y OpenAI.
+
+Uso:
+    python scripts/benchmark.py --output bench.json
+    python scripts/benchmark.py --output nuevo.json --compare bench.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configuración mínima para importar la app sin .env ni claves reales
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+os.environ.setdefault("PINECONE_ENVIRONMENT", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+
+from src.sre.generation.llm_client import RAGModel
+from src.sre.generation.model_router import ModelRouter
+from src.sre.retrieval.vector_index import RetrievedChunk
+from src.sre.utils.cache import RedisCache, TieredCache, LocalCache, decode_value, encode_value
+from src.sre.utils.singleflight import SingleFlight
+from src.sre.monitoring.tracing import span
+
+QUERY = "¿Cuál es la altura máxima de colocación de los extintores portátiles según el DB-SI 4?"
+CHUNK_TEXT = (
+    "DB-SI 4 Instalaciones de protección contra incendios. Los extintores portátiles "
+    "se colocarán de forma que el extremo superior esté a una altura sobre el suelo "
+    "de 1,20 m como máximo y serán fácilmente visibles y accesibles. "
+) * 8
+ANSWER = "Según el DB-SI 4, el extremo superior del extintor debe quedar como máximo a 1,20 m del suelo. " * 6
+
+
+# --- Dobles locales -----------------------------------------------------------
+
+class InMemoryRedis:
+    """Lo que usa la caché de redis.asyncio, en memoria."""
+
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zremrangebyscore(self, key, low, high):
+        members = self.data.get(key, {})
+        for member in [m for m, score in members.items() if score <= high]:
+            del members[member]
+
+    def pipeline(self, transaction=True):
+        return _InMemoryPipeline(self)
+
+    async def eval(self, script, numkeys, key, token, *args):
+        # Scripts del lease de singleflight: renovar (pexpire, aquí sin TTL) o liberar
+        if self.data.get(key) != token:
+            return 0
+        if "pexpire" not in script:
+            del self.data[key]
+        return 1
+
+    async def publish(self, channel, message):
+        return 0
+
+    def pubsub(self, **kwargs):
+        return _SilentPubSub()
+
+
+class _InMemoryPipeline:
+    def __init__(self, client: InMemoryRedis):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class _SilentPubSub:
+    async def subscribe(self, *channels):
+        pass
+
+    async def listen(self):
+        await asyncio.Event().wait()
+        yield
+
+    async def reset(self):
+        pass
+
+
+class FakeChatCompletions:
+    """chat.completions.create con latencia simulada opcional."""
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    async def create(self, **kwargs):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=ANSWER))],
+            usage=SimpleNamespace(prompt_tokens=900, completion_tokens=120, total_tokens=1020)
+        )
+
+
+class FakeRetriever:
+    corpus_version = "bench"
+
+    def __init__(self, top_k: int):
+        self.chunks = [
+            RetrievedChunk(id=f"db-si.md#{i}", text=CHUNK_TEXT, score=0.9 - i * 0.01, source="db-si.md")
+            for i in range(top_k)
+        ]
+
+    def retrieve(self, query, top_k=5, query_vector=None):
+        return self.chunks[:top_k]
+
+
+# --- Medición ----------------------------------------------------------------
+
+def _stats(samples_us: List[float], ops: int) -> Dict:
+    ordered = sorted(samples_us)
+    return {
+        "median_us": round(statistics.median(ordered), 3),
+        "p90_us": round(ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))], 3),
+        "min_us": round(ordered[0], 3),
+        "mean_us": round(statistics.fmean(ordered), 3),
+        "rounds": len(ordered),
+        "ops": ops
+    }
+
+
+def bench_function(fn: Callable[[], object], rounds: int, min_round_s: float = 0.02) -> Dict:
+    """Tiempo por operación: se calibra cuántas llamadas caben en una ronda y se repite."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_round_s or number >= 1_000_000:
+            break
+        number *= 2
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return _stats(samples, number * rounds)
+
+
+def _empty_span():
+    with span("benchmark"):
+        pass
+
+
+def run_micro(rounds: int) -> Dict[str, Dict]:
+    cache = RedisCache()
+    router = ModelRouter()
+    model = RAGModel("gpt-3.5-turbo")
+    large_context_ids = [f"db-si.md#{i}-{i:012x}" for i in range(20)]
+    context = [CHUNK_TEXT] * 5
+    response = {
+        "answer": ANSWER,
+        "metrics": {"latency_ms": 812.4, "cost_usd": 0.00063, "tokens": 1020, "input_tokens": 900, "output_tokens": 120},
+        "metadata": {"model": "gpt-3.5-turbo", "prompt_version": "1.0", "run_id": "0" * 32,
+                     "sources": [f"db-si.md#{i}" for i in range(5)]}
+    }
+    encoded = encode_value(response)
+
+    benchmarks = {
+        "cache_key_large_context": lambda: cache._generate_key(QUERY, large_context_ids),
+        "router_route": lambda: router.route(QUERY, context),
+        "prompt_build": lambda: model._build_prompts(QUERY, context),
+        "response_encode": lambda: encode_value(response),
+        "response_decode": lambda: decode_value(encoded),
+        "response_json_dumps": lambda: json.dumps(response),
+        # Coste de instrumentar una etapa cuando la petición no entra en la muestra
+        "span_unsampled": _empty_span
+    }
+    return {name: bench_function(fn, rounds) for name, fn in benchmarks.items()}
+
+
+async def _run_e2e(requests: int, top_k: int, llm_latency_s: float) -> Dict[str, Dict]:
+    from src.sre.api.admission import AdmissionController
+    from src.sre.api.dependencies import Services, get_services
+    from src.sre.api.main import app
+
+    l2 = RedisCache()
+    l2.redis_client = InMemoryRedis()
+    cache = TieredCache(l2, LocalCache())
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=FakeChatCompletions(llm_latency_s)))
+    fake_tracking = SimpleNamespace(submit=lambda run: True)
+
+    services = Services(
+        cache=cache,
+        singleflight=SingleFlight(l2.redis_client),
+        model_router=ModelRouter(),
+        retriever=FakeRetriever(top_k),
+        admission=AdmissionController()
+    )
+    app.dependency_overrides[get_services] = lambda: services
+    try:
+        with patch("src.sre.generation.llm_client.get_async_openai_client", return_value=fake_client), \
+                patch("src.sre.generation.llm_client.get_tracking_queue", return_value=fake_tracking):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                results = {}
+                # Miss: preguntas distintas (router + LLM + escritura en caché); hit: la misma otra vez
+                for name, make_query in (("e2e_query_miss", lambda i: f"{QUERY} #{i}"), ("e2e_query_hit", lambda i: QUERY)):
+                    samples = []
+                    for i in range(requests):
+                        start = time.perf_counter()
+                        response = await client.post("/query", json={"query": make_query(i), "top_k": top_k})
+                        samples.append((time.perf_counter() - start) * 1e6)
+                        if response.status_code != 200:
+                            raise RuntimeError(f"{name}: HTTP {response.status_code} {response.text}")
+                    results[name] = _stats(samples, requests)
+    finally:
+        app.dependency_overrides.pop(get_services, None)
+    return results
+
+
+def run_e2e(requests: int, top_k: int, llm_latency_s: float) -> Dict[str, Dict]:
+    return asyncio.run(_run_e2e(requests, top_k, llm_latency_s))
+
+
+# --- Informe y comparación -----------------------------------------------------
+
+def _environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "commit": commit}
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """Benchmarks cuya mediana empeora más de `threshold` (fracción) respecto a la base."""
+    regressions = []
+    for name, stats in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base or not base["median_us"]:
+            continue
+        change = stats["median_us"] / base["median_us"] - 1
+        if change > threshold:
+            regressions.append({
+                "benchmark": name,
+                "baseline_us": base["median_us"],
+                "current_us": stats["median_us"],
+                "change": round(change, 4)
+            })
+    return regressions
+
+
+def print_report(report: Dict, baseline: Dict = None):
+    print(f"{'benchmark':<28}{'mediana (µs)':>14}{'p90 (µs)':>12}" + (f"{'vs base':>10}" if baseline else ""))
+    for name, stats in report["benchmarks"].items():
+        line = f"{name:<28}{stats['median_us']:>14.2f}{stats['p90_us']:>12.2f}"
+        base = (baseline or {}).get("benchmarks", {}).get(name)
+        if base and base["median_us"]:
+            line += f"{stats['median_us'] / base['median_us'] - 1:>+10.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline /query")
+    parser.add_argument("--only", choices=["micro", "e2e"], default=None, help="Ejecuta solo una parte")
+    parser.add_argument("--rounds", type=int, default=30, help="Rondas por micro-benchmark")
+    parser.add_argument("--requests", type=int, default=300, help="Peticiones por escenario e2e")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0,
+                        help="Latencia simulada de OpenAI (0 = solo el coste propio de la API)")
+    parser.add_argument("--output", default=None, help="Guarda los resultados en JSON")
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Empeoramiento tolerado (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    benchmarks = {}
+    if args.only in (None, "micro"):
+        benchmarks.update(run_micro(args.rounds))
+    if args.only in (None, "e2e"):
+        benchmarks.update(run_e2e(args.requests, args.top_k, args.llm_latency_ms / 1000))
+    report = {"environment": _environment(), "benchmarks": benchmarks}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report, baseline, args.threshold)
+
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if report.get("regressions"):
+        print(f"\n❌ {len(report['regressions'])} regresiones por encima del {args.threshold:.0%}:")
+        for regression in report["regressions"]:
+            print(f"   {regression['benchmark']}: {regression['change']:+.1%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
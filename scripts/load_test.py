@@ -1,6 +1,13 @@
-﻿import requests
-import time
+﻿import argparse
+import asyncio
+import json
+import math
 import random
+import time
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+import httpx
 
 # URLs
 API_URL = "http://localhost:8000/query"
@@ -16,39 +23,200 @@ queries = [
     "Ancho mínimo de pasillos en uso hospitalario"
 ]
 
-print(f"🚀 Iniciando prueba de carga contra {API_URL}...")
-print("Presiona CTRL+C para detener.\n")
+PERCENTILES = (50, 90, 99, 99.9)
+CACHE_SOURCES = ("cache", "semantic_cache")
 
-counter = 0
-try:
-    while True:
-        query = random.choice(queries)
-        
-        try:
-            # Enviamos petición
-            response = requests.post(
-                API_URL, 
-                json={"query": query, "top_k": 3},
-                timeout=10
-            )
-            
-            counter += 1
-            status = response.status_code
-            
-            # Imprimimos resultado
-            if status == 200:
-                data = response.json()
-                cost = data["metrics"]["cost_usd"]
-                latency = data["metrics"]["latency_ms"]
-                print(f"[{counter}] ✅ Status: {status} | Latency: {latency:.0f}ms | Cost: ${cost:.5f}")
-            else:
-                print(f"[{counter}] ❌ Error Status: {status}")
 
+@dataclass
+class Sample:
+    latency_ms: float
+    status: int
+    cached: bool = False
+    error: Optional[str] = None
+
+
+def load_replay(path: str) -> List[dict]:
+    """Lee peticiones de un .jsonl (campos query/question/title y top_k opcional)."""
+    payloads = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get("query") or record.get("question") or record.get("title")
+            if query:
+                payloads.append({"query": query, "top_k": record.get("top_k", 3)})
+    if not payloads:
+        raise SystemExit(f"{path} no contiene consultas")
+    return payloads
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Percentil por rango más cercano (sin interpolar: no inventa latencias)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples: List[Sample], elapsed_s: float, config: dict) -> dict:
+    latencies = sorted(s.latency_ms for s in samples)
+    ok = [s for s in samples if s.error is None]
+    errors = len(samples) - len(ok)
+    return {
+        "config": config,
+        "requests": len(samples),
+        "duration_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(ok) / elapsed_s, 3) if elapsed_s else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "cache_hit_ratio": round(sum(s.cached for s in ok) / len(ok), 4) if ok else 0.0,
+        "latency_ms": {
+            **{f"p{p:g}": round(percentile(latencies, p), 2) for p in PERCENTILES},
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "max": round(latencies[-1], 2) if latencies else 0.0
+        },
+        "status_codes": {str(code): sum(s.status == code for s in samples) for code in sorted({s.status for s in samples})}
+    }
+
+
+class LoadGenerator:
+    """
+    Generador de carga asyncio.
+
+    - closed: N usuarios que lanzan la siguiente petición al recibir la respuesta.
+    - open: llegadas a ritmo fijo (o Poisson) independientes de las respuestas; la
+      latencia se mide desde el instante programado, no desde el envío, para no
+      esconder las colas (coordinated omission).
+    """
+
+    def __init__(self, url: str, payloads: List[dict], timeout: float, shuffle: bool):
+        self.url = url
+        self.payloads = payloads
+        self.timeout = timeout
+        self.shuffle = shuffle
+        self.samples: List[Sample] = []
+        self._next = 0
+
+    def _next_payload(self) -> dict:
+        if self.shuffle:
+            return random.choice(self.payloads)
+        payload = self.payloads[self._next % len(self.payloads)]
+        self._next += 1
+        return payload
+
+    async def _send(self, client: httpx.AsyncClient, payload: dict, intended_start: float):
+        try:
+            response = await client.post(self.url, json=payload)
+            latency_ms = (time.perf_counter() - intended_start) * 1000
+            if response.status_code != 200:
+                self.samples.append(Sample(latency_ms, response.status_code, error=f"HTTP {response.status_code}"))
+                return
+            source = response.json().get("metadata", {}).get("source")
+            self.samples.append(Sample(latency_ms, 200, cached=source in CACHE_SOURCES))
         except Exception as e:
-            print(f"[{counter}] 💥 Error de conexión: {e}")
+            latency_ms = (time.perf_counter() - intended_start) * 1000
+            self.samples.append(Sample(latency_ms, 0, error=type(e).__name__))
+
+    def _client(self, connections: int) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        return httpx.AsyncClient(timeout=self.timeout, limits=limits)
+
+    async def run_closed(self, users: int, duration: float, max_requests: Optional[int]):
+        deadline = time.perf_counter() + duration
+        issued = 0
+
+        async def user(client):
+            nonlocal issued
+            while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+                issued += 1
+                await self._send(client, self._next_payload(), time.perf_counter())
+
+        async with self._client(users) as client:
+            await asyncio.gather(*(user(client) for _ in range(users)))
+
+    async def run_open(self, rate: float, duration: float, max_requests: Optional[int],
+                       max_in_flight: int, poisson: bool):
+        total = int(rate * duration)
+        if max_requests is not None:
+            total = min(total, max_requests)
+        # Limita conexiones, no llegadas: si el servidor se satura, la espera cuenta como latencia
+        slots = asyncio.Semaphore(max_in_flight)
+
+        async def fire(client, payload, intended_start):
+            async with slots:
+                await self._send(client, payload, intended_start)
+
+        async with self._client(max_in_flight) as client:
+            tasks = []
+            start = time.perf_counter()
+            offset = 0.0
+            for i in range(total):
+                offset = offset + random.expovariate(rate) if poisson else i / rate
+                intended_start = start + offset
+                delay = intended_start - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(fire(client, self._next_payload(), intended_start)))
+            await asyncio.gather(*tasks)
+
+
+def print_report(report: dict):
+    latency = report["latency_ms"]
+    print(f"\n📊 {report['requests']} peticiones en {report['duration_s']:.1f}s")
+    print(f"   Throughput: {report['throughput_rps']:.2f} req/s | Errores: {report['error_rate']:.2%} "
+          f"| Cache hits: {report['cache_hit_ratio']:.2%}")
+    print("   Latencia (ms): " + " | ".join(
+        f"{name}={value:.0f}" for name, value in latency.items()
+    ))
+    print(f"   Status: {report['status_codes']}")
+
+
+async def main_async(args) -> dict:
+    payloads = load_replay(args.replay) if args.replay else [{"query": q, "top_k": args.top_k} for q in queries]
+    generator = LoadGenerator(args.url, payloads, args.timeout, shuffle=not args.replay or args.shuffle)
+
+    print(f"🚀 Prueba de carga ({args.mode}) contra {args.url} durante {args.duration:.0f}s...")
+    start = time.perf_counter()
+    if args.mode == "closed":
+        await generator.run_closed(args.users, args.duration, args.max_requests)
+    else:
+        await generator.run_open(args.rate, args.duration, args.max_requests, args.max_in_flight, args.poisson)
+    elapsed = time.perf_counter() - start
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    return summarize(generator.samples, elapsed, config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API RAG")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed",
+                        help="closed: N usuarios concurrentes; open: ritmo de llegadas fijo")
+    parser.add_argument("--users", type=int, default=10, help="Usuarios concurrentes (closed)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Peticiones por segundo (open)")
+    parser.add_argument("--poisson", action="store_true", help="Llegadas de Poisson en lugar de equiespaciadas (open)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Conexiones simultáneas máximas (open)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duración en segundos")
+    parser.add_argument("--max-requests", type=int, default=None, help="Corta tras N peticiones")
+    parser.add_argument("--replay", default=None, help="Fichero .jsonl con las consultas a reproducir")
+    parser.add_argument("--shuffle", action="store_true", help="Orden aleatorio al reproducir")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", default=None, help="Guarda el informe en JSON")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("\n🛑 Prueba detenida por el usuario.")
+        return
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Informe guardado en {args.output}")
 
-        # Esperamos un poco (2 peticiones por segundo aprox)
-        time.sleep(0.5)
 
-except KeyboardInterrupt:
-    print("\n🛑 Prueba detenida por el usuario.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Servidor local compatible con la API de OpenAI (chat completions y embeddings).
+
+Simula por modelo la latencia (lognormal hasta el primer token), la velocidad de
+generación en streaming, el `usage`, los errores 429/5xx y los límites de peticiones
+y tokens por minuto, para medir la API, el router y la caché sin gastar dinero.
+
+Uso:
+    python scripts/openai_stub.py --port 8100 [--config perfiles.json] [--time-scale 0.5]
+    OPENAI_BASE_URL=http://localhost:8100/v1 uvicorn src.sre.api.main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, asdict, fields
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class ModelProfile:
+    """Comportamiento simulado de un modelo."""
+    first_token_ms: float = 350.0       # mediana de la latencia hasta el primer token
+    first_token_sigma: float = 0.4      # dispersión lognormal (cola larga)
+    tokens_per_second: float = 90.0
+    output_tokens_mean: float = 180.0
+    output_tokens_sd: float = 60.0
+    error_rate_429: float = 0.0
+    error_rate_5xx: float = 0.0
+    requests_per_minute: int = 3500
+    tokens_per_minute: int = 90000
+
+
+DEFAULT_PROFILES: Dict[str, ModelProfile] = {
+    "gpt-3.5-turbo": ModelProfile(),
+    "gpt-4": ModelProfile(
+        first_token_ms=900.0, first_token_sigma=0.5, tokens_per_second=25.0,
+        output_tokens_mean=250.0, output_tokens_sd=80.0,
+        requests_per_minute=500, tokens_per_minute=40000
+    ),
+    "text-embedding-3-small": ModelProfile(
+        first_token_ms=60.0, first_token_sigma=0.3, requests_per_minute=5000, tokens_per_minute=1000000
+    )
+}
+
+# Texto con el que se "genera" la respuesta, token a token
+_WORDS = (
+    "Según el Código Técnico de la Edificación y en particular el documento básico "
+    "de seguridad en caso de incendio los extintores portátiles deben situarse de "
+    "forma que el extremo superior quede a una altura máxima de 1,20 m sobre el suelo "
+    "y ser fácilmente visibles y accesibles desde cualquier origen de evacuación"
+).split()
+
+
+def count_tokens(text: str) -> int:
+    """Aproximación habitual: ~4 caracteres por token."""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _error(status: int, message: str, error_type: str, headers: Dict[str, str] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": None}},
+        headers=headers
+    )
+
+
+class RateLimiter:
+    """Ventana deslizante de 60 s de peticiones y tokens, por modelo."""
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self):
+        self._events: Dict[str, Deque[Tuple[float, int]]] = {}
+
+    def _window(self, model: str) -> Deque[Tuple[float, int]]:
+        events = self._events.setdefault(model, deque())
+        cutoff = time.monotonic() - self.WINDOW_SECONDS
+        while events and events[0][0] < cutoff:
+            events.popleft()
+        return events
+
+    def remaining(self, model: str, profile: ModelProfile) -> Tuple[int, int]:
+        events = self._window(model)
+        return (
+            max(0, profile.requests_per_minute - len(events)),
+            max(0, profile.tokens_per_minute - sum(tokens for _, tokens in events))
+        )
+
+    def acquire(self, model: str, profile: ModelProfile, tokens: int) -> Optional[float]:
+        """Registra la petición o devuelve los segundos a esperar (Retry-After)."""
+        events = self._window(model)
+        requests_left, tokens_left = self.remaining(model, profile)
+        if requests_left <= 0 or tokens_left < tokens:
+            return max(0.1, events[0][0] + self.WINDOW_SECONDS - time.monotonic()) if events else 1.0
+        events.append((time.monotonic(), tokens))
+        return None
+
+    def headers(self, model: str, profile: ModelProfile) -> Dict[str, str]:
+        requests_left, tokens_left = self.remaining(model, profile)
+        return {
+            "x-ratelimit-limit-requests": str(profile.requests_per_minute),
+            "x-ratelimit-limit-tokens": str(profile.tokens_per_minute),
+            "x-ratelimit-remaining-requests": str(requests_left),
+            "x-ratelimit-remaining-tokens": str(tokens_left)
+        }
+
+
+class OpenAIStub:
+    def __init__(self, profiles: Dict[str, ModelProfile] = None, time_scale: float = 1.0,
+                 seed: int = None, embedding_dim: int = 1536):
+        self.profiles = dict(profiles or DEFAULT_PROFILES)
+        self.time_scale = time_scale
+        self.embedding_dim = embedding_dim
+        self.rng = random.Random(seed)
+        self.limiter = RateLimiter()
+        self.app = self._build_app()
+
+    def profile(self, model: str) -> ModelProfile:
+        # Modelos desconocidos (gpt-4-turbo, gpt-4o...) heredan el perfil de su familia
+        for name in sorted(self.profiles, key=len, reverse=True):
+            if model.startswith(name):
+                return self.profiles[name]
+        return self.profiles["gpt-3.5-turbo"]
+
+    def _first_token_delay(self, profile: ModelProfile) -> float:
+        return self.rng.lognormvariate(math.log(profile.first_token_ms / 1000), profile.first_token_sigma) * self.time_scale
+
+    def _output_tokens(self, profile: ModelProfile, max_tokens: Optional[int]) -> int:
+        tokens = max(1, int(self.rng.gauss(profile.output_tokens_mean, profile.output_tokens_sd)))
+        return min(tokens, max_tokens) if max_tokens else tokens
+
+    def _admit(self, model: str, profile: ModelProfile, tokens: int) -> Optional[JSONResponse]:
+        """Límites de uso y errores inyectados; None si la petición sigue adelante."""
+        retry_after = self.limiter.acquire(model, profile, tokens)
+        if retry_after is not None:
+            headers = {**self.limiter.headers(model, profile), "retry-after": f"{retry_after:.2f}"}
+            return _error(429, f"Rate limit reached for {model}", "rate_limit_exceeded", headers)
+        roll = self.rng.random()
+        if roll < profile.error_rate_429:
+            return _error(429, "The server had an error while processing your request (injected)",
+                          "rate_limit_exceeded", {"retry-after": "1"})
+        if roll < profile.error_rate_429 + profile.error_rate_5xx:
+            status = self.rng.choice([500, 502, 503])
+            return _error(status, "The server had an error while processing your request (injected)", "server_error")
+        return None
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="OpenAI stub")
+
+        @app.get("/v1/models")
+        async def models():
+            return {"object": "list", "data": [{"id": name, "object": "model", "owned_by": "stub"} for name in self.profiles]}
+
+        @app.get("/stub/config")
+        async def get_config():
+            return {"time_scale": self.time_scale, "profiles": {name: asdict(p) for name, p in self.profiles.items()}}
+
+        @app.post("/stub/config")
+        async def update_config(request: Request):
+            """Cambia perfiles en caliente (p. ej. subir error_rate_5xx durante una prueba)."""
+            body = await request.json()
+            if "time_scale" in body:
+                self.time_scale = float(body["time_scale"])
+            for name, values in body.get("profiles", {}).items():
+                current = asdict(self.profiles.get(name, ModelProfile()))
+                current.update({k: v for k, v in values.items() if k in current})
+                self.profiles[name] = ModelProfile(**current)
+            return await get_config()
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            model = body.get("model", "gpt-3.5-turbo")
+            profile = self.profile(model)
+            prompt_tokens = sum(count_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+            completion_tokens = self._output_tokens(profile, body.get("max_tokens"))
+
+            rejection = self._admit(model, profile, prompt_tokens + completion_tokens)
+            if rejection is not None:
+                return rejection
+
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            created = int(time.time())
+            first_token_delay = self._first_token_delay(profile)
+            token_delay = self.time_scale / profile.tokens_per_second
+            tokens = [(" " if i else "") + _WORDS[i % len(_WORDS)] for i in range(completion_tokens)]
+            headers = self.limiter.headers(model, profile)
+
+            if not body.get("stream"):
+                await asyncio.sleep(first_token_delay + token_delay * completion_tokens)
+                return JSONResponse(headers=headers, content={
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "length" if completion_tokens == body.get("max_tokens") else "stop"
+                    }],
+                    "usage": usage
+                })
+
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+            def chunk(delta: dict, finish_reason: str = None, chunk_usage: dict = None) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                    "usage": chunk_usage
+                }
+                return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+            async def events():
+                await asyncio.sleep(first_token_delay)
+                yield chunk({"role": "assistant", "content": ""})
+                for token in tokens:
+                    yield chunk({"content": token})
+                    await asyncio.sleep(token_delay)
+                yield chunk({}, finish_reason="stop")
+                if include_usage:
+                    yield chunk(None, chunk_usage=usage)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+        @app.post("/v1/embeddings")
+        async def embeddings(request: Request):
+            body = await request.json()
+            model = body.get("model", "text-embedding-3-small")
+            profile = self.profile(model)
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            prompt_tokens = sum(count_tokens(str(text)) for text in inputs)
+
+            rejection = self._admit(model, profile, prompt_tokens)
+            if rejection is not None:
+                return rejection
+            await asyncio.sleep(self._first_token_delay(profile))
+
+            data = []
+            for i, text in enumerate(inputs):
+                # Determinista: el mismo texto da siempre el mismo vector
+                seed = int(hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:8], 16)
+                vector = np.random.default_rng(seed).normal(size=self.embedding_dim)
+                vector /= np.linalg.norm(vector)
+                data.append({"object": "embedding", "index": i, "embedding": vector.round(6).tolist()})
+            return JSONResponse(headers=self.limiter.headers(model, profile), content={
+                "object": "list",
+                "data": data,
+                "model": model,
+                "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+            })
+
+        return app
+
+
+def load_profiles(path: str) -> Dict[str, ModelProfile]:
+    """Perfiles desde JSON ({modelo: {campo: valor}}) sobre los valores por defecto."""
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    known = {f.name for f in fields(ModelProfile)}
+    profiles = dict(DEFAULT_PROFILES)
+    for name, values in overrides.items():
+        base = asdict(profiles.get(name, ModelProfile()))
+        base.update({k: v for k, v in values.items() if k in known})
+        profiles[name] = ModelProfile(**base)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local de la API de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--config", default=None, help="JSON con perfiles por modelo")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplica todas las latencias (0 = instantáneo)")
+    parser.add_argument("--error-rate-429", type=float, default=None, help="Fuerza la tasa de 429 en todos los modelos")
+    parser.add_argument("--error-rate-5xx", type=float, default=None, help="Fuerza la tasa de 5xx en todos los modelos")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    import uvicorn
+
+    profiles = load_profiles(args.config) if args.config else dict(DEFAULT_PROFILES)
+    for name, profile in profiles.items():
+        overrides = {}
+        if args.error_rate_429 is not None:
+            overrides["error_rate_429"] = args.error_rate_429
+        if args.error_rate_5xx is not None:
+            overrides["error_rate_5xx"] = args.error_rate_5xx
+        profiles[name] = ModelProfile(**{**asdict(profile), **overrides})
+
+    stub = OpenAIStub(profiles, time_scale=args.time_scale, seed=args.seed)
+    print(f"🤖 Stub de OpenAI en http://{args.host}:{args.port}/v1 (time_scale={args.time_scale})")
+    uvicorn.run(stub.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Calienta la caché de respuestas con las preguntas más frecuentes del tráfico pasado.
+
+Lee ficheros .jsonl de peticiones (campos query/question y top_k opcional) o de logs
+estructurados de la API (eventos request_received), y genera las respuestas que
+falten por el camino normal, sin pasar del presupuesto en dólares.
+
+Uso:
+    python scripts/warm_cache.py logs/api.jsonl --top-n 200 --budget-usd 2
+    python scripts/warm_cache.py requests.jsonl --dry-run
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dataclasses import asdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.sre.config.settings import get_settings
+from src.sre.utils.cache import get_cache
+from src.sre.utils.cache_warming import CacheWarmer, mine_queries
+
+settings = get_settings()
+
+
+async def main_async(args) -> dict:
+    queries = mine_queries(args.sources, args.top_n)
+    print(f"🔎 {len(queries)} preguntas distintas entre las más frecuentes")
+    if args.dry_run:
+        for item in queries:
+            print(f"  {item.count:>6}  (top_k={item.top_k})  {item.query}")
+        return {}
+
+    cache = get_cache()
+    try:
+        warmer = CacheWarmer(
+            cache,
+            budget_usd=args.budget_usd,
+            concurrency=args.concurrency,
+            rate_per_second=args.rate
+        )
+        report = await warmer.warm(queries)
+    finally:
+        await cache.close()
+    return asdict(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calentamiento de la caché de respuestas")
+    parser.add_argument("sources", nargs="+", help="Ficheros .jsonl de peticiones o logs")
+    parser.add_argument("--top-n", type=int, default=settings.cache_warmup_top_n)
+    parser.add_argument("--budget-usd", type=float, default=settings.cache_warmup_budget_usd,
+                        help="Gasto máximo en el LLM")
+    parser.add_argument("--concurrency", type=int, default=settings.cache_warmup_concurrency)
+    parser.add_argument("--rate", type=float, default=settings.cache_warmup_rate_per_second,
+                        help="Llamadas al LLM por segundo (0 = sin límite)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Expone las métricas de progreso en este puerto mientras dura")
+    parser.add_argument("--dry-run", action="store_true", help="Solo muestra las preguntas elegidas")
+    parser.add_argument("--output", default=None, help="Guarda el informe en JSON")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        from prometheus_client import start_http_server
+        start_http_server(args.metrics_port)
+
+    report = asyncio.run(main_async(args))
+    if not report:
+        return
+    print(
+        f"✅ {report['warmed']} calentadas, {report['cached']} ya en caché, "
+        f"{report['skipped_budget']} fuera de presupuesto, {report['failed']} con error "
+        f"— ${report['spent_usd']:.4f} en {report['elapsed_s']:.1f}s"
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Informe guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
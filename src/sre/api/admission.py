@@ -0,0 +1,237 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED
+
+settings = get_settings()
+logger = get_logger("src.api.admission")
+
+
+class AdmissionRejected(Exception):
+    """
+    Petición rechazada antes de llegar al LLM: 429 (cliente), 503 (servidor saturado)
+    o 413 (lote que no cabe nunca en el límite del cliente; sin Retry-After).
+    """
+
+    def __init__(self, status_code: int, reason: str, retry_after: Optional[float], detail: str = None):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+        self.detail = detail or reason
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        if self.retry_after is None:
+            return {}
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def _parse_limits(raw: str) -> Dict[str, int]:
+    """"gpt-4=16,gpt-3.5-turbo=48" -> {"gpt-4": 16, "gpt-3.5-turbo": 48}"""
+    limits = {}
+    for item in raw.split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            limits[model.strip()] = int(value)
+    return limits
+
+
+class ConcurrencyLimiter:
+    """
+    Semáforo con cola FIFO acotada. Estima la espera con la duración media (EWMA)
+    de cada hueco ocupado, para rechazar al llegar en vez de tras esperar en vano.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, alpha: float = 0.2):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self.active = 0
+        self.service_seconds: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        if self.active < self.limit and not self._waiters:
+            return 0.0
+        service = self.service_seconds or settings.admission_default_service_seconds
+        return (len(self._waiters) + 1) * service / self.limit
+
+    def _shed(self, reason: str, retry_after: float):
+        ADMISSION_SHED.labels(limiter=self.name, reason=reason).inc()
+        raise AdmissionRejected(503, f"{self.name}_{reason}", retry_after)
+
+    def _update_gauges(self):
+        ADMISSION_QUEUE_DEPTH.labels(limiter=self.name).set(len(self._waiters))
+        ADMISSION_IN_FLIGHT.labels(limiter=self.name).set(self.active)
+
+    async def acquire(self, max_wait: float):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._shed("queue_full", self.expected_wait())
+        expected = self.expected_wait()
+        if expected > max_wait:
+            self._shed("wait_exceeds_budget", expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter, max_wait)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self._shed("wait_timeout", self.expected_wait())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # El hueco llegó a la vez que la cancelación: se pasa al siguiente
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._update_gauges()
+
+    def release(self, service_seconds: Optional[float] = None):
+        if service_seconds is not None:
+            self.service_seconds = service_seconds if self.service_seconds is None else (
+                self.alpha * service_seconds + (1 - self.alpha) * self.service_seconds
+            )
+        # El hueco pasa directamente al primero de la cola (FIFO, sin carreras)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+
+class ClientRateLimiter:
+    """Token bucket por cliente (llamadas al LLM); los clientes menos recientes se olvidan."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, client_id: str, cost: int = 1) -> float:
+        """0 si se admite; si no, segundos hasta que haya tokens suficientes."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(client_id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / self.rate
+        self._buckets[client_id] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class AdmissionController:
+    """
+    Control de admisión de las llamadas al LLM: límite por cliente, por modelo y
+    global. Las respuestas de caché no pasan por aquí.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        model_limits: Dict[str, int] = None,
+        max_queue: int = None,
+        client_rate: float = None,
+        client_burst: int = None
+    ):
+        max_queue = max_queue or settings.admission_max_queue
+        self.global_limiter = ConcurrencyLimiter(
+            "global", max_concurrency or settings.admission_max_concurrency, max_queue
+        )
+        limits = _parse_limits(settings.admission_model_limits) if model_limits is None else model_limits
+        self.model_limiters = {
+            model: ConcurrencyLimiter(model, limit, max_queue) for model, limit in limits.items()
+        }
+        self.clients = ClientRateLimiter(
+            settings.admission_client_rate if client_rate is None else client_rate,
+            client_burst or settings.admission_client_burst
+        )
+
+    def check_client(self, client_id: str, cost: int = 1):
+        """Cobra `cost` llamadas al cliente; un lote que no cabe ni con el bucket lleno no se admite."""
+        if self.clients.rate > 0 and cost > self.clients.burst:
+            # Reintentar no sirve: hay que partir el lote
+            ADMISSION_SHED.labels(limiter="client", reason="cost_exceeds_burst").inc()
+            raise AdmissionRejected(
+                413, "client_cost_exceeds_burst", None,
+                detail=f"Máximo {self.clients.burst} preguntas nuevas (sin caché) por lote"
+            )
+        retry_after = self.clients.acquire(client_id, cost)
+        if retry_after > 0:
+            ADMISSION_SHED.labels(limiter="client", reason="rate_limited").inc()
+            raise AdmissionRejected(429, "client_rate_limited", retry_after)
+
+    def max_wait(self, model: str, latency_budget_ms: Optional[float]) -> float:
+        """Espera admisible en cola: lo que deja el presupuesto tras la duración típica de la llamada."""
+        if latency_budget_ms is None:
+            latency_budget_ms = settings.routing_latency_budget_ms or None
+        if not latency_budget_ms:
+            return settings.admission_max_wait_seconds
+        limiter = self.model_limiters.get(model, self.global_limiter)
+        service = limiter.service_seconds or 0.0
+        return max(0.0, latency_budget_ms / 1000 - service)
+
+    @asynccontextmanager
+    async def slot(self, model: str, latency_budget_ms: Optional[float] = None):
+        """Hueco de modelo y global; el del modelo primero, para no retener el global esperando."""
+        deadline = time.monotonic() + self.max_wait(model, latency_budget_ms)
+        acquired = []
+        try:
+            for limiter in (self.model_limiters.get(model), self.global_limiter):
+                if limiter is None:
+                    continue
+                await limiter.acquire(max(0.0, deadline - time.monotonic()))
+                acquired.append(limiter)
+        except BaseException:
+            for limiter in acquired:
+                limiter.release()
+            raise
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            for limiter in acquired:
+                limiter.release(elapsed)
+
+
+# Singleton
+_admission_instance = None
+def get_admission_controller() -> AdmissionController:
+    global _admission_instance
+    if _admission_instance is None:
+        _admission_instance = AdmissionController()
+    return _admission_instance
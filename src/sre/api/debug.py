@@ -0,0 +1,58 @@
+import asyncio
+import hmac
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Optional
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.profiler import SamplingProfiler
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+settings = get_settings()
+logger = get_logger("src.api.debug")
+
+# Un solo perfil a la vez por worker
+_profile_lock = asyncio.Lock()
+
+
+def _check_token(token: Optional[str]):
+    # Sin token configurado el endpoint no es accesible, aunque esté montado
+    expected = settings.debug_profile_token
+    if not expected or not token or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(default=5.0, gt=0),
+    hz: Optional[int] = Query(default=None, ge=1, le=1000),
+    format: str = Query(default="collapsed", pattern="^(collapsed|json)$"),
+    lag_threshold_ms: float = Query(default=20.0, gt=0),
+    x_debug_token: Optional[str] = Header(default=None)
+):
+    """
+    Perfil por muestreo de todos los hilos del worker durante `seconds` segundos.
+
+    collapsed: texto para flamegraph.pl / speedscope; json: además, retraso del
+    event loop y las pilas que lo bloquearon.
+    """
+    _check_token(x_debug_token)
+    if seconds > settings.debug_profile_max_seconds:
+        raise HTTPException(status_code=422, detail=f"Máximo {settings.debug_profile_max_seconds} s")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Ya hay un perfil en curso en este worker")
+
+    async with _profile_lock:
+        profiler = SamplingProfiler(hz=hz or settings.debug_profile_hz, lag_threshold_ms=lag_threshold_ms)
+        result = await profiler.profile(seconds)
+    logger.info("debug_profile_taken", seconds=seconds, samples=result.samples, loop_lag=result.loop_lag)
+
+    if format == "json":
+        return JSONResponse(result.to_dict())
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={
+            "X-Loop-Lag-P99-Ms": str(result.loop_lag["p99_ms"]),
+            "X-Loop-Lag-Max-Ms": str(result.loop_lag["max_ms"])
+        }
+    )
@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from fastapi import Request
+from src.sre.api.admission import AdmissionController, get_admission_controller
+from src.sre.generation.model_router import ModelRouter, get_model_router
+from src.sre.retrieval.retriever import Retriever, get_retriever
+from src.sre.utils.cache import RedisCache, get_cache
+from src.sre.utils.singleflight import SingleFlight, get_singleflight
+
+
+@dataclass
+class Services:
+    """Clientes que usan los endpoints: se construyen en el lifespan, no al importar."""
+    cache: RedisCache
+    singleflight: SingleFlight
+    model_router: ModelRouter
+    retriever: Retriever
+    admission: AdmissionController
+
+
+def build_services() -> Services:
+    # Los mismos singletons que usan el calentamiento, el warming de caché y el cierre
+    return Services(
+        cache=get_cache(),
+        singleflight=get_singleflight(),
+        model_router=get_model_router(),
+        retriever=get_retriever(),
+        admission=get_admission_controller()
+    )
+
+
+def get_services(request: Request) -> Services:
+    """Dependencia de los endpoints (en los tests: app.dependency_overrides[get_services])."""
+    return request.app.state.services
@@ -1,9 +1,70 @@
-﻿from fastapi import FastAPI
+﻿import asyncio
+import redis
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
 from prometheus_client import make_asgi_app
 from src.sre.monitoring.metrics import init_metrics
 from src.sre.api.routes import router
+from src.sre.api.dependencies import build_services
+from src.sre.generation.llm_client import close_async_clients
+from src.sre.monitoring.tracking import get_tracking_queue
+from src.sre.monitoring.tracing import get_trace_exporter
+from src.sre.monitoring.logger import get_logger
+from src.sre.api.startup import get_startup_report, run_startup_warmup
+from src.sre.utils.cache import get_cache
+from src.sre.utils.cache_warming import warm_cache_on_startup
+from src.sre.config.settings import get_settings
 
-app = FastAPI(title="RAG MLOps API", version="1.0.0")
+settings = get_settings()
+logger = get_logger("src.api.main")
+
+_background_tasks = set()
+
+def _spawn(coro):
+    """Tarea en segundo plano: el worker atiende peticiones mientras tanto."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _retire_old_prompt_versions():
+    # Prompt nuevo: las respuestas de la versión anterior ya no se leen, se liberan
+    try:
+        await get_cache().retire_old_prompt_versions()
+    except redis.RedisError as e:
+        logger.warning("prompt_version_retire_failed", error=str(e))
+
+async def _warm_up():
+    # Clientes y conexiones listos antes de recibir tráfico (/ready); después, la caché
+    report = get_startup_report()
+    if settings.startup_warmup_enabled:
+        await run_startup_warmup(report)
+    else:
+        report.ready = True
+    if settings.cache_warmup_on_startup:
+        await warm_cache_on_startup()
+
+async def _shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    # Cierra los pools de conexiones HTTP hacia OpenAI
+    await close_async_clients()
+    # Cierra el pool de conexiones de Redis
+    await get_cache().close()
+    # Envía a MLflow los runs que queden en cola
+    await asyncio.to_thread(get_tracking_queue().shutdown)
+    # Escribe las trazas pendientes
+    await asyncio.to_thread(get_trace_exporter().shutdown)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Caché, router, retriever y admisión se crean al arrancar, no al importar las rutas
+    app.state.services = build_services()
+    _spawn(_retire_old_prompt_versions())
+    _spawn(_warm_up())
+    yield
+    await _shutdown()
+
+app = FastAPI(title="RAG MLOps API", version="1.0.0", lifespan=lifespan)
 
 # Inicializar métricas
 init_metrics()
@@ -15,6 +76,11 @@ app.mount("/metrics", metrics_app)
 # Rutas de la app
 app.include_router(router)
 
+# Profiler bajo demanda (opt-in, protegido con token)
+if settings.debug_profile_enabled:
+    from src.sre.api.debug import router as debug_router
+    app.include_router(debug_router)
+
 @app.get("/")
 async def root():
     return {"message": "RAG MLOps API is running "}
@@ -1,93 +1,446 @@
-﻿from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
+﻿import asyncio
+import json
+import time
+import numpy as np
+from contextlib import nullcontext
+from functools import partial
+from dataclasses import dataclass, field
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
 from prometheus_client import Counter
 
-from src.sre.generation.llm_client import RAGModel # Importamos la clase directamente para instanciar según toque
-from src.sre.monitoring.metrics import track_request_metrics, track_llm_metrics
+from src.sre.generation.llm_client import get_rag_model
+from src.sre.generation.resilience import LLMUnavailable
+from src.sre.config.settings import get_settings
+from src.sre.api.admission import AdmissionRejected
+from src.sre.api.dependencies import Services, get_services
+from src.sre.api.startup import get_startup_report
+from src.sre.monitoring.metrics import (
+    track_request_metrics, track_stream_metrics, track_llm_metrics,
+    CACHE_HITS, CACHE_MISSES, LLM_DEGRADED, TIME_TO_FIRST_TOKEN
+)
 from src.sre.monitoring.logger import get_logger
-from src.sre.utils.cache import get_cache
-from src.sre.generation.model_router import get_model_router # <--- NUEVO IMPORT
+from src.sre.monitoring.tracing import span, traced
+from src.sre.utils.text import normalize_query
+from src.sre.retrieval.vector_index import RetrievedChunk
 
 router = APIRouter()
+settings = get_settings()
 logger = get_logger("src.api.routes")
-cache = get_cache()
-model_router = get_model_router() # <--- Instanciamos el router
 
 # Métricas
-CACHE_HITS = Counter('rag_cache_hits_total', 'Number of cache hits')
-CACHE_MISSES = Counter('rag_cache_misses_total', 'Number of cache misses')
-MODEL_ROUTING = Counter('model_routing_total', 'Model routing decisions', ['model']) # <--- NUEVA MÉTRICA
+MODEL_ROUTING = Counter('model_routing_total', 'Model routing decisions', ['model', 'reason']) # <--- NUEVA MÉTRICA
 
 class QueryRequest(BaseModel):
     query: str
-    top_k: int = 5
+    top_k: int = Field(default=5, ge=1, le=50)
+    # Presupuesto de latencia (SLO) de esta petición; si no llega, el de la configuración
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)
 
 class QueryResponse(BaseModel):
     answer: str
     metrics: Dict[str, Any]
     metadata: Dict[str, Any]
 
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest] = Field(..., min_length=1)
+
+class BatchQueryItem(BaseModel):
+    response: Optional[QueryResponse] = None
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryItem]
+    metadata: Dict[str, Any]
+
+@dataclass
+class PreparedQuery:
+    """Estado de una petición tras caché y recuperación (compartido por los endpoints)."""
+    query_vector: Optional[np.ndarray] = None
+    retrieved: List[RetrievedChunk] = field(default_factory=list)
+    cached: Optional[dict] = None
+
+    @property
+    def context_chunks(self) -> List[str]:
+        return [chunk.text for chunk in self.retrieved]
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        return [chunk.id for chunk in self.retrieved]
+
+    @property
+    def documents(self) -> List[str]:
+        return [chunk.source for chunk in self.retrieved]
+
+def _mark_cached(cached_response: dict, source: str = "cache") -> dict:
+    CACHE_HITS.inc()
+    logger.info("cache_hit", source=source)
+    cached_response["metadata"]["source"] = source
+    return cached_response
+
+async def _prepare_query(services: Services, request: QueryRequest) -> PreparedQuery:
+    prepared = PreparedQuery()
+    cache, retriever = services.cache, services.retriever
+
+    # 0. CACHÉ SEMÁNTICA (el embedding de la pregunta se reutiliza en la recuperación)
+    if settings.semantic_cache_enabled:
+        with span("embed_query"):
+            prepared.query_vector = await run_in_threadpool(retriever.embed_query, request.query)
+        cached_response = await cache.lookup(prepared.query_vector, retriever.corpus_version)
+        if cached_response:
+            prepared.cached = _mark_cached(cached_response, source="semantic_cache")
+            return prepared
+
+    # 1. RECUPERACIÓN (búsqueda en el índice mapeado, fuera del event loop)
+    with span("retrieval", top_k=request.top_k) as s:
+        prepared.retrieved = await run_in_threadpool(
+            retriever.retrieve, request.query, request.top_k, prepared.query_vector
+        )
+        s.set("chunks", len(prepared.retrieved))
+
+    # 2. CACHÉ EXACTA
+    cached_response = await cache.get(request.query, prepared.chunk_ids)
+    if cached_response:
+        prepared.cached = _mark_cached(cached_response)
+        return prepared
+
+    CACHE_MISSES.inc()
+    return prepared
+
+async def _prepare_batch(services: Services, requests: List[QueryRequest]) -> List[PreparedQuery]:
+    """_prepare_query para un lote: un embedding, una búsqueda y un multi-get de caché."""
+    cache, retriever = services.cache, services.retriever
+    prepared = [PreparedQuery() for _ in requests]
+    queries = [request.query for request in requests]
+
+    if settings.semantic_cache_enabled:
+        with span("embed_query", batch=len(queries)):
+            vectors = await run_in_threadpool(retriever.embed_queries, queries)
+        for request, prep, vector in zip(requests, prepared, vectors):
+            prep.query_vector = vector
+            cached_response = await cache.lookup(vector, retriever.corpus_version)
+            if cached_response:
+                prep.cached = _mark_cached(cached_response, source="semantic_cache")
+
+    pending = [i for i, prep in enumerate(prepared) if not prep.cached]
+    if not pending:
+        return prepared
+
+    vectors = np.stack([prepared[i].query_vector for i in pending]) if settings.semantic_cache_enabled else None
+    with span("retrieval", batch=len(pending)):
+        retrieved = await run_in_threadpool(
+            retriever.retrieve_batch,
+            [queries[i] for i in pending],
+            max(requests[i].top_k for i in pending),
+            vectors
+        )
+    for i, chunks in zip(pending, retrieved):
+        prepared[i].retrieved = chunks[:requests[i].top_k]
+
+    cached_responses = await cache.get_many([(queries[i], prepared[i].chunk_ids) for i in pending])
+    for i, cached_response in zip(pending, cached_responses):
+        if cached_response:
+            prepared[i].cached = _mark_cached(cached_response)
+        else:
+            CACHE_MISSES.inc()
+    return prepared
+
+def _select_model(services: Services, request: QueryRequest, prepared: PreparedQuery) -> str:
+    # 3. MODEL ROUTING (AQUÍ ESTÁ LA MAGIA) 🧙‍♂️
+    with span("routing") as s:
+        decision = services.model_router.decide(request.query, prepared.context_chunks, request.latency_budget_ms)
+        s.set("model", decision.model)
+        s.set("reason", decision.reason)
+    
+    # Registramos la decisión (y su motivo) en Prometheus
+    MODEL_ROUTING.labels(model=decision.model, reason=decision.reason).inc()
+    
+    logger.info("model_selected", model=decision.model, reason=decision.reason)
+    return decision.model
+
+async def _finalize(services: Services, request: QueryRequest, prepared: PreparedQuery, result: dict) -> dict:
+    # 4. Guardar métricas
+    track_llm_metrics(
+        model=result["metadata"]["model"],
+        input_tokens=result["metrics"]["input_tokens"],
+        output_tokens=result["metrics"]["output_tokens"],
+        cost=result["metrics"]["cost_usd"]
+    )
+    
+    # 5. Guardar en Caché
+    response_data = {
+        "answer": result["answer"],
+        "metrics": result["metrics"],
+        "metadata": {**result["metadata"], "sources": prepared.chunk_ids}
+    }
+    await services.cache.set(request.query, prepared.chunk_ids, response_data, prepared.documents)
+    if prepared.query_vector is not None:
+        await services.cache.store(
+            request.query, prepared.query_vector, services.retriever.corpus_version, response_data, prepared.documents
+        )
+    return response_data
+
+def _client_id(http_request: Request) -> str:
+    client_id = http_request.headers.get(settings.admission_client_header)
+    if client_id:
+        return client_id
+    return http_request.client.host if http_request.client else "unknown"
+
+def _admit(services: Services, client_id: str, cost: int = 1):
+    """Límite por cliente: solo lo consumen las peticiones que van a llegar al LLM."""
+    if settings.admission_enabled:
+        services.admission.check_client(client_id, cost)
+
+def _llm_slot(services: Services, request: QueryRequest, model_name: str):
+    """
+    Hueco de concurrencia (global y del modelo) mientras dura una llamada al LLM.
+    llm_client lo pide por cada llamada: la principal, el hedge y la degradación.
+    """
+    if not settings.admission_enabled:
+        return nullcontext()
+    return services.admission.slot(model_name, request.latency_budget_ms)
+
+def _rejected(e: AdmissionRejected) -> HTTPException:
+    logger.warning("request_shed", reason=e.reason, status=e.status_code, retry_after=e.retry_after)
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+
+def _unavailable(e: LLMUnavailable) -> HTTPException:
+    logger.warning("llm_unavailable", model=e.model, reason=e.reason, retry_after=e.retry_after)
+    return HTTPException(status_code=503, detail=str(e), headers=e.headers)
+
+async def _degraded_response(services: Services, prepared: PreparedQuery, error: LLMUnavailable) -> dict:
+    """Ningún modelo responde: la respuesta cacheada más parecida (umbral más laxo) o 503."""
+    if settings.llm_degrade_enabled and prepared.query_vector is not None:
+        cached_response = await services.cache.lookup(
+            prepared.query_vector, services.retriever.corpus_version, threshold=settings.llm_degraded_cache_threshold
+        )
+        if cached_response:
+            LLM_DEGRADED.labels(model=error.model, fallback="cache").inc()
+            return _mark_cached(cached_response, source="degraded_cache")
+    LLM_DEGRADED.labels(model=error.model, fallback="none").inc()
+    raise error
+
+async def _generate_once(services: Services, request: QueryRequest, prepared: PreparedQuery, generate) -> dict:
+    """
+    Ejecuta generate (LLM + _finalize) una sola vez por pregunta y contexto, aunque
+    lleguen a la vez a varios workers: el resto reutiliza la respuesta del líder.
+    """
+    if not settings.singleflight_enabled:
+        return await generate()
+    response, shared = await services.singleflight.run(
+        services.cache._generate_key(request.query, prepared.chunk_ids),
+        generate,
+        lambda: services.cache.get(request.query, prepared.chunk_ids)
+    )
+    if shared:
+        logger.info("singleflight_shared")
+        response = {**response, "metadata": {**response["metadata"], "source": "singleflight"}}
+    return response
+
 @router.post("/query", response_model=QueryResponse)
 @track_request_metrics(endpoint="query")
-async def query_rag(request: QueryRequest):
+@traced("query")
+async def query_rag(request: QueryRequest, http_request: Request, services: Services = Depends(get_services)):
     logger.info("request_received", query=request.query)
     
     try:
-        context_chunks = [
-            "DB-SI 4: Los extintores se colocan a 1.20m de altura.",
-            "DB-SI 4: Deben estar señalizados con carteles fotoluminiscentes."
-        ]
+        prepared = await _prepare_query(services, request)
+        if prepared.cached:
+            return QueryResponse(**prepared.cached)
+        _admit(services, _client_id(http_request))
 
-        # 1. CACHÉ
-        cached_response = cache.get(request.query, context_chunks)
-        if cached_response:
-            CACHE_HITS.inc()
-            logger.info("cache_hit", query=request.query)
-            cached_response["metadata"]["source"] = "cache"
-            return QueryResponse(**cached_response)
-
-        CACHE_MISSES.inc()
-
-        # 2. MODEL ROUTING (AQUÍ ESTÁ LA MAGIA) 🧙‍♂️
-        selected_model_name = model_router.route(request.query, context_chunks)
-        
-        # Registramos la decisión en Prometheus
-        MODEL_ROUTING.labels(model=selected_model_name).inc()
-        
-        logger.info("model_selected", model=selected_model_name, query=request.query)
-
-        # Instanciamos el modelo específico que ha decidido el router
-        model = RAGModel(model_name=selected_model_name)
-        
-        result = model.generate_response(
-            query=request.query,
-            context_chunks=context_chunks,
-            run_name=f"api_query_{selected_model_name}"
-        )
-        
-        # 3. Guardar métricas
-        track_llm_metrics(
-            model=result["metadata"]["model"],
-            input_tokens=int(result["metrics"]["tokens"] * 0.7),
-            output_tokens=int(result["metrics"]["tokens"] * 0.3),
-            cost=result["metrics"]["cost_usd"]
-        )
-        
-        # 4. Guardar en Caché
-        response_data = {
-            "answer": result["answer"],
-            "metrics": result["metrics"],
-            "metadata": result["metadata"]
-        }
-        cache.set(request.query, context_chunks, response_data)
-        
-        return QueryResponse(**response_data)
+        async def generate() -> dict:
+            # Modelo que ha decidido el router (instancia y pool de conexiones compartidos)
+            selected_model_name = _select_model(services, request, prepared)
+            model = get_rag_model(selected_model_name)
+
+            result = await model.agenerate_response(
+                query=request.query,
+                context_chunks=prepared.context_chunks,
+                run_name=f"api_query_{selected_model_name}",
+                slot=partial(_llm_slot, services, request)
+            )
+            return await _finalize(services, request, prepared, result)
+
+        try:
+            return QueryResponse(**await _generate_once(services, request, prepared, generate))
+        except LLMUnavailable as e:
+            return QueryResponse(**await _degraded_response(services, prepared, e))
 
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    except LLMUnavailable as e:
+        raise _unavailable(e)
     except Exception as e:
         logger.error("query_failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/query/batch", response_model=BatchQueryResponse)
+@track_request_metrics(endpoint="query_batch")
+@traced("query_batch")
+async def query_rag_batch(
+    batch: BatchQueryRequest, http_request: Request, services: Services = Depends(get_services)
+):
+    """Muchas preguntas en una petición: deduplicadas, con caché en bloque y LLM en paralelo."""
+    if len(batch.queries) > settings.batch_max_size:
+        raise HTTPException(status_code=413, detail=f"Máximo {settings.batch_max_size} preguntas por lote")
+    logger.info("batch_received", size=len(batch.queries))
+
+    # 1. Deduplicación: preguntas iguales tras normalizar (y mismo top_k) se resuelven una vez
+    positions: Dict[tuple, List[int]] = {}
+    for i, request in enumerate(batch.queries):
+        positions.setdefault((normalize_query(request.query), request.top_k), []).append(i)
+    unique = [batch.queries[indexes[0]] for indexes in positions.values()]
+
+    try:
+        prepared = await _prepare_batch(services, unique)
+    except Exception as e:
+        logger.error("batch_failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # 2. Fallos de caché: llamadas al LLM concurrentes, con límite
+    misses = [i for i, prep in enumerate(prepared) if not prep.cached]
+    if misses:
+        try:
+            _admit(services, _client_id(http_request), cost=len(misses))
+        except AdmissionRejected as e:
+            raise _rejected(e)
+    semaphore = asyncio.Semaphore(settings.batch_max_concurrency)
+
+    async def generate(request: QueryRequest, prep: PreparedQuery) -> dict:
+        async def call_llm() -> dict:
+            selected_model_name = _select_model(services, request, prep)
+            result = await get_rag_model(selected_model_name).agenerate_response(
+                query=request.query,
+                context_chunks=prep.context_chunks,
+                run_name=f"api_batch_{selected_model_name}",
+                slot=partial(_llm_slot, services, request)
+            )
+            return await _finalize(services, request, prep, result)
+
+        async with semaphore:
+            try:
+                return await _generate_once(services, request, prep, call_llm)
+            except LLMUnavailable as e:
+                return await _degraded_response(services, prep, e)
+
+    outcomes = await asyncio.gather(
+        *[generate(unique[i], prepared[i]) for i in misses], return_exceptions=True
+    )
+    responses: List[Any] = [prep.cached for prep in prepared]
+    for i, outcome in zip(misses, outcomes):
+        responses[i] = outcome
+
+    # 3. Resultados en el orden original
+    results: List[Optional[BatchQueryItem]] = [None] * len(batch.queries)
+    for indexes, outcome in zip(positions.values(), responses):
+        if isinstance(outcome, Exception):
+            logger.error("batch_item_failed", error=str(outcome))
+            item = BatchQueryItem(error=str(outcome))
+        else:
+            item = BatchQueryItem(response=QueryResponse(**outcome))
+        for i in indexes:
+            results[i] = item
+
+    return BatchQueryResponse(
+        results=results,
+        metadata={
+            "total": len(batch.queries),
+            "unique": len(unique),
+            "cache_hits": len(unique) - len(misses),
+            "errors": sum(isinstance(outcome, Exception) for outcome in outcomes)
+        }
+    )
+
+def _sse(event: str, data: dict) -> str:
+    """Formato Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@track_stream_metrics(endpoint="query_stream")
+@traced("query_stream")
+async def _stream_query(services: Services, request: QueryRequest, client_id: str):
+    start_time = time.time()
+    prepared = await _prepare_query(services, request)
+
+    # Cache hit: la respuesta completa sale de inmediato
+    if prepared.cached:
+        TIME_TO_FIRST_TOKEN.labels(endpoint="query_stream", source="cache").observe(time.time() - start_time)
+        yield _sse("token", {"text": prepared.cached["answer"]})
+        yield _sse("done", QueryResponse(**prepared.cached).model_dump())
+        return
+
+    _admit(services, client_id)
+    selected_model_name = _select_model(services, request, prepared)
+    model = get_rag_model(selected_model_name)
+    first_token = True
+    async for event, payload in model.astream_response(
+        query=request.query,
+        context_chunks=prepared.context_chunks,
+        run_name=f"api_stream_{selected_model_name}",
+        slot=partial(_llm_slot, services, request)
+    ):
+        if event == "token":
+            if first_token:
+                TIME_TO_FIRST_TOKEN.labels(endpoint="query_stream", source="live").observe(time.time() - start_time)
+                first_token = False
+            yield _sse("token", {"text": payload})
+        else:
+            yield _sse("done", QueryResponse(**await _finalize(services, request, prepared, payload)).model_dump())
+
+async def _stream_events(services: Services, request: QueryRequest, client_id: str):
+    started = False
+    try:
+        async for event in _stream_query(services, request, client_id):
+            started = True
+            yield event
+    except (AdmissionRejected, LLMUnavailable):
+        # Antes del primer evento el endpoint aún puede responder 429/503
+        if not started:
+            raise
+        logger.error("query_stream_failed", error="llm_unavailable")
+        yield _sse("error", {"detail": "llm_unavailable"})
+    except Exception as e:
+        # Las cabeceras ya se enviaron: el error viaja como evento del stream
+        logger.error("query_stream_failed", error=str(e))
+        yield _sse("error", {"detail": str(e)})
+
+async def _prepend(first: str, events):
+    try:
+        yield first
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
+
+@router.post("/query/stream")
+async def query_rag_stream(request: QueryRequest, http_request: Request, services: Services = Depends(get_services)):
+    """Igual que /query, pero envía los tokens por SSE según se generan."""
+    logger.info("request_received", query=request.query, stream=True)
+    # Se espera al primer evento antes de enviar cabeceras: si la admisión rechaza
+    # la petición, el cliente recibe un 429/503 con Retry-After y no un stream
+    events = _stream_events(services, request, _client_id(http_request))
+    try:
+        first = await events.__anext__()
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    except LLMUnavailable as e:
+        raise _unavailable(e)
+    return StreamingResponse(
+        _prepend(first, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@router.get("/ready")
+async def readiness_check():
+    # 503 mientras el worker calienta clientes, conexiones e índice (ver api/startup.py)
+    report = get_startup_report()
+    status_code = 200 if report.ready else 503
+    return JSONResponse(report.to_dict(), status_code=status_code)
@@ -0,0 +1,125 @@
+import asyncio
+import importlib
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, get_args
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import STARTUP_PHASE_SECONDS
+
+settings = get_settings()
+logger = get_logger("src.api.startup")
+
+# Dependencias que se importan bajo demanda (ver src.sre.utils.lazy)
+HEAVY_MODULES = ("httpx", "openai", "mlflow")
+
+
+@dataclass
+class PhaseResult:
+    status: str = "pending"  # ok, failed
+    duration_ms: float = 0.0
+    detail: Optional[str] = None
+
+
+class StartupReport:
+    """Estado del calentamiento del worker: lo expone /ready."""
+
+    def __init__(self):
+        self.ready = False
+        self.total_ms: Optional[float] = None
+        self.phases: Dict[str, PhaseResult] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "total_ms": self.total_ms,
+            "phases": {name: asdict(phase) for name, phase in self.phases.items()}
+        }
+
+
+async def _run_phase(report: StartupReport, name: str, func: Callable[[], Awaitable[Optional[str]]]):
+    """Una fase que falla no tumba el arranque: queda en el informe y el worker sirve igual."""
+    phase = report.phases[name] = PhaseResult()
+    start = time.perf_counter()
+    try:
+        phase.detail = await asyncio.wait_for(func(), settings.startup_phase_timeout_seconds)
+        phase.status = "ok"
+    except Exception as e:
+        phase.status = "failed"
+        phase.detail = str(e) or type(e).__name__
+    elapsed = time.perf_counter() - start
+    phase.duration_ms = round(elapsed * 1000, 1)
+    STARTUP_PHASE_SECONDS.labels(phase=name).set(elapsed)
+
+
+def _import_heavy_modules() -> str:
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    return ", ".join(HEAVY_MODULES)
+
+
+async def _warm_imports() -> str:
+    # En un hilo: el event loop sigue atendiendo /health mientras tanto
+    return await asyncio.to_thread(_import_heavy_modules)
+
+
+async def _warm_redis() -> str:
+    from src.sre.utils.cache import get_cache
+    await get_cache().redis_client.ping()
+    return "pool connected"
+
+
+async def _warm_llm() -> str:
+    """Abre la conexión TLS de cada cliente (un pool por modelo) antes de la primera petición."""
+    import openai
+    from src.sre.generation.llm_client import get_async_openai_client
+    from src.sre.generation.model_router import ModelType
+
+    async def handshake(model: str):
+        try:
+            await get_async_openai_client(model).with_options(max_retries=0).models.list()
+        except openai.APIStatusError:
+            pass  # hubo respuesta HTTP: la conexión ya está abierta
+
+    models: List[str] = list(get_args(ModelType))
+    await asyncio.gather(*[handshake(model) for model in models])
+    return ", ".join(models)
+
+
+async def _warm_index() -> str:
+    from src.sre.retrieval.retriever import get_retriever
+    retriever = get_retriever()
+    index = await asyncio.to_thread(lambda: retriever.index)
+    if index is None:
+        return "no index"
+    prefetched = await asyncio.to_thread(index.prefetch)
+    # Cliente de embeddings y segmentos de la caché de embeddings
+    await asyncio.to_thread(lambda: retriever.embedder)
+    return f"{index.size} chunks, {prefetched} bytes prefetched"
+
+
+async def run_startup_warmup(report: StartupReport) -> StartupReport:
+    """
+    Imports pesados primero (las demás fases los usan) y después, en paralelo, el
+    pool de Redis, las conexiones al LLM y el índice. Al terminar, /ready pasa a 200.
+    """
+    start = time.perf_counter()
+    await _run_phase(report, "imports", _warm_imports)
+    await asyncio.gather(
+        _run_phase(report, "redis", _warm_redis),
+        _run_phase(report, "llm", _warm_llm),
+        _run_phase(report, "index", _warm_index)
+    )
+    report.total_ms = round((time.perf_counter() - start) * 1000, 1)
+    report.ready = True
+    logger.info("startup_complete", **report.to_dict())
+    return report
+
+
+# Singleton
+_startup_report_instance = None
+def get_startup_report() -> StartupReport:
+    global _startup_report_instance
+    if _startup_report_instance is None:
+        _startup_report_instance = StartupReport()
+    return _startup_report_instance
@@ -0,0 +1,60 @@
+from typing import Dict
+
+# Precios en USD por cada 1K tokens y límites de cada modelo.
+# - context_window: tokens totales (entrada + salida) que admite el modelo
+# - max_input_tokens: presupuesto de entrada que nos permitimos (coste y latencia)
+# - max_output_tokens: tope de max_tokens para la respuesta
+MODEL_PRICING: Dict[str, Dict] = {
+    "gpt-3.5-turbo": {
+        "input_per_1k": 0.0005,
+        "output_per_1k": 0.0015,
+        "context_window": 16385,
+        "max_input_tokens": 3000,
+        "max_output_tokens": 1000
+    },
+    "gpt-4": {
+        "input_per_1k": 0.03,
+        "output_per_1k": 0.06,
+        "context_window": 8192,
+        "max_input_tokens": 4000,
+        "max_output_tokens": 1000
+    },
+    "gpt-4-turbo": {
+        "input_per_1k": 0.01,
+        "output_per_1k": 0.03,
+        "context_window": 128000,
+        "max_input_tokens": 6000,
+        "max_output_tokens": 1000
+    },
+    "gpt-4o": {
+        "input_per_1k": 0.005,
+        "output_per_1k": 0.015,
+        "context_window": 128000,
+        "max_input_tokens": 6000,
+        "max_output_tokens": 1000
+    },
+    "gpt-4o-mini": {
+        "input_per_1k": 0.00015,
+        "output_per_1k": 0.0006,
+        "context_window": 128000,
+        "max_input_tokens": 6000,
+        "max_output_tokens": 1000
+    }
+}
+
+# Modelos sin entrada propia (p. ej. "gpt-3.5-turbo-0125") usan la de su familia
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+def get_model_pricing(model_name: str) -> Dict:
+    """Entrada de la tabla: coincidencia exacta o el prefijo más largo."""
+    if model_name in MODEL_PRICING:
+        return MODEL_PRICING[model_name]
+    prefixes = [name for name in MODEL_PRICING if model_name.startswith(name)]
+    return MODEL_PRICING[max(prefixes, key=len)] if prefixes else MODEL_PRICING[DEFAULT_MODEL]
+
+
+def compute_cost(model_name: str, input_tokens: int, output_tokens: int) -> float:
+    """Coste en USD de una llamada."""
+    pricing = get_model_pricing(model_name)
+    return input_tokens / 1000 * pricing["input_per_1k"] + output_tokens / 1000 * pricing["output_per_1k"]
@@ -1,24 +1,137 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     # API Keys
     openai_api_key: str
-    pinecone_api_key: str
-    pinecone_environment: str
+    pinecone_api_key: Optional[str] = None  # aún sin uso: el índice vectorial es local
+    pinecone_environment: Optional[str] = None
 
     # MLflow
     mlflow_tracking_uri: str = "http://localhost:5000"
     mlflow_experiment_name: str = "RAG-CTE-System"
+    tracking_queue_size: int = 1000
+    tracking_batch_size: int = 50
+    tracking_flush_interval_seconds: float = 2.0
+    tracking_artifact_sample_rate: float = 0.1
+    tracking_shutdown_timeout_seconds: float = 10.0
+
+    # LLM
+    openai_base_url: Optional[str] = None  # p. ej. el stub local: http://localhost:8100/v1
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_timeout_seconds: float = 60.0
+    llm_max_input_tokens: int = 0  # 0 = presupuesto de la tabla de precios de cada modelo
+    llm_min_output_tokens: int = 256
+    # Tope de la respuesta según el tipo de pregunta (siempre dentro del max_output_tokens del modelo)
+    llm_output_tokens_default: int = 500
+    llm_output_tokens_complex: int = 1000  # comparativas, análisis, resúmenes ejecutivos
+    # Resiliencia de las llamadas al LLM
+    llm_deadline_seconds: float = 30.0  # plazo por llamada
+    llm_model_deadlines: str = ""  # por modelo, p. ej. "gpt-4=45,gpt-3.5-turbo=20"
+    llm_stream_idle_seconds: float = 10.0  # streaming: silencio máximo entre chunks tras el primer token
+    llm_hedge_enabled: bool = True
+    llm_hedge_target: str = "fallback"  # fallback = modelo barato; duplicate = el mismo modelo
+    llm_hedge_min_delay_seconds: float = 0.25
+    llm_hedge_budget_ratio: float = 0.05  # como mucho ~5 % de llamadas extra
+    llm_degrade_enabled: bool = True  # si el modelo falla: gpt-3.5-turbo y, si no, caché
+    llm_degraded_cache_threshold: float = 0.8  # similitud mínima para servir una respuesta cercana
+    circuit_failure_threshold: int = 5  # fallos seguidos para abrir el circuito
+    circuit_reset_seconds: float = 30.0
+    adaptive_routing_enabled: bool = True
+    routing_latency_budget_ms: float = 0  # presupuesto por defecto; 0 = sin presupuesto
+    routing_window_seconds: float = 60.0
+    routing_max_samples: int = 500
+    routing_min_samples: int = 20
+    routing_ewma_alpha: float = 0.2
+    routing_max_error_rate: float = 0.2
+    routing_min_ratelimit_fraction: float = 0.05
+    # Control de admisión de las llamadas al LLM (las respuestas de caché no pasan)
+    admission_enabled: bool = True
+    admission_max_concurrency: int = 64  # llamadas simultáneas por worker
+    admission_model_limits: str = ""  # p. ej. "gpt-4=16,gpt-3.5-turbo=48"
+    admission_max_queue: int = 256  # peticiones en espera por limitador; más => 503
+    admission_max_wait_seconds: float = 5.0  # espera máxima sin presupuesto de latencia
+    admission_default_service_seconds: float = 2.0  # duración estimada hasta tener medidas
+    admission_client_rate: float = 0.0  # llamadas/s por cliente; 0 = sin límite
+    admission_client_burst: int = 20
+    admission_client_header: str = "X-Client-Id"  # si no llega, la IP del cliente
+    batch_max_size: int = 500
+    batch_max_concurrency: int = 8
+
+    # Trazas por etapa (los histogramas de Prometheus se alimentan siempre)
+    trace_sample_rate: float = 0.0  # fracción de peticiones con traza exportada
+    trace_export_path: str = "data/traces/traces.jsonl"
+    trace_export_format: str = "jsonl"  # jsonl | otlp (JSON de OTLP, una petición de export por línea)
+    trace_queue_size: int = 1000
+
+    # Profiler bajo demanda (/debug/profile); desactivado salvo que se pida
+    debug_profile_enabled: bool = False
+    debug_profile_token: Optional[str] = None  # cabecera X-Debug-Token
+    debug_profile_hz: int = 100
+    debug_profile_max_seconds: float = 60.0
+
+    # Arranque: calentamiento en segundo plano; /ready devuelve 503 hasta que termina
+    startup_warmup_enabled: bool = True
+    startup_phase_timeout_seconds: float = 10.0
 
     # App
     app_name: str = "RAG-MLOps"
     app_version: str = "1.0.0"
     log_level: str = "INFO"
+    log_async: bool = True  # escritura de logs en un hilo aparte, vía cola
+    log_queue_size: int = 10000  # si se llena, se descartan líneas en vez de bloquear
+    # Por tipo de evento: "request_received=0.1,cache_hit=0.5" (fracción que se registra)
+    log_sample_rates: str = ""
+    # Por tipo de evento: "request_received=200" (máximo de líneas por segundo)
+    log_rate_limits: str = ""
 
     # Cache
     redis_host: str = "localhost"
     redis_port: int = 6379
+    redis_max_connections: int = 50
+    cache_compression_min_bytes: int = 1024  # 0 desactiva la compresión
+    cache_compression_level: int = 6
+    l1_cache_enabled: bool = True
+    l1_cache_max_entries: int = 1024
+    l1_cache_max_bytes: int = 32 * 1024 * 1024
+    l1_cache_ttl_seconds: int = 60
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_max_entries: int = 50000
+    singleflight_enabled: bool = True
+    singleflight_lease_seconds: float = 10.0  # el líder lo renueva mientras genera; si cae, expira en este plazo
+    singleflight_poll_seconds: float = 0.05
+    cache_warmup_on_startup: bool = False
+    cache_warmup_sources: str = ""  # .jsonl separados por comas (peticiones o logs JSON)
+    cache_warmup_top_n: int = 200
+    cache_warmup_budget_usd: float = 1.0
+    cache_warmup_concurrency: int = 4
+    cache_warmup_rate_per_second: float = 2.0
+    cache_warmup_lock_seconds: int = 3600
+
+    # Retrieval
+    index_dir: str = "data/index"
+    index_refresh_seconds: float = 5.0  # cada cuánto se relee CURRENT (versión publicada)
+    embedding_model: str = "text-embedding-3-small"
+    embedding_batch_size: int = 128
+    retrieval_nprobe: int = 8
+    retrieval_mode: str = "hybrid"  # vector | lexical | hybrid (BM25 + vectores con RRF)
+    hybrid_candidates_factor: int = 4  # candidatos por lista antes de fusionar: top_k * factor
+    rrf_k: int = 60
+    lexical_shortcut_max_terms: int = 4  # 0 = embedding siempre en modo híbrido
+    ivf_min_size: int = 50000
+    embedding_cache_enabled: bool = True
+    embedding_cache_dir: str = "data/embedding_cache"
+    embedding_cache_hot_entries: int = 10000
+    embedding_cache_segment_max_bytes: int = 64 * 1024 * 1024
+    embedding_cache_refresh_seconds: float = 5.0
+
+    # Ingesta
+    corpus_dir: str = "data/corpus"
+    chunk_max_chars: int = 1500
+    chunk_overlap_chars: int = 200
 
     class Config:
         env_file = ".env"
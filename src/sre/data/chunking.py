@@ -0,0 +1,91 @@
+import hashlib
+import re
+from typing import Dict, Iterator, Tuple
+
+# Cabeceras que abren una sección nueva en documentos del CTE:
+# Markdown ("## ..."), documentos básicos ("DB-SI 4 ..."), secciones ("Sección SUA 1"),
+# artículos ("Artículo 12 ...") y apartados numerados ("1.2.3 Dotación ...").
+HEADING_PATTERN = re.compile(
+    r"^(?:#{1,6}\s+\S.*"
+    r"|(?:DB-[A-Z]{2,3}|Secci[óo]n\s+[A-Z]{2,3})(?:\s+\d+)?(?:\s.*)?"
+    r"|Art[íi]culo\s+\d+.*"
+    r"|\d+(?:\.\d+){0,3}\.?\s+[A-ZÁÉÍÓÚÑ][^.]{0,120})$"
+)
+MAX_HEADING_CHARS = 150
+SENTENCE_END = re.compile(r"(?<=[.;:!?])\s+")
+
+
+def split_sections(text: str) -> Iterator[Tuple[str, str]]:
+    """Divide un documento en (título de sección, cuerpo) siguiendo sus cabeceras."""
+    # Los saltos de página (\f) del texto extraído de PDF se tratan como saltos de línea
+    title, body = "", []
+    for line in text.replace("\f", "\n").splitlines():
+        stripped = line.strip()
+        if len(stripped) <= MAX_HEADING_CHARS and HEADING_PATTERN.match(stripped):
+            if any(part.strip() for part in body):
+                yield title, "\n".join(body).strip()
+            title, body = stripped.lstrip("#").strip(), []
+        else:
+            body.append(line)
+    if any(part.strip() for part in body):
+        yield title, "\n".join(body).strip()
+
+
+def _split_long(paragraph: str, max_chars: int) -> Iterator[str]:
+    """Parte un párrafo más largo que max_chars por frases (o por palabras si hace falta)."""
+    piece = ""
+    for sentence in SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if piece:
+                yield piece
+                piece = ""
+            yield sentence[:cut].strip()
+            sentence = sentence[cut:].strip()
+        if piece and len(piece) + len(sentence) + 1 > max_chars:
+            yield piece
+            piece = ""
+        piece = f"{piece} {sentence}".strip()
+    if piece:
+        yield piece
+
+
+def _window(body: str, max_chars: int, overlap: int) -> Iterator[str]:
+    """Agrupa párrafos en ventanas de hasta max_chars con solape entre ventanas."""
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", body):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        for piece in _split_long(paragraph, max_chars):
+            if current and len(current) + len(piece) + 2 > max_chars:
+                yield current
+                tail = current[-overlap:] if overlap else ""
+                # El solape empieza en un límite de palabra
+                current = tail[tail.find(" ") + 1:] if " " in tail else ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        yield current
+
+
+def chunk_document(doc_id: str, text: str, max_chars: int = 1500, overlap: int = 200) -> Iterator[Dict]:
+    """
+    Genera los chunks de un documento respetando sus secciones.
+
+    Cada chunk lleva delante el título de su sección (mejora la recuperación de
+    preguntas como "¿qué dice el DB-SI 4...?") y un id estable derivado del contenido.
+    """
+    position = 0
+    for title, body in split_sections(text):
+        for piece in _window(body, max_chars, overlap):
+            chunk_text = f"{title}\n{piece}" if title else piece
+            digest = hashlib.sha1(chunk_text.encode("utf-8")).hexdigest()[:12]
+            yield {
+                "id": f"{doc_id}#{position}-{digest}",
+                "text": chunk_text,
+                "source": doc_id,
+                "section": title,
+                "position": position
+            }
+            position += 1
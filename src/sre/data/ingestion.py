@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.sre.config.settings import get_settings
+from src.sre.data.chunking import chunk_document
+from src.sre.monitoring.logger import get_logger
+from src.sre.retrieval.embeddings import get_default_embedder
+from src.sre.retrieval.lexical import build_lexical_index
+from src.sre.utils.cache import RedisCache
+from src.sre.retrieval.vector_index import (
+    CURRENT_FILE, META_FILE, VectorIndex, build_index, publish_index, resolve_index_dir
+)
+
+settings = get_settings()
+logger = get_logger("src.data.ingestion")
+
+# Texto plano, Markdown y texto extraído de PDF (.txt con saltos de página \f)
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".markdown")
+MANIFEST_FILE = "manifest.json"
+STAGING_DIR = ".staging"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    """Hash del contenido leyendo el fichero por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_documents(source_dir: str) -> Iterator[Tuple[str, str]]:
+    """Genera (doc_id, ruta) de los documentos soportados, en orden estable."""
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source_dir).replace(os.sep, "/"), path
+
+
+def chunk_file(job: Tuple[str, str, int, int]) -> List[Dict]:
+    """Trocea un fichero (función de módulo para poder usarla en el pool de procesos)."""
+    doc_id, path, max_chars, overlap = job
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    return list(chunk_document(doc_id, text, max_chars=max_chars, overlap=overlap))
+
+
+def auto_n_clusters(n_rows: int) -> int:
+    """Número de particiones IVF: 0 (búsqueda exacta) hasta ivf_min_size, luego ~4·√n."""
+    if n_rows < settings.ivf_min_size:
+        return 0
+    return int(4 * np.sqrt(n_rows))
+
+
+class Manifest:
+    """Hash de contenido de cada documento ingerido (hace la ingesta incremental)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.documents: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+
+    @property
+    def corpus_version(self) -> str:
+        """Versión del corpus: hash de los hashes de todos sus documentos."""
+        digest = hashlib.sha256()
+        for doc_id in sorted(self.documents):
+            digest.update(f"{doc_id}:{self.documents[doc_id]['sha256']}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"corpus_version": self.corpus_version, "documents": self.documents}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class IngestionReport:
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    corpus_version: Optional[str] = None
+    previous_corpus_version: Optional[str] = None
+    index_dir: Optional[str] = None
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+class _StagingWriter:
+    """Acumula chunks y vectores en disco (append) hasta construir el índice final."""
+
+    def __init__(self, staging_dir: str):
+        os.makedirs(staging_dir, exist_ok=True)
+        self.vectors_path = os.path.join(staging_dir, "vectors.f32")
+        self.chunks_path = os.path.join(staging_dir, "chunks.jsonl")
+        self._vectors = open(self.vectors_path, "wb")
+        self._chunks = open(self.chunks_path, "w", encoding="utf-8")
+        self.size = 0
+        self.dim = None
+
+    def add(self, chunks: List[Dict], vectors: np.ndarray):
+        if not chunks:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._vectors.write(vectors.tobytes())
+        for chunk in chunks:
+            self._chunks.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        self.size += len(chunks)
+
+    def close(self):
+        self._vectors.close()
+        self._chunks.close()
+
+    def vectors(self) -> np.ndarray:
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.size, self.dim))
+
+    def iter_chunks(self) -> Iterator[Dict]:
+        with open(self.chunks_path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class IngestionPipeline:
+    """
+    Ingesta en streaming: documentos -> chunks por sección -> embeddings -> índice.
+
+    Solo se trocean y se calculan embeddings de los documentos nuevos o modificados;
+    los vectores de los demás se copian del índice anterior.
+    """
+
+    def __init__(
+        self,
+        source_dir: str = None,
+        index_root: str = None,
+        embedder=None,
+        workers: int = 0,
+        batch_size: int = None,
+        max_chars: int = None,
+        overlap: int = None
+    ):
+        self.source_dir = source_dir or settings.corpus_dir
+        self.index_root = index_root or settings.index_dir
+        self._embedder = embedder
+        self.workers = workers
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.max_chars = max_chars or settings.chunk_max_chars
+        self.overlap = settings.chunk_overlap_chars if overlap is None else overlap
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = get_default_embedder()
+        return self._embedder
+
+    def _chunk_jobs(self, jobs: List[Tuple[str, str, int, int]]) -> Iterator[List[Dict]]:
+        """Trocea documentos en serie o en un pool de procesos con ventana acotada."""
+        if self.workers <= 1:
+            for job in jobs:
+                yield chunk_file(job)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for job in jobs:
+                pending.append(executor.submit(chunk_file, job))
+                # Como mucho 2 tareas por proceso en vuelo: memoria acotada
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _embed_new_chunks(self, jobs, writer: _StagingWriter) -> int:
+        batch: List[Dict] = []
+        embedded = 0
+        for chunks in self._chunk_jobs(jobs):
+            batch.extend(chunks)
+            while len(batch) >= self.batch_size:
+                current, batch = batch[:self.batch_size], batch[self.batch_size:]
+                writer.add(current, self.embedder.embed([c["text"] for c in current]))
+                embedded += len(current)
+        if batch:
+            writer.add(batch, self.embedder.embed([c["text"] for c in batch]))
+            embedded += len(batch)
+        return embedded
+
+    def _copy_unchanged(self, previous: VectorIndex, keep: set, writer: _StagingWriter) -> int:
+        """Reutiliza, por bloques, los vectores de los documentos sin cambios."""
+        copied = 0
+        rows, chunks = [], []
+
+        def flush():
+            writer.add(chunks, previous.embeddings[previous.embedding_rows(np.array(rows))])
+
+        for row, chunk in enumerate(previous.iter_chunks()):
+            if chunk.get("source") in keep:
+                rows.append(row)
+                chunks.append(chunk)
+                if len(rows) >= self.batch_size * 8:
+                    flush()
+                    copied += len(rows)
+                    rows, chunks = [], []
+        if rows:
+            flush()
+            copied += len(rows)
+        return copied
+
+    def run(self, force: bool = False) -> IngestionReport:
+        os.makedirs(self.index_root, exist_ok=True)
+        manifest = Manifest(os.path.join(self.index_root, MANIFEST_FILE))
+        current_dir = resolve_index_dir(self.index_root)
+        has_index = os.path.exists(os.path.join(current_dir, META_FILE))
+        previous = VectorIndex(current_dir) if has_index and not force else None
+        report = IngestionReport()
+
+        # 1. Plan: qué documentos son nuevos, cuáles cambiaron y cuáles desaparecieron
+        documents: Dict[str, Dict] = {}
+        jobs = []
+        for doc_id, path in iter_documents(self.source_dir):
+            sha = file_sha256(path)
+            documents[doc_id] = {"sha256": sha}
+            known = manifest.documents.get(doc_id)
+            if previous is not None and known and known["sha256"] == sha:
+                report.unchanged += 1
+                continue
+            (report.updated if known else report.added).append(doc_id)
+            jobs.append((doc_id, path, self.max_chars, self.overlap))
+        report.removed = sorted(set(manifest.documents) - set(documents))
+        report.previous_corpus_version = manifest.corpus_version if manifest.documents else None
+        manifest.documents = documents
+        report.corpus_version = manifest.corpus_version
+
+        if previous is not None and not report.changed:
+            report.index_dir = current_dir
+            logger.info("ingestion_up_to_date", corpus_version=report.corpus_version)
+            return report
+
+        # 2. Streaming: chunks reutilizados + chunks nuevos a un área de staging
+        staging_dir = os.path.join(self.index_root, STAGING_DIR)
+        writer = _StagingWriter(staging_dir)
+        try:
+            if previous is not None:
+                keep = set(documents) - set(report.added) - set(report.updated)
+                report.chunks_reused = self._copy_unchanged(previous, keep, writer)
+            report.chunks_embedded = self._embed_new_chunks(jobs, writer)
+            writer.close()
+
+            # 3. Índice nuevo en su propio directorio y publicación atómica:
+            #    nunca se reescriben ficheros que otros workers tienen mapeados
+            version_dir = os.path.join(self.index_root, f"v-{report.corpus_version}-{int(time.time())}")
+            if writer.size:
+                build_index(
+                    version_dir,
+                    writer.vectors(),
+                    writer.iter_chunks(),
+                    n_clusters=auto_n_clusters(writer.size),
+                    corpus_version=report.corpus_version,
+                    embedding_model=getattr(self.embedder, "model_name", None)
+                )
+                # El índice BM25 se reconstruye entero: solo tokeniza, no llama a la API
+                build_lexical_index(version_dir)
+                publish_index(self.index_root, version_dir)
+                report.index_dir = version_dir
+            elif os.path.exists(os.path.join(self.index_root, CURRENT_FILE)):
+                # Corpus vacío: se despublica el índice anterior
+                os.remove(os.path.join(self.index_root, CURRENT_FILE))
+            manifest.save()
+        finally:
+            writer.close()
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        # La versión anterior se borra: los workers que aún la tengan mapeada
+        # conservan su copia hasta que recarguen (semántica de unlink en POSIX)
+        if previous is not None:
+            previous.close()
+        if has_index and report.index_dir and current_dir not in (report.index_dir, self.index_root):
+            shutil.rmtree(current_dir, ignore_errors=True)
+
+        logger.info("ingestion_complete", **asdict(report))
+        return report
+
+
+def invalidation_tags(report: IngestionReport) -> List[str]:
+    """Etiquetas de caché afectadas por una ingesta: documentos cambiados y corpus anterior."""
+    tags = [f"doc:{doc_id}" for doc_id in report.updated + report.removed]
+    if report.previous_corpus_version and report.previous_corpus_version != report.corpus_version:
+        tags.append(f"corpus:{report.previous_corpus_version}")
+    return tags
+
+
+async def _invalidate_cache(report: IngestionReport):
+    cache = RedisCache()
+    try:
+        await cache.invalidate_tags(invalidation_tags(report))
+    finally:
+        await cache.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental del corpus CTE")
+    parser.add_argument("--source", default=settings.corpus_dir, help="Directorio con los documentos")
+    parser.add_argument("--index", default=settings.index_dir, help="Directorio raíz del índice")
+    parser.add_argument("--workers", type=int, default=0, help="Procesos para trocear (0 = en serie)")
+    parser.add_argument("--force", action="store_true", help="Reconstruye todo el índice")
+    args = parser.parse_args()
+
+    report = IngestionPipeline(args.source, args.index, workers=args.workers).run(force=args.force)
+    if report.changed:
+        # Solo se borran las respuestas de los documentos que cambiaron (Redis y L1 de los workers)
+        asyncio.run(_invalidate_cache(report))
+    print(json.dumps(asdict(report), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,27 @@
 import streamlit as st
 import requests
+import json
 import time
 
+def iter_sse(response):
+    """Recorre una respuesta Server-Sent Events y produce (evento, datos)."""
+    response.encoding = "utf-8"
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+# Etiqueta, detalle y color del badge de fuente (metadata.source de la API)
+SOURCE_BADGES = {
+    "cache": ("Redis Caché", "🚀 Instant", "normal"),
+    "semantic_cache": ("Caché Semántica", "🚀 Instant", "normal"),
+    "degraded_cache": ("Caché (modo degradado)", "⚠️ LLM no disponible", "inverse"),
+    "singleflight": ("Respuesta compartida", "🤝 Misma pregunta en curso", "normal"),
+}
+LIVE_BADGE = ("OpenAI API", "☁️ Live", "off")
+
 # Configuración de la página
 st.set_page_config(
     page_title="Asistente CTE - RAG MLOps",
@@ -52,18 +72,28 @@ if prompt := st.chat_input("Pregunta sobre extintores, pasillos, rampas..."):
         try:
             start = time.time()
             response = requests.post(
-                "http://localhost:8000/query",
+                "http://localhost:8000/query/stream",
                 json={"query": prompt, "top_k": 3},
+                stream=True,
                 timeout=30
             )
             
             if response.status_code == 200:
-                data = response.json()
-                answer = data["answer"]
-                meta = data["metadata"]
-                metrics = data["metrics"]
-                
+                answer = ""
+                data = None
+                # Server-Sent Events: se pinta cada token según llega
+                for event, payload in iter_sse(response):
+                    if event == "token":
+                        answer += payload["text"]
+                        message_placeholder.markdown(answer + "▌")
+                    elif event == "done":
+                        data = payload
+                    elif event == "error":
+                        raise RuntimeError(payload["detail"])
+
                 message_placeholder.markdown(answer)
+                meta = data["metadata"] if data else {}
+                metrics = data["metrics"] if data else {}
                 
                 with st.expander("🔍 Detalles Técnicos (MLOps)"):
                     c1, c2, c3 = st.columns(3)
@@ -74,14 +104,16 @@ if prompt := st.chat_input("Pregunta sobre extintores, pasillos, rampas..."):
                         c1.metric("Modelo", model, "⚡ Fast")
                         
                     source = meta.get("source", "live")
-                    if source == "cache":
-                        c2.metric("Fuente", "Redis Caché", "🚀 Instant", delta_color="normal")
-                    else:
-                        c2.metric("Fuente", "OpenAI API", "☁️ Live", delta_color="off")
+                    label, detail, color = SOURCE_BADGES.get(source, LIVE_BADGE)
+                    c2.metric("Fuente", label, detail, delta_color=color)
                         
                     cost = metrics.get("cost_usd", 0)
                     c3.metric("Coste", f"${cost:.5f}")
 
+                    ttft = metrics.get("time_to_first_token_ms")
+                    if ttft is not None:
+                        st.caption(f"Primer token en {ttft:.0f} ms · Total {(time.time() - start) * 1000:.0f} ms")
+
                 st.session_state.messages.append({"role": "assistant", "content": answer})
                 
             else:
@@ -1,26 +1,415 @@
-﻿import mlflow
+﻿import asyncio
+import re
 import time
-from openai import OpenAI
-from typing import List, Dict
+from contextlib import aclosing, nullcontext
+from typing import TYPE_CHECKING, Any, AsyncContextManager, AsyncIterator, Callable, List, Dict, Optional, Tuple
 from src.sre.config.settings import get_settings
 from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.tracing import set_trace_attribute, span
+from src.sre.monitoring.metrics import LLM_DEGRADED
+from src.sre.monitoring.tracking import TrackedRun, get_experiment_id, get_tracking_queue
 from src.sre.config.prompts import get_prompt_template, get_system_prompt, get_prompt_metadata
+from src.sre.config.pricing import compute_cost
+from src.sre.generation.model_router import FALLBACK_MODEL, get_model_router
+from src.sre.generation.resilience import (
+    DeadlineExceeded, LLMUnavailable, get_circuit_breaker, get_hedge_budget, guarded_call, hedge_delay, hedged,
+    is_transient, model_deadline
+)
+from src.sre.generation.tokens import PromptPlan, count_tokens, plan_prompt
+from src.sre.utils.lazy import lazy_import
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Dependencias pesadas: se importan al primer uso, no al arrancar el worker
+httpx = lazy_import("httpx")
+mlflow = lazy_import("mlflow")
+openai = lazy_import("openai")
 
 settings = get_settings()
 logger = get_logger("src.generation.llm_client")
 
+# Un cliente async (con su pool de conexiones HTTP keep-alive) por modelo,
+# compartido por todas las peticiones del worker
+_async_clients: Dict[str, "AsyncOpenAI"] = {}
+
+# Hueco de concurrencia para una llamada a un modelo (lo da el control de admisión de la API)
+SlotFactory = Callable[[str], AsyncContextManager]
+
+
+def _no_slot(model_name: str) -> AsyncContextManager:
+    return nullcontext()
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Duración de x-ratelimit-reset-requests ("6m0s", "20ms") en segundos; None si no se entiende."""
+    parts = _DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _rate_limit_hook(model_name: str):
+    """Pasa al router las cabeceras x-ratelimit de cada respuesta de OpenAI."""
+    async def hook(response: "httpx.Response"):
+        remaining = response.headers.get("x-ratelimit-remaining-requests")
+        limit = response.headers.get("x-ratelimit-limit-requests")
+        if remaining and limit and remaining.isdigit() and limit.isdigit():
+            reset = _parse_reset(response.headers.get("x-ratelimit-reset-requests"))
+            get_model_router().record_rate_limit(model_name, int(remaining), int(limit), reset)
+    return hook
+
+
+def get_async_openai_client(model_name: str) -> "AsyncOpenAI":
+    client = _async_clients.get(model_name)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections
+            ),
+            timeout=settings.llm_timeout_seconds,
+            event_hooks={"response": [_rate_limit_hook(model_name)]}
+        )
+        client = _async_clients[model_name] = openai.AsyncOpenAI(
+            api_key=settings.openai_api_key, base_url=settings.openai_base_url, http_client=http_client
+        )
+    return client
+
+
+async def close_async_clients():
+    """Cierra los pools de conexiones (apagado ordenado del worker)."""
+    for client in _async_clients.values():
+        await client.close()
+    _async_clients.clear()
+
+
 class RAGModel:
     def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.3):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.client = openai.OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
         self.model_name = model_name
         self.temperature = temperature
         self.prompt_metadata = get_prompt_metadata()
-        
-        mlflow.set_tracking_uri(settings.mlflow_tracking_uri)
-        mlflow.set_experiment(settings.mlflow_experiment_name)
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        return get_async_openai_client(self.model_name)
+
+    def _build_prompts(self, query: str, context_chunks: List[str]) -> PromptPlan:
+        # --- Construcción del Prompt (dentro del presupuesto de tokens del modelo) ---
+        with span("llm.prompt_plan", model=self.model_name) as s:
+            plan = plan_prompt(
+                self.model_name,
+                get_system_prompt("cte_expert"),
+                get_prompt_template("rag"),
+                query,
+                context_chunks
+            )
+            s.set("input_tokens", plan.input_tokens)
+        logger.debug(
+            "rag_prompt_planned",
+            model=self.model_name,
+            input_tokens=plan.input_tokens,
+            max_tokens=plan.max_tokens,
+            chunks_used=plan.chunks_used,
+            chunks_dropped=plan.chunks_dropped,
+            estimated_cost_usd=plan.estimated_cost(self.model_name)
+        )
+        return plan
+
+    def estimate_cost(self, query: str, context_chunks: List[str]) -> float:
+        """Coste máximo de una llamada (prompt + max_tokens), sin hacerla."""
+        return self._build_prompts(query, context_chunks).estimated_cost(self.model_name)
+
+    def _compute_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return compute_cost(self.model_name, input_tokens, output_tokens)
+
+    def _build_result(self, answer: str, latency_ms: float, usage, run_id: str, plan: PromptPlan) -> Dict:
+        # Sin usage (algunos streams) se usan los tokens contados en local
+        input_tokens = usage.prompt_tokens if usage is not None else plan.input_tokens
+        output_tokens = usage.completion_tokens if usage is not None else count_tokens(answer, self.model_name)
+        return {
+            "answer": answer,
+            "metrics": {
+                "latency_ms": latency_ms,
+                "cost_usd": self._compute_cost(input_tokens, output_tokens),
+                "tokens": input_tokens + output_tokens,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens
+            },
+            "metadata": {
+                "model": self.model_name,
+                "prompt_version": self.prompt_metadata["version"],
+                "run_id": run_id,
+                "context_chunks_used": plan.chunks_used,
+                "context_chunks_dropped": plan.chunks_dropped
+            }
+        }
+
+    def _track(self, run_name: str, plan: PromptPlan, result: Dict) -> str:
+        """Encola el run para MLflow (escritor en segundo plano) y devuelve su id."""
+        with span("tracking.enqueue") as s:
+            run_id = self._submit_run(run_name, plan, result)
+            s.set("run_id", run_id)
+        set_trace_attribute("run_id", run_id)
+        return run_id
+
+    def _submit_run(self, run_name: str, plan: PromptPlan, result: Dict) -> str:
+        run = TrackedRun(
+            run_name=run_name,
+            params={
+                "prompt_version": self.prompt_metadata["version"],
+                "prompt_updated": self.prompt_metadata["last_updated"],
+                "model": self.model_name,
+                "temperature": self.temperature,
+                "num_chunks": plan.chunks_used,
+                "chunks_dropped": plan.chunks_dropped,
+                "max_tokens": plan.max_tokens
+            },
+            metrics={
+                "latency_ms": result["metrics"]["latency_ms"],
+                "total_tokens": result["metrics"]["tokens"],
+                "input_tokens": result["metrics"]["input_tokens"],
+                "output_tokens": result["metrics"]["output_tokens"],
+                "cost_usd": result["metrics"]["cost_usd"],
+                "estimated_cost_usd": plan.estimated_cost(self.model_name),
+                "time_to_first_token_ms": result["metrics"].get("time_to_first_token_ms")
+            },
+            artifacts={
+                "final_prompt.txt": plan.user_prompt,
+                "system_prompt.txt": plan.system_prompt,
+                "response.txt": result["answer"]
+            }
+        )
+        get_tracking_queue().submit(run)
+        return run.request_id
+
+    async def _acomplete(self, plan: PromptPlan):
+        """Una llamada a chat.completions con el plazo y el circuito del modelo."""
+        return await guarded_call(self.model_name, lambda: self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=plan.messages,
+            temperature=self.temperature,
+            max_tokens=plan.max_tokens
+        ))
+
+    def _hedge_model(self) -> "RAGModel":
+        """Contra quién se lanza el hedge: el modelo barato o una copia de la misma llamada."""
+        if settings.llm_hedge_target == "fallback" and self.model_name != FALLBACK_MODEL:
+            return get_rag_model(FALLBACK_MODEL)
+        return self
+
+    def _can_degrade(self, error: Exception) -> bool:
+        # Solo fallos del proveedor (caída, saturación, plazo); no errores de la petición
+        return settings.llm_degrade_enabled and self.model_name != FALLBACK_MODEL and is_transient(error)
+
+    async def agenerate_response(
+        self,
+        query: str,
+        context_chunks: List[str],
+        run_name: str = None,
+        resilient: bool = True,
+        slot: Optional[SlotFactory] = None
+    ) -> Dict:
+        """
+        Versión async: no bloquea el event loop mientras espera a OpenAI.
+
+        Con resilient=False no hay hedge ni degradación: una sola llamada al modelo pedido,
+        para quien presupuesta el gasto de cada llamada (calentamiento de caché).
+        slot(modelo) da el hueco de concurrencia de cada llamada, también de hedges y degradaciones.
+        """
+        slot = slot or _no_slot
+        try:
+            async with slot(self.model_name):
+                return await self._agenerate(query, context_chunks, run_name, hedge_enabled=resilient, slot=slot)
+        except Exception as e:
+            if not resilient or not self._can_degrade(e):
+                raise
+            LLM_DEGRADED.labels(model=self.model_name, fallback="model").inc()
+            logger.warning("llm_degraded", model=self.model_name, fallback=FALLBACK_MODEL, error=str(e))
+            # El modelo de respaldo ocupa un hueco suyo, no el del modelo que ha fallado
+            async with slot(FALLBACK_MODEL):
+                result = await get_rag_model(FALLBACK_MODEL)._agenerate(query, context_chunks, run_name, slot=slot)
+            result["metadata"]["degraded_from"] = self.model_name
+            return result
+
+    async def _agenerate(
+        self,
+        query: str,
+        context_chunks: List[str],
+        run_name: str = None,
+        hedge_enabled: bool = True,
+        slot: SlotFactory = _no_slot
+    ) -> Dict:
+        start_time = time.time()
+        plan = self._build_prompts(query, context_chunks)
+
+        async def primary():
+            return self, plan, await self._acomplete(plan)
+
+        hedge, delay = None, None
+        if hedge_enabled and settings.llm_hedge_enabled:
+            # Sin respuesta en el p95 del modelo, se lanza otra llamada y gana la primera
+            delay = hedge_delay(self.model_name)
+            hedge_model = self._hedge_model()
+
+            async def hedge():
+                # Otra llamada en vuelo: necesita su hueco (si se rechaza, sigue la principal)
+                async with slot(hedge_model.model_name):
+                    hedge_plan = plan if hedge_model is self else hedge_model._build_prompts(query, context_chunks)
+                    return hedge_model, hedge_plan, await hedge_model._acomplete(hedge_plan)
+
+        try:
+            # --- Llamada LLM (cliente compartido con pool de conexiones) ---
+            with span("llm.completion", model=self.model_name, max_tokens=plan.max_tokens) as s:
+                (model, plan, response), hedge_won = await hedged(
+                    self.model_name, primary, hedge, delay, get_hedge_budget()
+                )
+                if hedge_won:
+                    s.set("hedge_won_by", model.model_name)
+        except Exception as e:
+            logger.error("rag_generation_failed", model=self.model_name, error=str(e))
+            raise e
+
+        latency_ms = (time.time() - start_time) * 1000
+        # Si ganó el hedge, el coste y el modelo son los de la llamada que respondió
+        result = model._build_result(response.choices[0].message.content, latency_ms, response.usage, None, plan)
+        if hedge_won:
+            result["metadata"]["hedged_from"] = self.model_name
+
+        # --- Tracking en MLflow (fuera del camino de la petición) ---
+        result["metadata"]["run_id"] = model._track(run_name, plan, result)
+
+        logger.info(
+            "rag_generation_complete",
+            prompt_version=self.prompt_metadata["version"],
+            model=model.model_name,
+            latency_ms=latency_ms,
+            cost_usd=result["metrics"]["cost_usd"]
+        )
+        return result
+
+    async def astream_response(
+        self, query: str, context_chunks: List[str], run_name: str = None, slot: Optional[SlotFactory] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Genera la respuesta en streaming.
+
+        Produce ("token", texto) a medida que llegan los tokens y, al final,
+        ("done", resultado) con el mismo formato que agenerate_response.
+        """
+        slot = slot or _no_slot
+        sent = False
+        try:
+            get_circuit_breaker(self.model_name).check()
+            # aclosing: si el cliente se va, el stream de OpenAI se cierra antes de soltar el hueco
+            async with slot(self.model_name), aclosing(self._astream(query, context_chunks, run_name)) as events:
+                async for item in events:
+                    sent = True
+                    yield item
+        except LLMUnavailable as e:
+            if sent or not self._can_degrade(e):
+                raise
+            # Circuito abierto o sin primer token a tiempo: aún no se ha enviado nada y
+            # el stream sale entero del modelo barato (con su hueco)
+            LLM_DEGRADED.labels(model=self.model_name, fallback="model").inc()
+            logger.warning("llm_degraded", model=self.model_name, fallback=FALLBACK_MODEL, error=str(e))
+            async for item in get_rag_model(FALLBACK_MODEL).astream_response(query, context_chunks, run_name, slot):
+                yield item
+
+    async def _within(self, awaitable, timeout: float):
+        """Espera con plazo; al agotarse, DeadlineExceeded (cuenta como fallo del modelo)."""
+        try:
+            return await asyncio.wait_for(awaitable, max(0.0, timeout))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(self.model_name, "deadline_exceeded", timeout) from None
+
+    async def _astream(self, query: str, context_chunks: List[str], run_name: str) -> AsyncIterator[Tuple[str, Any]]:
+        breaker = get_circuit_breaker(self.model_name)
+        start_time = time.time()
+        plan = self._build_prompts(query, context_chunks)
+        parts: List[str] = []
+        usage = None
+        first_token_ms = None
+        # El plazo del modelo cubre hasta el primer token; después, el silencio entre chunks
+        first_token_by = time.monotonic() + model_deadline(self.model_name)
+
+        try:
+            # Incluye el tiempo de envío de cada token al cliente (el generador se pausa en yield)
+            with span("llm.stream", model=self.model_name, max_tokens=plan.max_tokens) as s:
+                stream = await self._within(
+                    self.async_client.chat.completions.create(
+                        model=self.model_name,
+                        messages=plan.messages,
+                        temperature=self.temperature,
+                        max_tokens=plan.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    ),
+                    first_token_by - time.monotonic()
+                )
+                chunks = stream.__aiter__()
+                finished = False
+                try:
+                    while True:
+                        if first_token_ms is None:
+                            timeout = first_token_by - time.monotonic()
+                        else:
+                            timeout = settings.llm_stream_idle_seconds
+                        try:
+                            chunk = await self._within(chunks.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            finished = True
+                            break
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first_token_ms is None:
+                                first_token_ms = (time.time() - start_time) * 1000
+                                s.set("time_to_first_token_ms", first_token_ms)
+                            parts.append(chunk.choices[0].delta.content)
+                            yield "token", chunk.choices[0].delta.content
+                finally:
+                    if not finished:
+                        # Plazo, error o cliente desconectado: se corta la conexión para que
+                        # OpenAI deje de generar (y cobrar) y el pool la recupere
+                        await stream.close()
+        except Exception as e:
+            logger.error("rag_generation_failed", error=str(e))
+            if not is_transient(e):
+                # Error de la petición: ni fallo ni éxito del modelo
+                breaker.record_cancelled()
+                raise
+            breaker.record_failure()
+            get_model_router().record(self.model_name, (time.time() - start_time) * 1000, ok=False)
+            raise
+        except BaseException:
+            # Cliente desconectado a mitad del stream: no cuenta contra el modelo
+            breaker.record_cancelled()
+            raise
+
+        breaker.record_success()
+        latency_ms = (time.time() - start_time) * 1000
+        get_model_router().record(self.model_name, latency_ms)
+        result = self._build_result("".join(parts), latency_ms, usage, None, plan)
+        result["metrics"]["time_to_first_token_ms"] = first_token_ms
+        result["metadata"]["run_id"] = self._track(run_name, plan, result)
+
+        logger.info(
+            "rag_generation_complete",
+            prompt_version=self.prompt_metadata["version"],
+            latency_ms=latency_ms,
+            time_to_first_token_ms=first_token_ms,
+            cost_usd=result["metrics"]["cost_usd"]
+        )
+        yield "done", result
 
     def generate_response(self, query: str, context_chunks: List[str], run_name: str = None) -> Dict:
-        
+        get_experiment_id()
+
         with mlflow.start_run(run_name=run_name) as run:
             start_time = time.time()
             
@@ -28,81 +417,63 @@ class RAGModel:
             mlflow.log_param("prompt_version", self.prompt_metadata["version"])
             mlflow.log_param("prompt_updated", self.prompt_metadata["last_updated"])
             
-            # --- Construcción del Prompt ---
-            context_text = "\n\n".join(context_chunks)
-            system_prompt = get_system_prompt("cte_expert")
-            prompt_template = get_prompt_template("rag")
-            user_prompt = prompt_template.format(context=context_text, query=query)
+            plan = self._build_prompts(query, context_chunks)
             
             # --- Logueo de Parámetros ---
             mlflow.log_param("model", self.model_name)
             mlflow.log_param("temperature", self.temperature)
-            mlflow.log_param("num_chunks", len(context_chunks))
+            mlflow.log_param("num_chunks", plan.chunks_used)
+            mlflow.log_param("max_tokens", plan.max_tokens)
             
-            mlflow.log_text(user_prompt, "final_prompt.txt")
-            mlflow.log_text(system_prompt, "system_prompt.txt")
+            mlflow.log_text(plan.user_prompt, "final_prompt.txt")
+            mlflow.log_text(plan.system_prompt, "system_prompt.txt")
 
+            breaker = get_circuit_breaker(self.model_name)
+            breaker.check()
             try:
-                # --- Llamada LLM ---
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=self.temperature,
-                    max_tokens=1000
-                )
-                
-                answer = response.choices[0].message.content
+                # --- Llamada LLM (con el plazo del modelo) ---
+                try:
+                    response = self.client.chat.completions.create(
+                        model=self.model_name,
+                        messages=plan.messages,
+                        temperature=self.temperature,
+                        max_tokens=plan.max_tokens,
+                        timeout=model_deadline(self.model_name)
+                    )
+                except Exception:
+                    breaker.record_failure()
+                    raise
+                breaker.record_success()
                 
                 # --- Métricas ---
                 latency_ms = (time.time() - start_time) * 1000
-                input_tokens = response.usage.prompt_tokens
-                output_tokens = response.usage.completion_tokens
-                total_tokens = response.usage.total_tokens
-                
-                if "gpt-4" in self.model_name:
-                    cost_usd = (input_tokens / 1000 * 0.03) + (output_tokens / 1000 * 0.06)
-                else:
-                    cost_usd = (input_tokens / 1000 * 0.0005) + (output_tokens / 1000 * 0.0015)
+                result = self._build_result(
+                    response.choices[0].message.content, latency_ms, response.usage, run.info.run_id, plan
+                )
 
                 mlflow.log_metric("latency_ms", latency_ms)
-                mlflow.log_metric("total_tokens", total_tokens)
-                mlflow.log_metric("cost_usd", cost_usd)
+                mlflow.log_metric("total_tokens", result["metrics"]["tokens"])
+                mlflow.log_metric("cost_usd", result["metrics"]["cost_usd"])
                 
-                mlflow.log_text(answer, "response.txt")
+                mlflow.log_text(result["answer"], "response.txt")
                 
                 logger.info(
                     "rag_generation_complete",
                     query=query,
                     prompt_version=self.prompt_metadata["version"],
                     latency_ms=latency_ms,
-                    cost_usd=cost_usd
+                    cost_usd=result["metrics"]["cost_usd"]
                 )
                 
-                return {
-                    "answer": answer,
-                    "metrics": {
-                        "latency_ms": latency_ms, 
-                        "cost_usd": cost_usd, 
-                        "tokens": total_tokens
-                    },
-                    "metadata": {
-                        "model": self.model_name, 
-                        "prompt_version": self.prompt_metadata["version"],
-                        "run_id": run.info.run_id
-                    }
-                }
+                return result
 
             except Exception as e:
                 logger.error("rag_generation_failed", error=str(e))
                 raise e
 
-# Singleton
-_model_instance = None
-def get_rag_model() -> RAGModel:
-    global _model_instance
-    if _model_instance is None:
-        _model_instance = RAGModel()
-    return _model_instance
+# Singleton (una instancia por modelo)
+_model_instances: Dict[str, RAGModel] = {}
+def get_rag_model(model_name: str = "gpt-3.5-turbo") -> RAGModel:
+    if model_name not in _model_instances:
+        _model_instances[model_name] = RAGModel(model_name=model_name)
+    return _model_instances[model_name]
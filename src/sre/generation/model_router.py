@@ -1,39 +1,186 @@
-from typing import Literal
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Literal, Optional, Tuple
+from src.sre.config.settings import get_settings
+
+settings = get_settings()
 
 ModelType = Literal["gpt-4", "gpt-3.5-turbo"]
 
+# Modelo rápido al que se desvían las consultas cuando el lento no cumple el SLO
+FALLBACK_MODEL: ModelType = "gpt-3.5-turbo"
+
+# Palabras clave de preguntas que requieren razonamiento profundo (y respuestas largas)
+COMPLEX_KEYWORDS = (
+    "compara", "diferencia", "analiza", "evalúa",
+    "razonamiento", "pros y contras", "tabla comparativa",
+    "explicación detallada", "resumen ejecutivo"
+)
+
+
+def is_complex_query(query: str) -> bool:
+    query_lower = query.lower()
+    return any(keyword in query_lower for keyword in COMPLEX_KEYWORDS)
+
+
+@dataclass
+class RoutingDecision:
+    model: ModelType
+    reason: str
+
+
+class ModelStats:
+    """Estadísticas vivas de un modelo: EWMA, p95 y tasa de errores en ventana deslizante."""
+
+    def __init__(self, window_seconds: float = None, max_samples: int = None, alpha: float = None):
+        self.window_seconds = window_seconds or settings.routing_window_seconds
+        self.alpha = alpha or settings.routing_ewma_alpha
+        self.ewma_ms: Optional[float] = None
+        # (instante, latencia_ms, ok)
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max_samples or settings.routing_max_samples)
+        # (válido_hasta, restantes, límite): la última lectura de las cabeceras caduca
+        self._ratelimit: Optional[Tuple[float, int, int]] = None
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, ok: bool = True):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency_ms, ok))
+            if ok:
+                self.ewma_ms = latency_ms if self.ewma_ms is None else (
+                    self.alpha * latency_ms + (1 - self.alpha) * self.ewma_ms
+                )
+
+    def record_rate_limit(self, remaining: int, limit: int, reset_seconds: Optional[float] = None):
+        """Cabeceras x-ratelimit: valen hasta que OpenAI repone el cupo o, como mucho, una ventana."""
+        ttl = self.window_seconds if reset_seconds is None else min(reset_seconds, self.window_seconds)
+        with self._lock:
+            self._ratelimit = (time.monotonic() + ttl, remaining, limit)
+
+    def _window(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return self._samples
+
+    @property
+    def sample_count(self) -> int:
+        with self._lock:
+            return len(self._window())
+
+    @property
+    def p95_ms(self) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(latency for _, latency, ok in self._window() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            samples = self._window()
+            return sum(not ok for _, _, ok in samples) / len(samples) if samples else 0.0
+
+    @property
+    def ratelimit_fraction(self) -> Optional[float]:
+        """Fracción del límite de peticiones que queda (cabeceras x-ratelimit de OpenAI)."""
+        with self._lock:
+            observed = self._ratelimit
+        if observed is None:
+            return None
+        valid_until, remaining, limit = observed
+        if not limit or time.monotonic() >= valid_until:
+            return None
+        return remaining / limit
+
+    def expected_latency_ms(self) -> Optional[float]:
+        """Estimación conservadora: la peor entre la EWMA y el p95 reciente."""
+        if self.sample_count < settings.routing_min_samples:
+            return None
+        estimates = [value for value in (self.ewma_ms, self.p95_ms) if value is not None]
+        return max(estimates) if estimates else None
+
+
 class ModelRouter:
     """Decide qué modelo usar según la query."""
-    
-    def route(self, query: str, context_chunks: list) -> ModelType:
+
+    def __init__(self):
+        self.stats: Dict[str, ModelStats] = {}
+
+    def model_stats(self, model: str) -> ModelStats:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats()
+        return stats
+
+    def record(self, model: str, latency_ms: float, ok: bool = True):
+        """Resultado de una llamada al LLM (lo registra llm_client)."""
+        self.model_stats(model).record(latency_ms, ok)
+
+    def record_rate_limit(self, model: str, remaining: int, limit: int, reset_seconds: Optional[float] = None):
+        self.model_stats(model).record_rate_limit(remaining, limit, reset_seconds)
+
+    def _static_route(self, query: str, context_chunks: list) -> RoutingDecision:
         """
         Estrategia de Routing:
         - GPT-4: Si hay palabras clave de complejidad o mucho contexto.
         - GPT-3.5: Para todo lo demás (ahorro de costes).
         """
-        
+
         # 1. Palabras clave que requieren razonamiento profundo
-        complex_keywords = [
-            "compara", "diferencia", "analiza", "evalúa", 
-            "razonamiento", "pros y contras", "tabla comparativa",
-            "explicación detallada", "resumen ejecutivo"
-        ]
-        
-        query_lower = query.lower()
-        if any(keyword in query_lower for keyword in complex_keywords):
-            return "gpt-4"
+        if is_complex_query(query):
+            return RoutingDecision("gpt-4", "complex_keywords")
 
         # 2. Si la pregunta es muy larga, mejor GPT-4 para no perder el hilo
         if len(query) > 250:
-            return "gpt-4"
-            
+            return RoutingDecision("gpt-4", "long_query")
+
         # 3. Si hay MUCHO contexto recuperado, GPT-4 suele manejarlo mejor
         total_context_length = sum(len(chunk) for chunk in context_chunks)
         if total_context_length > 3000:
-            return "gpt-4"
+            return RoutingDecision("gpt-4", "large_context")
 
         # Default: Ahorrar dinero con el modelo rápido
-        return "gpt-3.5-turbo"
+        return RoutingDecision("gpt-3.5-turbo", "default")
+
+    def _slo_fallback_reason(self, model: str, latency_budget_ms: Optional[float]) -> Optional[str]:
+        """Motivo para no usar `model` ahora mismo (None si está sano)."""
+        stats = self.model_stats(model)
+        fallback = self.model_stats(FALLBACK_MODEL)
+
+        fraction = stats.ratelimit_fraction
+        if fraction is not None and fraction < settings.routing_min_ratelimit_fraction:
+            return "rate_limit"
+
+        if stats.sample_count >= settings.routing_min_samples and stats.error_rate > settings.routing_max_error_rate:
+            if fallback.error_rate < stats.error_rate:
+                return "error_rate"
+
+        if latency_budget_ms:
+            expected = stats.expected_latency_ms()
+            if expected is not None and expected > latency_budget_ms:
+                fallback_expected = fallback.expected_latency_ms()
+                # Sin datos del rápido se asume que es más rápido (lo es por diseño)
+                if fallback_expected is None or fallback_expected < expected:
+                    return "latency_budget"
+        return None
+
+    def decide(self, query: str, context_chunks: list, latency_budget_ms: float = None) -> RoutingDecision:
+        """Routing estático y, en modo adaptativo, desvío al modelo rápido si el lento no cumple el SLO."""
+        decision = self._static_route(query, context_chunks)
+        if not settings.adaptive_routing_enabled or decision.model == FALLBACK_MODEL:
+            return decision
+        if latency_budget_ms is None:
+            latency_budget_ms = settings.routing_latency_budget_ms or None
+        reason = self._slo_fallback_reason(decision.model, latency_budget_ms)
+        if reason:
+            return RoutingDecision(FALLBACK_MODEL, f"slo_{reason}")
+        return decision
+
+    def route(self, query: str, context_chunks: list, latency_budget_ms: float = None) -> ModelType:
+        return self.decide(query, context_chunks, latency_budget_ms).model
 
 # Singleton
 _router_instance = None
@@ -41,4 +188,4 @@ def get_model_router() -> ModelRouter:
     global _router_instance
     if _router_instance is None:
         _router_instance = ModelRouter()
-    return _router_instance
\ No newline at end of file
+    return _router_instance
@@ -0,0 +1,257 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from src.sre.config.settings import get_settings
+from src.sre.generation.model_router import get_model_router
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import CIRCUIT_REJECTED, CIRCUIT_STATE, LLM_HEDGES
+from src.sre.utils.lazy import lazy_import
+
+settings = get_settings()
+logger = get_logger("src.generation.resilience")
+
+openai = lazy_import("openai")
+
+T = TypeVar("T")
+
+# Valor del gauge rag_circuit_state
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class LLMUnavailable(Exception):
+    """El modelo no puede responder ahora (circuito abierto o plazo agotado)."""
+
+    def __init__(self, model: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"{model}: {reason}")
+        self.model = model
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class CircuitOpen(LLMUnavailable):
+    pass
+
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Fallo del proveedor (plazo, conexión, 429, 5xx): cuenta para el circuito y permite
+    degradar. Los errores de la petición (400, 401, 404, contexto excesivo) no dicen
+    nada de la salud del modelo.
+    """
+    if isinstance(error, (LLMUnavailable, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _parse_seconds(raw: str) -> Dict[str, float]:
+    """"gpt-4=45,gpt-3.5-turbo=20" -> {"gpt-4": 45.0, "gpt-3.5-turbo": 20.0}"""
+    values = {}
+    for item in raw.split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            values[model.strip()] = float(value)
+    return values
+
+
+def model_deadline(model: str) -> float:
+    """Plazo máximo de una llamada al modelo, en segundos."""
+    return _parse_seconds(settings.llm_model_deadlines).get(model, settings.llm_deadline_seconds)
+
+
+class CircuitBreaker:
+    """
+    Circuito por modelo: tras `failure_threshold` fallos seguidos se abre y las
+    llamadas fallan al momento; pasado `reset_seconds` deja pasar una de prueba
+    (half_open) que lo cierra si sale bien o lo vuelve a abrir si falla.
+    """
+
+    def __init__(self, model: str, failure_threshold: int = None, reset_seconds: float = None):
+        self.model = model
+        self.failure_threshold = failure_threshold or settings.circuit_failure_threshold
+        self.reset_seconds = settings.circuit_reset_seconds if reset_seconds is None else reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(model=model).set(CIRCUIT_STATES[self.state])
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("circuit_state_changed", model=self.model, previous=self.state, state=state)
+            self.state = state
+            CIRCUIT_STATE.labels(model=self.model).set(CIRCUIT_STATES[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and self.retry_after() <= 0:
+                self._set_state("half_open")
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def check(self):
+        """Lanza CircuitOpen si el modelo no admite llamadas ahora."""
+        if not self.allow():
+            CIRCUIT_REJECTED.labels(model=self.model).inc()
+            raise CircuitOpen(self.model, "circuit_open", self.retry_after() or 1.0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def record_cancelled(self):
+        # Llamada cancelada (p. ej. el hedge perdedor): ni éxito ni fallo
+        with self._lock:
+            self._probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(model)
+    return breaker
+
+
+async def guarded_call(model: str, call: Callable[[], Awaitable[T]]) -> T:
+    """Una llamada al modelo con su plazo y su circuito (y sus estadísticas para el router)."""
+    breaker = get_circuit_breaker(model)
+    breaker.check()
+    deadline = model_deadline(model)
+    start = time.monotonic()
+    try:
+        result = await asyncio.wait_for(call(), deadline)
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        get_model_router().record(model, deadline * 1000, ok=False)
+        raise DeadlineExceeded(model, "deadline_exceeded", deadline)
+    except asyncio.CancelledError:
+        breaker.record_cancelled()
+        raise
+    except Exception as e:
+        if not is_transient(e):
+            # Error de la petición: ni fallo ni éxito del modelo
+            breaker.record_cancelled()
+            raise
+        breaker.record_failure()
+        get_model_router().record(model, (time.monotonic() - start) * 1000, ok=False)
+        raise
+    breaker.record_success()
+    get_model_router().record(model, (time.monotonic() - start) * 1000)
+    return result
+
+
+class HedgeBudget:
+    """Presupuesto de hedges: cada llamada suma `ratio` tokens y cada hedge gasta uno."""
+
+    def __init__(self, ratio: float = None, max_tokens: float = 10.0):
+        self.ratio = settings.llm_hedge_budget_ratio if ratio is None else ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def on_call(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+def hedge_delay(model: str) -> Optional[float]:
+    """Cuándo lanzar el hedge: el p95 reciente del modelo (None si aún no hay datos)."""
+    stats = get_model_router().model_stats(model)
+    if stats.sample_count < settings.routing_min_samples:
+        return None
+    p95_ms = stats.p95_ms
+    if p95_ms is None:
+        return None
+    return max(settings.llm_hedge_min_delay_seconds, p95_ms / 1000)
+
+
+async def hedged(
+    model: str,
+    primary: Callable[[], Awaitable[T]],
+    hedge: Optional[Callable[[], Awaitable[T]]],
+    delay: Optional[float],
+    budget: HedgeBudget
+) -> Tuple[T, bool]:
+    """
+    Lanza `primary` y, si no ha respondido en `delay` segundos, también `hedge`:
+    gana la primera que termine bien y la otra se cancela. Devuelve (resultado,
+    ganó_el_hedge). Si fallan las dos, se propaga el error de la principal.
+    """
+    budget.on_call()
+    first = asyncio.ensure_future(primary())
+    if hedge is None or delay is None:
+        return await first, False
+
+    second = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result(), False
+        if not budget.try_spend():
+            LLM_HEDGES.labels(model=model, outcome="skipped_budget").inc()
+            return await first, False
+
+        LLM_HEDGES.labels(model=model, outcome="launched").inc()
+        second = asyncio.ensure_future(hedge())
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    won = task is second
+                    LLM_HEDGES.labels(model=model, outcome="won" if won else "lost").inc()
+                    return task.result(), won
+        raise first.exception()
+    finally:
+        tasks = [task for task in (first, second) if task is not None]
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # Se espera a que la perdedora limpie (circuito, hueco) y se recogen sus errores
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Singleton
+_hedge_budget_instance = None
+def get_hedge_budget() -> HedgeBudget:
+    global _hedge_budget_instance
+    if _hedge_budget_instance is None:
+        _hedge_budget_instance = HedgeBudget()
+    return _hedge_budget_instance
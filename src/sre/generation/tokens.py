@@ -0,0 +1,165 @@
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+from src.sre.config.pricing import compute_cost, get_model_pricing
+from src.sre.config.settings import get_settings
+from src.sre.generation.model_router import is_complex_query
+
+settings = get_settings()
+
+try:
+    import tiktoken
+except ImportError:  # Está en las dependencias; sin instalar se usa una estimación por caracteres
+    tiktoken = None
+
+# Estimación sin tokenizador: ~3,5 caracteres por token en español (algo por exceso,
+# que para un presupuesto es el lado seguro)
+CHARS_PER_TOKEN = 3.5
+# Formato de chat de OpenAI: tokens fijos por mensaje y para iniciar la respuesta
+TOKENS_PER_MESSAGE = 4
+TOKENS_REPLY_PRIMING = 3
+# Un chunk recortado por debajo de esto no aporta contexto útil: se descarta
+MIN_TRIMMED_CHUNK_TOKENS = 64
+CONTEXT_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str, model_name: str = "gpt-3.5-turbo") -> int:
+    """Tokens de un texto (memoizado: los mismos chunks se repiten entre peticiones)."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model_name: str) -> int:
+    """Tokens de entrada de una llamada de chat (contenido + formato de los mensajes)."""
+    return TOKENS_REPLY_PRIMING + sum(
+        TOKENS_PER_MESSAGE + count_tokens(message["content"], model_name) for message in messages
+    )
+
+
+def _trim_to_tokens(text: str, max_tokens: int, model_name: str) -> str:
+    """Recorta un texto por el final (en un espacio) hasta que quepa en max_tokens."""
+    encoding = _get_encoding(model_name)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    trimmed = text[:int(max_tokens * CHARS_PER_TOKEN)]
+    cut = trimmed.rfind(" ")
+    return trimmed[:cut] if cut > len(trimmed) // 2 else trimmed
+
+
+@dataclass
+class PromptPlan:
+    """Prompt final con su coste conocido antes de llamar al modelo."""
+    system_prompt: str
+    user_prompt: str
+    input_tokens: int
+    max_tokens: int
+    chunks_used: int
+    chunks_dropped: int = 0
+    chunks_trimmed: int = 0
+    messages: List[Dict[str, str]] = field(default_factory=list)
+
+    def estimated_cost(self, model_name: str) -> float:
+        """Coste de la entrada más el peor caso de la salida (max_tokens)."""
+        return compute_cost(model_name, self.input_tokens, self.max_tokens)
+
+
+def input_token_budget(model_name: str) -> int:
+    pricing = get_model_pricing(model_name)
+    budget = settings.llm_max_input_tokens or pricing["max_input_tokens"]
+    # La respuesta también ocupa ventana de contexto
+    return min(budget, pricing["context_window"] - settings.llm_min_output_tokens)
+
+
+def output_token_cap(query: str, context_tokens: int) -> int:
+    """
+    Tope de la respuesta según el tipo de pregunta y el contexto que llega al modelo.
+
+    Una pregunta simple con poco contexto no necesita 1000 tokens de salida: el tope crece
+    con el contexto usado (la mitad de sus tokens sobre el mínimo) hasta el del tipo de pregunta.
+    """
+    type_cap = settings.llm_output_tokens_complex if is_complex_query(query) else settings.llm_output_tokens_default
+    return min(type_cap, settings.llm_min_output_tokens + context_tokens // 2)
+
+
+def adaptive_max_tokens(model_name: str, input_tokens: int, cap: Optional[int] = None) -> int:
+    """
+    max_tokens según el tope del modelo, el de la pregunta y el hueco que deja el prompt en la ventana.
+
+    Nunca pasa del hueco real: la API rechaza prompt + max_tokens por encima de la ventana.
+    plan_prompt ya recorta el contexto para dejar al menos llm_min_output_tokens.
+    """
+    pricing = get_model_pricing(model_name)
+    headroom = pricing["context_window"] - input_tokens
+    limit = min(pricing["max_output_tokens"], cap) if cap else pricing["max_output_tokens"]
+    return max(1, min(limit, headroom))
+
+
+def plan_prompt(
+    model_name: str,
+    system_prompt: str,
+    template: str,
+    query: str,
+    context_chunks: List[str],
+    budget: Optional[int] = None
+) -> PromptPlan:
+    """
+    Construye el prompt respetando el presupuesto de tokens de entrada del modelo.
+
+    Los chunks llegan ordenados por relevancia: se añaden en orden mientras quepan;
+    el primero que no cabe se recorta (si queda hueco útil) y los siguientes se descartan.
+    """
+    budget = budget or input_token_budget(model_name)
+    base_messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": template.format(context="", query=query)}
+    ]
+    used_tokens = count_message_tokens(base_messages, model_name)
+    base_tokens = used_tokens
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR, model_name)
+
+    selected: List[str] = []
+    trimmed = 0
+    for chunk in context_chunks:
+        cost = count_tokens(chunk, model_name) + (separator_tokens if selected else 0)
+        if used_tokens + cost <= budget:
+            selected.append(chunk)
+            used_tokens += cost
+            continue
+        room = budget - used_tokens - (separator_tokens if selected else 0)
+        if room >= MIN_TRIMMED_CHUNK_TOKENS:
+            selected.append(_trim_to_tokens(chunk, room, model_name))
+            trimmed = 1
+            used_tokens = budget  # el recorte llena el hueco restante
+        break
+
+    user_prompt = template.format(context=CONTEXT_SEPARATOR.join(selected), query=query)
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+    input_tokens = count_message_tokens(messages, model_name)
+    return PromptPlan(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        input_tokens=input_tokens,
+        max_tokens=adaptive_max_tokens(
+            model_name, input_tokens, cap=output_token_cap(query, used_tokens - base_tokens)
+        ),
+        chunks_used=len(selected),
+        chunks_dropped=len(context_chunks) - len(selected),
+        chunks_trimmed=trimmed,
+        messages=messages
+    )
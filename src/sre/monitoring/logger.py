@@ -1,36 +1,158 @@
-﻿import structlog
+﻿import atexit
+import json
 import logging
+import queue
+import random
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Tuple
+import structlog
 from src.sre.config.settings import get_settings
+from src.sre.monitoring.metrics import LOGS_DROPPED
+
+try:
+    import orjson
+except ImportError:  # está en las dependencias; sin instalar, json de la librería estándar
+    orjson = None
 
 settings = get_settings()
 
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+
+
+def _dumps(obj, **kwargs) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=str, ensure_ascii=False)
+
+
+def _parse_rules(raw: str) -> Dict[str, float]:
+    """"request_received=0.1,cache_hit=0.5" -> {"request_received": 0.1, "cache_hit": 0.5}"""
+    rules = {}
+    for item in raw.split(","):
+        if "=" in item:
+            event, value = item.split("=", 1)
+            rules[event.strip()] = float(value)
+    return rules
+
+
+class EventSampler:
+    """
+    Procesador de structlog: muestreo y límite de ritmo por tipo de evento, para que
+    los eventos de alto volumen (request_received, cache_hit...) no saturen la salida.
+    Los avisos y errores no se descartan nunca.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, float]):
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        # evento -> (tokens disponibles, último relleno)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _allow(self, event: str, limit: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(event, (limit, now))
+            tokens = min(limit, tokens + (now - last) * limit)
+            allowed = tokens >= 1.0
+            self._buckets[event] = (tokens - 1.0 if allowed else tokens, now)
+        return allowed
+
+    def __call__(self, logger, method_name: str, event_dict: dict) -> dict:
+        if method_name in ("warning", "error", "critical", "exception"):
+            return event_dict
+        event = event_dict.get("event")
+        rate = self.sample_rates.get(event)
+        if rate is not None and rate < 1.0 and random.random() >= rate:
+            LOGS_DROPPED.labels(reason="sampled").inc()
+            raise structlog.DropEvent
+        limit = self.rate_limits.get(event)
+        if limit and not self._allow(event, limit):
+            LOGS_DROPPED.labels(reason="rate_limited").inc()
+            raise structlog.DropEvent
+        if rate is not None and rate < 1.0:
+            event_dict["sample_rate"] = rate
+        return event_dict
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Nunca bloquea la petición: si la cola está llena, la línea se descarta."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.labels(reason="queue_full").inc()
+
+    def prepare(self, record):
+        # El mensaje ya viene renderizado por structlog: solo hay que pasar el texto
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+
 def setup_logging():
-    """Configura logging estructurado JSON."""
-    
-    structlog.configure(
-        processors=[
-            structlog.stdlib.filter_by_level,
-            structlog.stdlib.add_logger_name,
-            structlog.stdlib.add_log_level,
-            structlog.stdlib.PositionalArgumentsFormatter(),
-            structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.StackInfoRenderer(),
-            structlog.processors.format_exc_info,
-            structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer()
-        ],
-        context_class=dict,
-        logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.stdlib.BoundLogger,
-        cache_logger_on_first_use=True,
-    )
-
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=getattr(logging, settings.log_level.upper()),
-    )
+    """
+    Configura logging estructurado JSON una única vez por proceso. Las líneas se
+    encolan y un hilo aparte las escribe en stdout (fuera del event loop).
+    """
+    global _configured, _listener
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+
+        structlog.configure(
+            processors=[
+                structlog.stdlib.filter_by_level,
+                EventSampler(_parse_rules(settings.log_sample_rates), _parse_rules(settings.log_rate_limits)),
+                structlog.stdlib.add_logger_name,
+                structlog.stdlib.add_log_level,
+                structlog.stdlib.PositionalArgumentsFormatter(),
+                structlog.processors.TimeStamper(fmt="iso"),
+                structlog.processors.StackInfoRenderer(),
+                structlog.processors.format_exc_info,
+                structlog.processors.UnicodeDecoder(),
+                structlog.processors.JSONRenderer(serializer=_dumps)
+            ],
+            context_class=dict,
+            logger_factory=structlog.stdlib.LoggerFactory(),
+            wrapper_class=structlog.stdlib.BoundLogger,
+            cache_logger_on_first_use=True,
+        )
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(logging.Formatter("%(message)s"))
+        if settings.log_async:
+            log_queue = queue.Queue(maxsize=settings.log_queue_size)
+            handler = _DroppingQueueHandler(log_queue)
+            _listener = QueueListener(log_queue, output, respect_handler_level=False)
+            _listener.start()
+            atexit.register(shutdown_logging)
+        else:
+            handler = output
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(getattr(logging, settings.log_level.upper()))
+        _configured = True
+
+
+def shutdown_logging():
+    """Vacía la cola de logs pendientes (al apagar)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
 def get_logger(name: str):
     """Retorna logger estructurado."""
@@ -17,6 +17,74 @@ REQUEST_LATENCY = Histogram(
     buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0]
 )
 
+TIME_TO_FIRST_TOKEN = Histogram(
+    "rag_time_to_first_token_seconds",
+    "Time from request arrival to the first streamed answer token",
+    ["endpoint", "source"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+)
+
+STAGE_LATENCY = Histogram(
+    "rag_stage_latency_seconds",
+    "Latency of each pipeline stage (cache, retrieval, routing, llm, tracking...)",
+    ["stage"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+)
+
+TRACES_EXPORTED = Counter(
+    "rag_traces_exported_total",
+    "Sampled request traces handed to the local trace sink, by outcome",
+    ["outcome"]
+)
+
+LOGS_DROPPED = Counter(
+    "rag_logs_dropped_total",
+    "Log lines not written (sampled, rate_limited, queue_full)",
+    ["reason"]
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "rag_admission_queue_depth",
+    "LLM-bound requests waiting for a concurrency slot, by limiter (global or model)",
+    ["limiter"]
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "rag_admission_in_flight",
+    "LLM calls holding a concurrency slot, by limiter (global or model)",
+    ["limiter"]
+)
+
+ADMISSION_SHED = Counter(
+    "rag_admission_shed_total",
+    "Requests rejected by admission control (429/503), by limiter and reason",
+    ["limiter", "reason"]
+)
+
+LLM_HEDGES = Counter(
+    "rag_llm_hedges_total",
+    "Hedged LLM requests by primary model and outcome (launched, won, lost, skipped_budget)",
+    ["model", "outcome"]
+)
+
+CIRCUIT_STATE = Gauge(
+    "rag_circuit_state",
+    "Per-model circuit breaker state (0 = closed, 1 = half_open, 2 = open)",
+    ["model"]
+)
+
+CIRCUIT_REJECTED = Counter(
+    "rag_circuit_rejected_total",
+    "LLM calls failed fast because the model's circuit was open",
+    ["model"]
+)
+
+LLM_DEGRADED = Counter(
+    "rag_llm_degraded_total",
+    "Requests served in degraded mode after their model failed, by fallback (model, cache, none)",
+    ["model", "fallback"]
+)
+
 LLM_TOKENS = Counter(
     "llm_tokens_total",
     "Total tokens consumed",
@@ -28,11 +96,91 @@ LLM_COST = Counter(
     "Total cost in USD"
 )
 
+CACHE_HITS = Counter('rag_cache_hits_total', 'Number of cache hits')
+CACHE_MISSES = Counter('rag_cache_misses_total', 'Number of cache misses')
+
+CACHE_TIER_HITS = Counter(
+    "rag_cache_tier_hits_total",
+    "Cache hits by tier (l1 = in-process, l2 = Redis)",
+    ["tier"]
+)
+
+CACHE_INVALIDATED_KEYS = Counter(
+    "rag_cache_invalidated_keys_total",
+    "Cache entries evicted by tag invalidation, by tag kind (prompt, doc, corpus)",
+    ["kind"]
+)
+
+L1_CACHE_ENTRIES = Gauge("rag_l1_cache_entries", "Entries in the in-process L1 cache")
+L1_CACHE_BYTES = Gauge("rag_l1_cache_bytes", "Bytes held by the in-process L1 cache")
+
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "rag_semantic_cache_lookups_total",
+    "Semantic cache lookups by result",
+    ["result"]
+)
+
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "rag_semantic_cache_similarity",
+    "Best cosine similarity found on each semantic cache lookup",
+    buckets=[0.5, 0.7, 0.8, 0.85, 0.9, 0.92, 0.95, 0.98, 1.0]
+)
+
+SINGLEFLIGHT_REQUESTS = Counter(
+    "rag_singleflight_requests_total",
+    "Cache misses by singleflight role (leader generates, followers reuse its answer)",
+    ["role"]
+)
+
+CACHE_WARMUP_QUERIES = Counter(
+    "rag_cache_warmup_queries_total",
+    "Cache warming outcomes (warmed, cached, skipped_budget, failed)",
+    ["result"]
+)
+
+CACHE_WARMUP_COST = Counter("rag_cache_warmup_cost_usd_total", "LLM spend of the cache warming job")
+
+CACHE_WARMUP_PROGRESS = Gauge("rag_cache_warmup_progress", "Fraction of the current warming run already processed")
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "rag_embedding_cache_lookups_total",
+    "Embedding cache lookups by result (hot = memory, disk = mmap segments, miss = API call)",
+    ["result"]
+)
+
+EMBEDDING_CACHE_ENTRIES = Gauge(
+    "rag_embedding_cache_entries",
+    "Embeddings indexed from the on-disk cache segments"
+)
+
+TRACKING_RUNS = Counter(
+    "rag_tracking_runs_total",
+    "Runs handed to the background MLflow writer, by outcome",
+    ["outcome"]
+)
+
+TRACKING_ARTIFACTS_SKIPPED = Counter(
+    "rag_tracking_artifacts_skipped_total",
+    "Runs whose prompt/response artifacts were not uploaded",
+    ["reason"]
+)
+
+TRACKING_QUEUE_DEPTH = Gauge(
+    "rag_tracking_queue_depth",
+    "Runs waiting in the background MLflow writer queue"
+)
+
 ACTIVE_REQUESTS = Gauge(
     "rag_active_requests",
     "Number of requests currently being processed"
 )
 
+STARTUP_PHASE_SECONDS = Gauge(
+    "rag_startup_phase_seconds",
+    "Duration of each worker warmup phase (imports, redis, llm, index)",
+    ["phase"]
+)
+
 APP_INFO = Info("rag_app", "RAG application info")
 
 def init_metrics():
@@ -61,6 +209,32 @@ def track_request_metrics(endpoint: str):
         return wrapper
     return decorator
 
+def track_stream_metrics(endpoint: str):
+    """Como track_request_metrics, pero para generadores async (respuestas en streaming)."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            ACTIVE_REQUESTS.inc()
+            start_time = time.time()
+            status = "success"
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            except GeneratorExit:
+                # El cliente cerró la conexión antes de terminar
+                status = "cancelled"
+                raise
+            except Exception as e:
+                status = "error"
+                raise e
+            finally:
+                duration = time.time() - start_time
+                REQUEST_LATENCY.labels(endpoint=endpoint).observe(duration)
+                REQUEST_COUNT.labels(endpoint=endpoint, status=status).inc()
+                ACTIVE_REQUESTS.dec()
+        return wrapper
+    return decorator
+
 def track_llm_metrics(model: str, input_tokens: int, output_tokens: int, cost: float):
     """Registra consumo de LLM en Prometheus."""
     LLM_TOKENS.labels(model=model, type="input").inc(input_tokens)
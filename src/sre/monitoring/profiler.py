@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Marco de pila compacto: "módulo:función" (co_qualname incluye la clase)
+_SKIP_FRAMES = ("threading.py",)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _collapse(frame, max_depth: int) -> List[str]:
+    """Pila de la raíz a la hoja."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        if not frame.f_code.co_filename.endswith(_SKIP_FRAMES):
+            labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+@dataclass
+class LoopLag:
+    """Retraso del event loop: cuánto tarda en atender un temporizador que debería ser inmediato."""
+    samples: int = 0
+    max_ms: float = 0.0
+    total_blocked_ms: float = 0.0
+    values_ms: List[float] = field(default_factory=list)
+
+    def add(self, lag_ms: float, threshold_ms: float):
+        self.samples += 1
+        self.max_ms = max(self.max_ms, lag_ms)
+        self.values_ms.append(lag_ms)
+        if lag_ms >= threshold_ms:
+            self.total_blocked_ms += lag_ms
+
+    def summary(self) -> Dict:
+        ordered = sorted(self.values_ms)
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+        return {
+            "samples": self.samples,
+            "p50_ms": round(pct(0.5), 3),
+            "p99_ms": round(pct(0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "total_blocked_ms": round(self.total_blocked_ms, 3)
+        }
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    hz: int
+    samples: int
+    stacks: Counter
+    blocking_stacks: Counter
+    loop_lag: Dict
+
+    def collapsed(self) -> str:
+        """Formato "pila;plegada muestras" (flamegraph.pl, speedscope, inferno)."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def to_dict(self, top: int = 20) -> Dict:
+        return {
+            "seconds": self.seconds,
+            "hz": self.hz,
+            "samples": self.samples,
+            "loop_lag": self.loop_lag,
+            # Pilas del event loop muestreadas mientras estaba bloqueado (muestras ~ 1/hz s)
+            "blocking_stacks": [
+                {"stack": stack, "samples": count} for stack, count in self.blocking_stacks.most_common(top)
+            ],
+            "collapsed": [
+                {"stack": stack, "samples": count} for stack, count in self.stacks.most_common()
+            ]
+        }
+
+
+class SamplingProfiler:
+    """
+    Profiler por muestreo: un hilo lee las pilas de todos los hilos (sys._current_frames)
+    a `hz` muestras por segundo durante la ventana pedida. Fuera de esa ventana no hay
+    nada activo: coste cero cuando no se usa.
+
+    En paralelo, una tarea del event loop mide su retraso; las muestras del hilo del
+    loop tomadas mientras no atiende su temporizador son el código que lo bloquea.
+    """
+
+    def __init__(self, hz: int = 100, max_depth: int = 64, lag_interval: float = 0.01, lag_threshold_ms: float = 20.0):
+        self.hz = hz
+        self.max_depth = max_depth
+        self.lag_interval = lag_interval
+        self.lag_threshold_ms = lag_threshold_ms
+        self._last_tick = 0.0
+
+    def _thread_names(self) -> Dict[int, str]:
+        return {thread.ident: thread.name for thread in threading.enumerate()}
+
+    def _sample(self, seconds: float, loop_thread: Optional[int], stop: threading.Event):
+        stacks: Counter = Counter()
+        blocking: Counter = Counter()
+        samples = 0
+        interval = 1.0 / self.hz
+        own = threading.get_ident()
+        names = self._thread_names()
+        deadline = time.perf_counter() + seconds
+        while not stop.is_set() and time.perf_counter() < deadline:
+            started = time.perf_counter()
+            loop_blocked = (
+                loop_thread is not None and self._last_tick
+                and (started - self._last_tick - self.lag_interval) * 1000 >= self.lag_threshold_ms
+            )
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = self._thread_names()
+                name = "event_loop" if thread_id == loop_thread else names.get(thread_id, f"thread-{thread_id}")
+                stack = ";".join([name] + _collapse(frame, self.max_depth))
+                stacks[stack] += 1
+                if loop_blocked and thread_id == loop_thread:
+                    blocking[stack] += 1
+            samples += 1
+            time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+        return stacks, blocking, samples
+
+    async def _watch_loop(self, lag: LoopLag, stop: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            now = loop.time()
+            lag.add(max(0.0, now - expected) * 1000, self.lag_threshold_ms)
+            self._last_tick = time.perf_counter()
+
+    async def profile(self, seconds: float) -> ProfileResult:
+        """Muestrea `seconds` segundos sin bloquear el event loop."""
+        loop_thread = threading.get_ident()
+        lag = LoopLag()
+        stop_watch = asyncio.Event()
+        stop_sampler = threading.Event()
+        self._last_tick = time.perf_counter()
+        watcher = asyncio.create_task(self._watch_loop(lag, stop_watch))
+        try:
+            stacks, blocking, samples = await asyncio.to_thread(self._sample, seconds, loop_thread, stop_sampler)
+        finally:
+            stop_sampler.set()
+            stop_watch.set()
+            await watcher
+        return ProfileResult(
+            seconds=seconds,
+            hz=self.hz,
+            samples=samples,
+            stacks=stacks,
+            blocking_stacks=blocking,
+            loop_lag=lag.summary()
+        )
@@ -0,0 +1,281 @@
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, List, Optional
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import STAGE_LATENCY, TRACES_EXPORTED
+
+settings = get_settings()
+logger = get_logger("src.monitoring.tracing")
+
+# Traza y span activos de la petición (se heredan en las tareas hijas de asyncio)
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("rag_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("rag_span", default=None)
+
+# Hijos del histograma ya resueltos: .labels() cuesta más que observe()
+_stage_histograms: Dict[str, Any] = {}
+
+
+def _stage_histogram(stage: str):
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = STAGE_LATENCY.labels(stage=stage)
+    return histogram
+
+
+class Trace:
+    """Spans de una petición muestreada."""
+
+    __slots__ = ("trace_id", "name", "start_ns", "attributes", "spans", "status")
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.attributes: Dict[str, Any] = {}
+        self.spans: List["Span"] = []
+        self.status = "ok"
+
+
+class Span:
+    """
+    Cronómetro de una etapa: alimenta siempre el histograma de su etapa y, si la
+    petición está muestreada, queda registrado en la traza con su padre.
+    """
+
+    __slots__ = ("name", "attributes", "span_id", "parent_id", "start_ns", "end_ns",
+                 "status", "_start", "_trace", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.status = "ok"
+        self._trace = None
+        self._token = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        trace = _current_trace.get()
+        if trace is not None:
+            parent = _current_span.get()
+            self._trace = trace
+            self.span_id = uuid.uuid4().hex[:16]
+            self.parent_id = parent.span_id if parent is not None else None
+            self.start_ns = time.time_ns()
+            self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        _stage_histogram(self.name).observe(elapsed)
+        if self._trace is not None:
+            self.end_ns = self.start_ns + int(elapsed * 1e9)
+            if exc_type is not None:
+                self.status = "error"
+                self.attributes["error"] = repr(exc)
+            self._trace.spans.append(self)
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Generador cerrado desde otro contexto (p. ej. al recolectarlo)
+                pass
+        return False
+
+
+def span(name: str, **attributes) -> Span:
+    """`with span("retrieval", top_k=5):` — válido en código sync y async."""
+    return Span(name, attributes)
+
+
+def set_trace_attribute(key: str, value: Any):
+    """Atributo de la petición (p. ej. run_id de MLflow); no hace nada si no se muestrea."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.setdefault(key, value)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def _start_trace(name: str):
+    """(traza, token) si la petición entra en la muestra; si no, None (sin coste extra)."""
+    if settings.trace_sample_rate <= 0 or random.random() >= settings.trace_sample_rate:
+        return None
+    trace = Trace(name)
+    return trace, _current_trace.set(trace)
+
+
+def _end_trace(started, status: str):
+    if started is None:
+        return
+    trace, token = started
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        pass
+    trace.status = status
+    get_trace_exporter().submit(trace)
+
+
+def traced(name: str):
+    """Decorador de endpoints (funciones async o generadores async): abre la traza de la petición."""
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def gen_wrapper(*args, **kwargs):
+                started = _start_trace(name)
+                status = "ok"
+                try:
+                    with span(name):
+                        async for item in func(*args, **kwargs):
+                            yield item
+                except BaseException:
+                    status = "error"
+                    raise
+                finally:
+                    _end_trace(started, status)
+            return gen_wrapper
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = _start_trace(name)
+            status = "ok"
+            try:
+                with span(name):
+                    return await func(*args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                _end_trace(started, status)
+        return wrapper
+    return decorator
+
+
+def _to_jsonl(trace: Trace) -> dict:
+    return {
+        "trace_id": trace.trace_id,
+        "name": trace.name,
+        "start_unix_ns": trace.start_ns,
+        "status": trace.status,
+        "attributes": trace.attributes,
+        "spans": [
+            {
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "name": s.name,
+                "start_offset_ms": (s.start_ns - trace.start_ns) / 1e6,
+                "duration_ms": (s.end_ns - s.start_ns) / 1e6,
+                "status": s.status,
+                "attributes": s.attributes
+            }
+            for s in sorted(trace.spans, key=lambda s: s.start_ns)
+        ]
+    }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(trace: Trace) -> dict:
+    """Formato JSON de OTLP (lo lee p. ej. el receptor otlpjsonfile del OpenTelemetry Collector)."""
+    spans = []
+    for s in trace.spans:
+        attributes = dict(s.attributes)
+        if s.parent_id is None:
+            attributes.update(trace.attributes)
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": 2 if s.parent_id is None else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": 2 if s.status == "error" else 1}
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": settings.app_name}},
+                {"key": "service.version", "value": {"stringValue": settings.app_version}}
+            ]},
+            "scopeSpans": [{"scope": {"name": "src.sre.monitoring.tracing"}, "spans": spans}]
+        }]
+    }
+
+
+class TraceExporter:
+    """Escribe las trazas muestreadas en un fichero local desde un hilo (sin bloquear peticiones)."""
+
+    def __init__(self, path: str = None, export_format: str = None, max_size: int = None):
+        self.path = path or settings.trace_export_path
+        self.export_format = export_format or settings.trace_export_format
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=max_size or settings.trace_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: Trace):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            TRACES_EXPORTED.labels(outcome="dropped").inc()
+
+    def _run(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        encode = _to_otlp if self.export_format == "otlp" else _to_jsonl
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    break
+                try:
+                    f.write(json.dumps(encode(trace), ensure_ascii=False, default=str) + "\n")
+                    # Se vacía al fichero cuando no queda nada pendiente
+                    if self._queue.empty():
+                        f.flush()
+                    TRACES_EXPORTED.labels(outcome="written").inc()
+                except Exception as e:
+                    TRACES_EXPORTED.labels(outcome="failed").inc()
+                    logger.warning("trace_export_failed", error=str(e))
+
+    def shutdown(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+# Singleton
+_trace_exporter_instance = None
+def get_trace_exporter() -> TraceExporter:
+    global _trace_exporter_instance
+    if _trace_exporter_instance is None:
+        _trace_exporter_instance = TraceExporter()
+    return _trace_exporter_instance
@@ -0,0 +1,174 @@
+import atexit
+import queue
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import TRACKING_RUNS, TRACKING_ARTIFACTS_SKIPPED, TRACKING_QUEUE_DEPTH
+from src.sre.utils.lazy import lazy_import
+
+# mlflow tarda ~1 s en importarse: solo se carga cuando se registra el primer run
+mlflow = lazy_import("mlflow")
+
+settings = get_settings()
+logger = get_logger("src.monitoring.tracking")
+
+# El experimento de MLflow se configura una sola vez por proceso
+_experiment_id: Optional[str] = None
+_mlflow_lock = threading.Lock()
+
+
+def get_experiment_id() -> str:
+    global _experiment_id
+    if _experiment_id is None:
+        with _mlflow_lock:
+            if _experiment_id is None:
+                mlflow.set_tracking_uri(settings.mlflow_tracking_uri)
+                _experiment_id = mlflow.set_experiment(settings.mlflow_experiment_name).experiment_id
+    return _experiment_id
+
+
+@dataclass
+class TrackedRun:
+    """Lo que se registra en MLflow de una petición."""
+    run_name: Optional[str]
+    params: Dict[str, str] = field(default_factory=dict)
+    metrics: Dict[str, float] = field(default_factory=dict)
+    artifacts: Dict[str, str] = field(default_factory=dict)
+    # Id local: se devuelve al cliente al momento y queda como tag del run en MLflow
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    timestamp_ms: int = field(default_factory=lambda: int(time.time() * 1000))
+
+
+class TrackingQueue:
+    """
+    Escritor de MLflow en segundo plano.
+
+    Las peticiones solo encolan (sin esperar a MLflow); un hilo envía cada run con
+    una única llamada log_batch y sube los artefactos. La cola es acotada: si se
+    llena, los runs se descartan, y con la cola a más de la mitad se dejan de subir
+    artefactos. Los prompts completos solo se guardan para una muestra de peticiones.
+    """
+
+    def __init__(
+        self,
+        max_size: int = None,
+        batch_size: int = None,
+        flush_interval: float = None,
+        artifact_sample_rate: float = None
+    ):
+        self.max_size = max_size or settings.tracking_queue_size
+        self.batch_size = batch_size or settings.tracking_batch_size
+        self.flush_interval = flush_interval or settings.tracking_flush_interval_seconds
+        self.artifact_sample_rate = (
+            settings.tracking_artifact_sample_rate if artifact_sample_rate is None else artifact_sample_rate
+        )
+        self._queue: "queue.Queue[TrackedRun]" = queue.Queue(maxsize=self.max_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._client = None
+        self._atexit_registered = False
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="mlflow-tracking", daemon=True)
+                self._thread.start()
+                if not self._atexit_registered:
+                    atexit.register(self.shutdown)
+                    self._atexit_registered = True
+
+    def submit(self, run: TrackedRun) -> bool:
+        """Encola un run sin bloquear. Devuelve False si se ha descartado."""
+        self.start()
+        if run.artifacts:
+            if self._queue.qsize() > self.max_size // 2:
+                TRACKING_ARTIFACTS_SKIPPED.labels(reason="overload").inc()
+                run.artifacts = {}
+            elif random.random() >= self.artifact_sample_rate:
+                TRACKING_ARTIFACTS_SKIPPED.labels(reason="sampled_out").inc()
+                run.artifacts = {}
+        try:
+            self._queue.put_nowait(run)
+        except queue.Full:
+            TRACKING_RUNS.labels(outcome="dropped").inc()
+            return False
+        TRACKING_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Espera a que se vacíe la cola. Devuelve False si vence el timeout."""
+        deadline = time.monotonic() + (timeout if timeout is not None else settings.tracking_shutdown_timeout_seconds)
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline or self._thread is None or not self._thread.is_alive():
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout: float = None):
+        """Vacía la cola (con límite de tiempo) y para el hilo."""
+        if self._thread is None:
+            return
+        if not self.flush(timeout):
+            logger.warning("tracking_flush_timeout", pending=self._queue.qsize())
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch: List[TrackedRun] = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            for run in batch:
+                try:
+                    self._send(run)
+                    TRACKING_RUNS.labels(outcome="sent").inc()
+                except Exception as e:
+                    TRACKING_RUNS.labels(outcome="failed").inc()
+                    logger.warning("tracking_send_failed", error=str(e), request_id=run.request_id)
+                finally:
+                    self._queue.task_done()
+            TRACKING_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def _send(self, run: TrackedRun):
+        if self._client is None:
+            self._client = mlflow.MlflowClient(tracking_uri=settings.mlflow_tracking_uri)
+        client = self._client
+        mlflow_run = client.create_run(
+            get_experiment_id(),
+            start_time=run.timestamp_ms,
+            run_name=run.run_name,
+            tags={"request_id": run.request_id}
+        )
+        run_id = mlflow_run.info.run_id
+        client.log_batch(
+            run_id,
+            params=[mlflow.entities.Param(key, str(value)) for key, value in run.params.items()],
+            metrics=[
+                mlflow.entities.Metric(key, float(value), run.timestamp_ms, 0)
+                for key, value in run.metrics.items() if value is not None
+            ]
+        )
+        for artifact_file, text in run.artifacts.items():
+            client.log_text(run_id, text, artifact_file)
+        client.set_terminated(run_id)
+
+
+# Singleton
+_tracking_instance = None
+def get_tracking_queue() -> TrackingQueue:
+    global _tracking_instance
+    if _tracking_instance is None:
+        _tracking_instance = TrackingQueue()
+    return _tracking_instance
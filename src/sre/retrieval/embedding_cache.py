@@ -0,0 +1,258 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import EMBEDDING_CACHE_LOOKUPS, EMBEDDING_CACHE_ENTRIES
+from src.sre.retrieval.embeddings import normalize_rows
+
+settings = get_settings()
+logger = get_logger("src.retrieval.embedding_cache")
+
+KEY_BYTES = 16
+_WHITESPACE = re.compile(r"\s+")
+# seg-<pid>-<ns>.d<dim>.keys / .f16
+_SEGMENT_NAME = re.compile(r"seg-\d+-\d+\.d(\d+)\.keys$")
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    """Clave por contenido: modelo + texto normalizado (espacios y forma Unicode)."""
+    text = _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).digest()[:KEY_BYTES]
+
+
+class _Segment:
+    """
+    Par de ficheros append-only: claves (16 bytes) y vectores float16.
+
+    Se escriben primero los vectores y luego las claves, así que una entrada solo es
+    visible cuando está completa; una cola cortada por un crash se ignora.
+    """
+
+    def __init__(self, keys_path: str, dim: int):
+        self.keys_path = keys_path
+        self.vectors_path = keys_path[:-len(".keys")] + ".f16"
+        self.dim = dim
+        self.count = 0
+        self.vectors: Optional[np.ndarray] = None
+        self._row_bytes = dim * 2
+
+    def _available(self) -> int:
+        try:
+            n_keys = os.path.getsize(self.keys_path) // KEY_BYTES
+            n_vectors = os.path.getsize(self.vectors_path) // self._row_bytes
+        except OSError:
+            return self.count
+        return min(n_keys, n_vectors)
+
+    def refresh(self) -> List[bytes]:
+        """Claves añadidas (por este u otro worker) desde la última lectura."""
+        available = self._available()
+        if available <= self.count:
+            return []
+        with open(self.keys_path, "rb") as f:
+            f.seek(self.count * KEY_BYTES)
+            data = f.read((available - self.count) * KEY_BYTES)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(available, self.dim))
+        self.count = available
+        return [data[i:i + KEY_BYTES] for i in range(0, len(data), KEY_BYTES)]
+
+    def truncate(self):
+        """Recorta ambos ficheros a la última fila completa (tras una escritura a medias)."""
+        for path, row_bytes in ((self.keys_path, KEY_BYTES), (self.vectors_path, self._row_bytes)):
+            try:
+                os.truncate(path, self.count * row_bytes)
+            except OSError:
+                pass  # el segmento ya no recibe más filas: la cola sobrante se ignora al leer
+
+    @property
+    def size_bytes(self) -> int:
+        return self.count * (KEY_BYTES + self._row_bytes)
+
+
+class _ModelStore:
+    """Segmentos e índice en memoria (clave -> segmento, fila) de un modelo."""
+
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        self.segments: Dict[str, _Segment] = {}
+        self.index: Dict[bytes, Tuple[_Segment, int]] = {}
+        self.writer: Optional[_Segment] = None
+        self.last_refresh = 0.0
+
+    def refresh(self):
+        for keys_path in glob.glob(os.path.join(self.model_dir, "seg-*.keys")):
+            match = _SEGMENT_NAME.search(os.path.basename(keys_path))
+            if match is None:
+                continue
+            segment = self.segments.get(keys_path)
+            if segment is None:
+                segment = self.segments[keys_path] = _Segment(keys_path, int(match.group(1)))
+            start = segment.count
+            for row, key in enumerate(segment.refresh(), start=start):
+                self.index.setdefault(key, (segment, row))
+        self.last_refresh = time.monotonic()
+
+    def append(self, keys: List[bytes], vectors: np.ndarray, segment_max_bytes: int):
+        dim = vectors.shape[1]
+        if self.writer is None or self.writer.dim != dim or self.writer.size_bytes >= segment_max_bytes:
+            # Cada worker escribe en su propio segmento: sin bloqueos entre procesos
+            os.makedirs(self.model_dir, exist_ok=True)
+            name = f"seg-{os.getpid()}-{time.time_ns()}.d{dim}.keys"
+            self.writer = self.segments[os.path.join(self.model_dir, name)] = _Segment(
+                os.path.join(self.model_dir, name), dim
+            )
+        writer = self.writer
+        try:
+            with open(writer.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float16).tobytes())
+            with open(writer.keys_path, "ab") as f:
+                f.write(b"".join(keys))
+        except OSError:
+            # Vectores sin sus claves desalinearían las filas siguientes: el segmento se
+            # cierra en su último estado consistente y la próxima escritura abre otro
+            self.writer = None
+            writer.truncate()
+            raise
+        start = self.writer.count
+        self.writer.refresh()
+        for row, key in enumerate(keys, start=start):
+            self.index.setdefault(key, (self.writer, row))
+
+
+class EmbeddingCache:
+    """
+    Caché persistente de embeddings por contenido (modelo + texto normalizado).
+
+    Dos niveles: LRU en memoria con los vectores más usados y segmentos en disco
+    (float16, mapeados, solo append) compartidos por todos los workers y que
+    sobreviven a los reinicios.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = None,
+        hot_entries: int = None,
+        segment_max_bytes: int = None,
+        refresh_seconds: float = None
+    ):
+        self.cache_dir = cache_dir or settings.embedding_cache_dir
+        self.hot_entries = hot_entries or settings.embedding_cache_hot_entries
+        self.segment_max_bytes = segment_max_bytes or settings.embedding_cache_segment_max_bytes
+        self.refresh_seconds = (
+            settings.embedding_cache_refresh_seconds if refresh_seconds is None else refresh_seconds
+        )
+        self._hot: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._stores: Dict[str, _ModelStore] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, model_name: str) -> _ModelStore:
+        store = self._stores.get(model_name)
+        if store is None:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+            store = self._stores[model_name] = _ModelStore(os.path.join(self.cache_dir, safe_name))
+            store.refresh()
+            EMBEDDING_CACHE_ENTRIES.set(sum(len(s.index) for s in self._stores.values()))
+        return store
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._hot[key] = vector
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [embedding_key(model_name, text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            store = self._store(model_name)
+            missing = []
+            for i, key in enumerate(keys):
+                vector = self._hot.get(key)
+                if vector is not None:
+                    self._hot.move_to_end(key)
+                    results[i] = vector
+                    EMBEDDING_CACHE_LOOKUPS.labels(result="hot").inc()
+                else:
+                    missing.append(i)
+            # Otros workers pueden haber añadido entradas: se releen sus segmentos de vez en cuando
+            if missing and time.monotonic() - store.last_refresh > self.refresh_seconds:
+                store.refresh()
+                EMBEDDING_CACHE_ENTRIES.set(sum(len(s.index) for s in self._stores.values()))
+            for i in missing:
+                location = store.index.get(keys[i])
+                if location is None:
+                    EMBEDDING_CACHE_LOOKUPS.labels(result="miss").inc()
+                    continue
+                segment, row = location
+                vector = normalize_rows(segment.vectors[row])
+                self._remember(keys[i], vector)
+                results[i] = vector
+                EMBEDDING_CACHE_LOOKUPS.labels(result="disk").inc()
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], vectors: np.ndarray):
+        vectors = normalize_rows(vectors)
+        keys = [embedding_key(model_name, text) for text in texts]
+        with self._lock:
+            store = self._store(model_name)
+            new, seen = [], set()
+            for i, key in enumerate(keys):
+                if key not in store.index and key not in seen:
+                    seen.add(key)
+                    new.append(i)
+            if new:
+                try:
+                    store.append([keys[i] for i in new], vectors[new], self.segment_max_bytes)
+                except OSError as e:
+                    # Sin disco la caché sigue funcionando en memoria
+                    logger.warning("embedding_cache_write_failed", error=str(e))
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            EMBEDDING_CACHE_ENTRIES.set(sum(len(s.index) for s in self._stores.values()))
+
+
+class CachedEmbedder:
+    """Envuelve un embedder: solo llama a la API para los textos que no están en caché."""
+
+    def __init__(self, embedder, cache: EmbeddingCache = None):
+        self.embedder = embedder
+        self.cache = cache or get_embedding_cache()
+
+    @property
+    def model_name(self) -> str:
+        return self.embedder.model_name
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return self.embedder.embed(texts)
+        cached = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            # Textos repetidos dentro del lote se calculan una sola vez
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = normalize_rows(self.embedder.embed(unique))
+            self.cache.put_many(self.model_name, unique, vectors)
+            by_text = dict(zip(unique, vectors))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        return np.stack(cached).astype(np.float32, copy=False)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed([query])[0]
+
+
+# Singleton
+_embedding_cache_instance = None
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache_instance
+    if _embedding_cache_instance is None:
+        _embedding_cache_instance = EmbeddingCache()
+    return _embedding_cache_instance
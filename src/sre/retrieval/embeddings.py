@@ -0,0 +1,51 @@
+import numpy as np
+from typing import List
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.utils.lazy import lazy_import
+
+openai = lazy_import("openai")
+
+settings = get_settings()
+logger = get_logger("src.retrieval.embeddings")
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma L2 = 1 (el producto escalar pasa a ser coseno)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class OpenAIEmbedder:
+    """Calcula embeddings con la API de OpenAI, en lotes."""
+
+    def __init__(self, model_name: str = None, batch_size: int = None):
+        self.client = openai.OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
+        self.model_name = model_name or settings.embedding_model
+        self.batch_size = batch_size or settings.embedding_batch_size
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Devuelve una matriz (n, dim) float32 normalizada."""
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = self.client.embeddings.create(model=self.model_name, input=batch)
+            vectors.extend(item.embedding for item in response.data)
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return normalize_rows(np.array(vectors, dtype=np.float32))
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding de una sola pregunta (vector 1D)."""
+        return self.embed([query])[0]
+
+
+def get_default_embedder():
+    """Embedder de OpenAI, con la caché persistente delante si está activada."""
+    embedder = OpenAIEmbedder()
+    if settings.embedding_cache_enabled:
+        from src.sre.retrieval.embedding_cache import CachedEmbedder
+        embedder = CachedEmbedder(embedder)
+    return embedder
@@ -0,0 +1,187 @@
+import json
+import os
+import re
+import unicodedata
+import numpy as np
+from array import array
+from collections import Counter
+from typing import Dict, List, Tuple
+from src.sre.retrieval.vector_index import CHUNKS_FILE, _top_k
+
+# Ficheros del índice léxico (en el mismo directorio de versión que el vectorial)
+LEXICAL_META_FILE = "lexical_meta.json"
+LEXICAL_VOCAB_FILE = "lexical_vocab.json"
+TERM_OFFSETS_FILE = "lexical_term_offsets.npy"
+POSTING_ROWS_FILE = "lexical_posting_rows.npy"
+POSTING_WEIGHTS_FILE = "lexical_posting_weights.npy"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada como con
+contra cual cuales cuando de del desde donde dos e el ella ellas ello ellos en entre era es esa
+esas ese eso esos esta estan estas este esto estos fue ha hay hasta la las le les lo los mas me
+mi muy nada ni no nos o os otra otras otro otros para pero poco por porque que quien se segun
+ser si sin sino sobre solo son su sus tambien tan tanto te tiene tienen todo todos tras tu un
+una unas uno unos y ya cual cuanto cuanta cuantos cuantas debe deben puede pueden hace hacer
+""".split())
+
+# "DB SI", "db_si" o "dbsi" -> "db-si" (documentos básicos del CTE)
+_DB_CODE = re.compile(r"\bdb[\s_-]*(si|sua|he|hr|hs|se(?:-[a-z]+)?)\b")
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+_NUMBER = re.compile(r"\d+(?:\.\d+)*$")
+
+
+def _fold(text: str) -> str:
+    """Minúsculas y sin tildes (la ñ se conserva), para que 'evacuación' = 'evacuacion'."""
+    text = unicodedata.normalize("NFKC", text).lower().replace("ñ", "\0")
+    text = "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c))
+    return text.replace("\0", "ñ")
+
+
+def _stem(token: str) -> str:
+    """Plurales del español: extintores -> extintor, puertas -> puerta, luces -> luz."""
+    if len(token) < 5 or not token.isalpha():
+        return token
+    if token.endswith("ces"):
+        return token[:-3] + "z"
+    if token.endswith("es") and token[-3] in "lnrdj":
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Términos de búsqueda de un texto.
+
+    Conserva los códigos y números de sección ("db-si", "1.2") y añade un término
+    compuesto código+número ("db-si_4") para que "DB-SI 4" se encuentre de forma exacta.
+    """
+    raw = _TOKEN.findall(_DB_CODE.sub(r"db-\1", _fold(text)))
+    terms = []
+    for i, token in enumerate(raw):
+        if token in STOPWORDS:
+            continue
+        if "-" in token:
+            if i + 1 < len(raw) and _NUMBER.match(raw[i + 1]):
+                terms.append(f"{token}_{raw[i + 1]}")
+            # "db-sua" también se encuentra buscando "SUA"
+            terms.extend(part for part in token.split("-") if len(part) > 1 and part not in STOPWORDS)
+        terms.append(_stem(token))
+    return terms
+
+
+def is_reference(term: str) -> bool:
+    """Términos que identifican una norma o sección concreta ("db-si_4", "3.2.1")."""
+    return "_" in term or ("." in term and _NUMBER.match(term) is not None)
+
+
+def build_lexical_index(index_dir: str, k1: float = BM25_K1, b: float = BM25_B) -> Dict:
+    """
+    Índice invertido BM25 de los chunks de un índice ya construido.
+
+    Las listas de postings son tramos contiguos de dos arrays (filas y pesos) y el
+    peso BM25 de cada (término, chunk) se calcula aquí, así que buscar solo suma pesos.
+    """
+    vocab: Dict[str, int] = {}
+    terms, rows, tfs = array("i"), array("i"), array("f")
+    doc_lengths = array("f")
+    with open(os.path.join(index_dir, CHUNKS_FILE), "rb") as f:
+        for row, line in enumerate(f):
+            counts = Counter(tokenize(json.loads(line)["text"]))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                rows.append(row)
+                tfs.append(tf)
+
+    n_docs = len(doc_lengths)
+    terms = np.frombuffer(terms, dtype=np.int32)
+    rows = np.frombuffer(rows, dtype=np.int32)
+    tfs = np.frombuffer(tfs, dtype=np.float32)
+    doc_lengths = np.frombuffer(doc_lengths, dtype=np.float32)
+
+    df = np.bincount(terms, minlength=len(vocab)).astype(np.float32)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avgdl = float(doc_lengths.mean()) if n_docs else 0.0
+    norm = k1 * (1 - b + b * doc_lengths[rows] / avgdl) if avgdl else np.full_like(tfs, k1)
+    weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    order = np.lexsort((rows, terms))
+    term_offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+    np.save(os.path.join(index_dir, TERM_OFFSETS_FILE), term_offsets)
+    np.save(os.path.join(index_dir, POSTING_ROWS_FILE), rows[order])
+    np.save(os.path.join(index_dir, POSTING_WEIGHTS_FILE), weights[order])
+    with open(os.path.join(index_dir, LEXICAL_VOCAB_FILE), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+
+    meta = {"n_docs": n_docs, "n_terms": len(vocab), "n_postings": int(len(rows)), "avgdl": avgdl, "k1": k1, "b": b}
+    with open(os.path.join(index_dir, LEXICAL_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def has_lexical_index(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, LEXICAL_META_FILE))
+
+
+class LexicalIndex:
+    """Índice BM25 en disco (postings mapeados en memoria)."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, LEXICAL_META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, LEXICAL_VOCAB_FILE), encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        self.term_offsets = np.load(os.path.join(index_dir, TERM_OFFSETS_FILE))
+        self.posting_rows = np.load(os.path.join(index_dir, POSTING_ROWS_FILE), mmap_mode="r")
+        self.posting_weights = np.load(os.path.join(index_dir, POSTING_WEIGHTS_FILE), mmap_mode="r")
+
+    @property
+    def size(self) -> int:
+        return self.meta["n_docs"]
+
+    def query_terms(self, query: str) -> List[int]:
+        return [self.vocab[term] for term in dict.fromkeys(tokenize(query)) if term in self.vocab]
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(filas, scores BM25) de los top_k chunks; solo chunks con algún término en común."""
+        term_ids = self.query_terms(query)
+        if not term_ids or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(term_ids) == 1:
+            start, end = self.term_offsets[term_ids[0]], self.term_offsets[term_ids[0] + 1]
+            candidates = np.asarray(self.posting_rows[start:end])
+            scores = np.asarray(self.posting_weights[start:end])
+        else:
+            spans = [(self.term_offsets[t], self.term_offsets[t + 1]) for t in term_ids]
+            n_postings = sum(e - s for s, e in spans)
+            if n_postings > self.size // 8:
+                # Términos muy frecuentes: acumular en un vector denso es más barato que agrupar
+                dense = np.zeros(self.size, dtype=np.float32)
+                for s, e in spans:
+                    dense[self.posting_rows[s:e]] += self.posting_weights[s:e]
+                candidates = np.flatnonzero(dense)
+                scores = dense[candidates]
+            else:
+                # Acumulación dispersa: solo las filas que aparecen en alguna lista
+                all_rows = np.concatenate([self.posting_rows[s:e] for s, e in spans])
+                all_weights = np.concatenate([self.posting_weights[s:e] for s, e in spans])
+                candidates, inverse = np.unique(all_rows, return_inverse=True)
+                scores = np.bincount(inverse, weights=all_weights).astype(np.float32)
+        idx, top_scores = _top_k(scores[np.newaxis, :], min(top_k, len(scores)))
+        return candidates[idx[0]].astype(np.int64), top_scores[0]
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> List[Tuple[int, float]]:
+    """Fusiona listas de filas ordenadas: score = Σ 1 / (k + posición)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for position, row in enumerate(ranking):
+            if row >= 0:
+                fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + position + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
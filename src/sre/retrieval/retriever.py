@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.retrieval.embeddings import get_default_embedder
+from src.sre.retrieval.lexical import (
+    LexicalIndex, has_lexical_index, is_reference, reciprocal_rank_fusion, tokenize
+)
+from src.sre.retrieval.vector_index import META_FILE, RetrievedChunk, VectorIndex, resolve_index_dir
+
+settings = get_settings()
+logger = get_logger("src.retrieval.retriever")
+
+
+class Retriever:
+    """Recupera los chunks más relevantes para una pregunta."""
+
+    def __init__(self, index_dir: str = None, embedder=None):
+        self.index_dir = index_dir or settings.index_dir
+        self._embedder = embedder
+        self._index: Optional[VectorIndex] = None
+        self._lexical: Optional[LexicalIndex] = None
+        self._missing_index_logged = False
+        # CURRENT se relee como mucho cada index_refresh_seconds (o con refresh())
+        self._checked_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+        # Protege el cambio de índice y el recuento de lectores de cada uno
+        self._lock = threading.Lock()
+        self._readers: Dict[VectorIndex, int] = {}
+        self._retired: Set[VectorIndex] = set()
+
+    @property
+    def embedder(self):
+        # Se crea bajo demanda: sin índice no hace falta cliente de embeddings
+        if self._embedder is None:
+            self._embedder = get_default_embedder()
+        return self._embedder
+
+    def refresh(self, force: bool = False):
+        """
+        Si la ingesta ha publicado otra versión (CURRENT), abre la nueva y retira la
+        anterior; esta se cierra cuando terminan las búsquedas que la están usando.
+        """
+        if not force and self._checked_at is not None and \
+                time.monotonic() - self._checked_at < settings.index_refresh_seconds:
+            return
+        with self._refresh_lock:
+            if not force and self._checked_at is not None and \
+                    time.monotonic() - self._checked_at < settings.index_refresh_seconds:
+                return
+            self._checked_at = time.monotonic()
+            index_dir = resolve_index_dir(self.index_dir)
+            if self._index is not None and self._index.index_dir == index_dir:
+                return
+            if not os.path.exists(os.path.join(index_dir, META_FILE)):
+                return
+            index = VectorIndex(index_dir)
+            # Índices construidos antes de tener BM25 solo admiten búsqueda vectorial
+            lexical = LexicalIndex(index_dir) if has_lexical_index(index_dir) else None
+            with self._lock:
+                previous = self._index
+                self._index, self._lexical = index, lexical
+                close_now = previous is not None and previous not in self._readers
+                if previous is not None and not close_now:
+                    self._retired.add(previous)
+            if close_now:
+                previous.close()
+            logger.info(
+                "vector_index_loaded",
+                index_dir=index_dir,
+                size=index.size,
+                partitioned=index.is_partitioned,
+                lexical=lexical is not None
+            )
+
+    @contextmanager
+    def _reading(self):
+        """(índice, léxico) vigentes, sin que se cierren mientras dura la búsqueda."""
+        self.refresh()
+        with self._lock:
+            index, lexical = self._index, self._lexical
+            if index is not None:
+                self._readers[index] = self._readers.get(index, 0) + 1
+        try:
+            yield index, lexical
+        finally:
+            if index is not None:
+                with self._lock:
+                    self._readers[index] -= 1
+                    close = False
+                    if not self._readers[index]:
+                        del self._readers[index]
+                        close = index in self._retired
+                        self._retired.discard(index)
+                if close:
+                    index.close()
+
+    @property
+    def index(self) -> Optional[VectorIndex]:
+        self.refresh()
+        return self._index
+
+    @property
+    def lexical(self) -> Optional[LexicalIndex]:
+        return self._lexical if self.index is not None else None
+
+    @property
+    def corpus_version(self) -> str:
+        """
+        Versión del corpus indexado (acota la caché semántica). Usa el índice ya
+        abierto, sin tocar disco: se lee desde el event loop.
+        """
+        index = self._index
+        return (index.corpus_version if index is not None else None) or "none"
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embedder.embed_query(query)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return self.embedder.embed(queries)
+
+    def retrieve(self, query: str, top_k: int = 5, query_vector: np.ndarray = None) -> List[RetrievedChunk]:
+        vectors = None if query_vector is None else query_vector[np.newaxis, :]
+        return self.retrieve_batch([query], top_k, query_vectors=vectors)[0]
+
+    def retrieve_batch(
+        self, queries: List[str], top_k: int = 5, query_vectors: np.ndarray = None
+    ) -> List[List[RetrievedChunk]]:
+        """Búsqueda vectorial, léxica (BM25) o híbrida según retrieval_mode, para un lote de preguntas."""
+        with self._reading() as (index, lexical):
+            return self._search(index, lexical, queries, top_k, query_vectors)
+
+    def _search(self, index, lexical, queries, top_k, query_vectors) -> List[List[RetrievedChunk]]:
+        if index is None or index.size == 0:
+            if not self._missing_index_logged:
+                logger.warning("vector_index_not_found", index_dir=self.index_dir)
+                self._missing_index_logged = True
+            return [[] for _ in queries]
+
+        if settings.retrieval_mode not in ("lexical", "hybrid"):
+            lexical = None
+        if lexical is None:
+            return self._vector_search(index, queries, top_k, query_vectors)
+        if settings.retrieval_mode == "lexical":
+            return [
+                [index.get_chunk(row, score) for row, score in zip(*lexical.search(query, top_k))]
+                for query in queries
+            ]
+        return self._hybrid_search(index, lexical, queries, top_k, query_vectors)
+
+    def _vector_search(self, index: VectorIndex, queries, top_k, query_vectors) -> List[List[RetrievedChunk]]:
+        if query_vectors is None:
+            query_vectors = self.embedder.embed(queries)
+        rows, scores = index.search(query_vectors, top_k, nprobe=settings.retrieval_nprobe)
+        return [
+            [index.get_chunk(row, score) for row, score in zip(q_rows, q_scores) if row >= 0]
+            for q_rows, q_scores in zip(rows, scores)
+        ]
+
+    def is_exact_lookup(self, query: str, lexical: LexicalIndex = None) -> bool:
+        """Consulta corta que cita una norma o sección ("DB-SI 4", "SUA 1.2"): basta BM25."""
+        if lexical is None:
+            lexical = self.lexical
+        if lexical is None or not settings.lexical_shortcut_max_terms:
+            return False
+        terms = set(tokenize(query))
+        return len(terms) <= settings.lexical_shortcut_max_terms and any(
+            is_reference(term) and term in lexical.vocab for term in terms
+        )
+
+    def _hybrid_search(
+        self, index: VectorIndex, lexical: LexicalIndex, queries, top_k, query_vectors
+    ) -> List[List[RetrievedChunk]]:
+        """BM25 + vectores fusionados con RRF; las búsquedas exactas no calculan embedding."""
+        candidates = top_k * settings.hybrid_candidates_factor
+        lexical_hits = [lexical.search(query, candidates) for query in queries]
+
+        if query_vectors is None:
+            dense = [i for i, query in enumerate(queries) if not self.is_exact_lookup(query, lexical)]
+            vectors = self.embedder.embed([queries[i] for i in dense]) if dense else None
+        else:
+            dense, vectors = list(range(len(queries))), query_vectors
+        vector_rows: List[Optional[np.ndarray]] = [None] * len(queries)
+        if dense:
+            rows, _ = index.search(vectors, candidates, nprobe=settings.retrieval_nprobe)
+            for i, q_rows in zip(dense, rows):
+                vector_rows[i] = q_rows
+
+        results = []
+        for (lexical_rows, lexical_scores), q_vector_rows in zip(lexical_hits, vector_rows):
+            if q_vector_rows is None:
+                fused = list(zip(lexical_rows[:top_k], lexical_scores[:top_k]))
+            else:
+                fused = reciprocal_rank_fusion([lexical_rows, q_vector_rows], k=settings.rrf_k)[:top_k]
+            results.append([index.get_chunk(row, score) for row, score in fused])
+        return results
+
+# Singleton
+_retriever_instance = None
+def get_retriever() -> Retriever:
+    global _retriever_instance
+    if _retriever_instance is None:
+        _retriever_instance = Retriever()
+    return _retriever_instance
@@ -0,0 +1,322 @@
+import json
+import mmap
+import os
+import time
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from src.sre.retrieval.embeddings import normalize_rows
+
+# Ficheros que forman un índice en disco
+META_FILE = "index_meta.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"
+ROW_IDS_FILE = "row_ids.npy"
+CENTROIDS_FILE = "centroids.npy"
+CLUSTER_OFFSETS_FILE = "cluster_offsets.npy"
+# Puntero a la versión activa dentro de un directorio raíz de índices
+CURRENT_FILE = "CURRENT"
+
+# Filas que se multiplican de golpe (acota la memoria temporal de la búsqueda)
+DEFAULT_BLOCK_SIZE = 16384
+
+
+@dataclass
+class RetrievedChunk:
+    """Fragmento recuperado del índice."""
+    id: str
+    text: str
+    score: float
+    source: str = ""
+    metadata: Dict = field(default_factory=dict)
+
+
+def resolve_index_dir(index_root: str) -> str:
+    """Directorio del índice activo (el que apunta CURRENT, o la propia raíz)."""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), encoding="utf-8") as f:
+            return os.path.join(index_root, f.read().strip())
+    except FileNotFoundError:
+        return index_root
+
+
+def publish_index(index_root: str, version_dir: str):
+    """Activa una versión del índice reemplazando CURRENT de forma atómica."""
+    tmp_path = os.path.join(index_root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.relpath(version_dir, index_root))
+    os.replace(tmp_path, os.path.join(index_root, CURRENT_FILE))
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k por fila (ordenado de mayor a menor) sin ordenar la fila entera."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    top_scores = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 15,
+    sample_size: int = None,
+    seed: int = 0
+) -> np.ndarray:
+    """K-means esférico sobre una muestra de los vectores (para el modo IVF)."""
+    rng = np.random.default_rng(seed)
+    n_rows = vectors.shape[0]
+    sample_size = min(n_rows, sample_size or n_clusters * 256)
+    sample_rows = np.sort(rng.choice(n_rows, size=sample_size, replace=False))
+    sample = normalize_rows(vectors[sample_rows])
+
+    centroids = sample[rng.choice(sample_size, size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_clusters)
+        # Los clusters vacíos se resiembran con puntos aleatorios
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def _assign_clusters(vectors: np.ndarray, centroids: np.ndarray, block_size: int) -> np.ndarray:
+    labels = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], block_size):
+        block = normalize_rows(vectors[start:start + block_size])
+        labels[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def build_index(
+    index_dir: str,
+    embeddings: np.ndarray,
+    chunks: Iterable[Dict],
+    n_clusters: int = 0,
+    corpus_version: str = None,
+    embedding_model: str = None,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> Dict:
+    """
+    Escribe un índice en disco.
+
+    - embeddings: matriz (n, dim); puede ser un np.memmap, se copia por bloques.
+    - chunks: iterable con un dict por fila (al menos 'id' y 'text'), en el mismo orden.
+    - n_clusters > 0 activa el modo IVF: las filas se reordenan por cluster para que
+      cada partición sea un tramo contiguo del fichero mapeado.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    n_rows, dim = embeddings.shape
+
+    # 1. Metadatos de los chunks (jsonl + offsets de byte para lectura aleatoria)
+    offsets = [0]
+    with open(os.path.join(index_dir, CHUNKS_FILE), "wb") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+    if len(offsets) - 1 != n_rows:
+        raise ValueError(f"Hay {len(offsets) - 1} chunks para {n_rows} embeddings")
+    np.save(os.path.join(index_dir, CHUNK_OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+
+    # 2. Particionado IVF (opcional)
+    n_clusters = min(n_clusters, n_rows)
+    if n_clusters > 1:
+        centroids = train_centroids(embeddings, n_clusters)
+        labels = _assign_clusters(embeddings, centroids, block_size)
+        order = np.argsort(labels, kind="stable")
+        cluster_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=n_clusters))]
+        ).astype(np.int64)
+        np.save(os.path.join(index_dir, CENTROIDS_FILE), centroids)
+        np.save(os.path.join(index_dir, CLUSTER_OFFSETS_FILE), cluster_offsets)
+        np.save(os.path.join(index_dir, ROW_IDS_FILE), order.astype(np.int64))
+    else:
+        n_clusters = 0
+        order = None
+        for name in (CENTROIDS_FILE, CLUSTER_OFFSETS_FILE, ROW_IDS_FILE):
+            path = os.path.join(index_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # 3. Matriz de embeddings normalizada, escrita por bloques
+    out = np.lib.format.open_memmap(
+        os.path.join(index_dir, EMBEDDINGS_FILE), mode="w+", dtype=np.float32, shape=(n_rows, dim)
+    )
+    for start in range(0, n_rows, block_size):
+        rows = slice(start, start + block_size) if order is None else order[start:start + block_size]
+        out[start:start + block_size] = normalize_rows(embeddings[rows])
+    out.flush()
+    del out
+
+    meta = {
+        "size": int(n_rows),
+        "dim": int(dim),
+        "n_clusters": int(n_clusters),
+        "corpus_version": corpus_version,
+        "embedding_model": embedding_model,
+        "created_at": time.time()
+    }
+    with open(os.path.join(index_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class VectorIndex:
+    """
+    Índice de embeddings en disco, mapeado en memoria.
+
+    Varios workers de uvicorn que abren el mismo índice comparten una única copia
+    en la page cache del sistema operativo.
+    """
+
+    def __init__(self, index_dir: str, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.index_dir = index_dir
+        self.block_size = block_size
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self.chunk_offsets = np.load(os.path.join(index_dir, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        self._chunks_file = open(os.path.join(index_dir, CHUNKS_FILE), "rb")
+        self._chunks_mmap = (
+            mmap.mmap(self._chunks_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.size else None
+        )
+
+        self.centroids = None
+        self.cluster_offsets = None
+        self.row_ids = None
+        self._embedding_rows = None
+        if self.meta.get("n_clusters"):
+            self.centroids = np.load(os.path.join(index_dir, CENTROIDS_FILE))
+            self.cluster_offsets = np.load(os.path.join(index_dir, CLUSTER_OFFSETS_FILE))
+            self.row_ids = np.load(os.path.join(index_dir, ROW_IDS_FILE), mmap_mode="r")
+
+    @property
+    def size(self) -> int:
+        return self.meta["size"]
+
+    @property
+    def dim(self) -> int:
+        return self.meta["dim"]
+
+    @property
+    def corpus_version(self) -> Optional[str]:
+        return self.meta.get("corpus_version")
+
+    @property
+    def is_partitioned(self) -> bool:
+        return self.centroids is not None
+
+    def prefetch(self) -> int:
+        """
+        Pide al sistema operativo que cargue el índice en la page cache (madvise
+        WILLNEED, lectura anticipada en segundo plano): la primera búsqueda tras un
+        arranque en frío no paga los fallos de página. Devuelve los bytes avisados.
+        """
+        advice = getattr(mmap, "MADV_WILLNEED", None)
+        if advice is None:
+            return 0
+        maps = [self._chunks_mmap] + [
+            getattr(array, "_mmap", None) for array in (self.embeddings, self.chunk_offsets, self.row_ids)
+            if array is not None
+        ]
+        total = 0
+        for mapped in maps:
+            if mapped is not None and len(mapped):
+                mapped.madvise(advice)
+                total += len(mapped)
+        return total
+
+    def close(self):
+        if self._chunks_mmap is not None:
+            self._chunks_mmap.close()
+        self._chunks_file.close()
+
+    def search(
+        self, query_vectors: np.ndarray, top_k: int, nprobe: int = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Búsqueda top-k por similitud coseno para un lote de consultas.
+
+        Devuelve (filas, scores), ambos de forma (n_queries, k). Las filas son
+        posiciones de chunk (ver get_chunk); si no hay k candidatos se rellena con -1.
+        """
+        queries = normalize_rows(np.atleast_2d(query_vectors))
+        if self.size == 0 or top_k <= 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if self.is_partitioned:
+            return self._search_ivf(queries, top_k, nprobe or 1)
+        return self._search_flat(queries, top_k)
+
+    def _search_flat(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        candidate_rows, candidate_scores = [], []
+        for start in range(0, self.size, self.block_size):
+            scores = queries @ self.embeddings[start:start + self.block_size].T
+            rows, block_scores = _top_k(scores, top_k)
+            candidate_rows.append(rows + start)
+            candidate_scores.append(block_scores)
+        rows = np.concatenate(candidate_rows, axis=1)
+        scores = np.concatenate(candidate_scores, axis=1)
+        idx, top_scores = _top_k(scores, top_k)
+        return np.take_along_axis(rows, idx, axis=1), top_scores
+
+    def _search_ivf(self, queries: np.ndarray, top_k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        probes, _ = _top_k(queries @ self.centroids.T, nprobe)
+        k = min(top_k, self.size)
+        out_rows = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        out_scores = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+
+        for qi, query in enumerate(queries):
+            ranges = [
+                (self.cluster_offsets[c], self.cluster_offsets[c + 1])
+                for c in probes[qi] if self.cluster_offsets[c + 1] > self.cluster_offsets[c]
+            ]
+            if not ranges:
+                continue
+            vectors = np.concatenate([self.embeddings[s:e] for s, e in ranges])
+            rows = np.concatenate([np.arange(s, e) for s, e in ranges])
+            idx, scores = _top_k((vectors @ query)[np.newaxis, :], k)
+            found = idx.shape[1]
+            out_rows[qi, :found] = self.row_ids[rows[idx[0]]]
+            out_scores[qi, :found] = scores[0]
+        return out_rows, out_scores
+
+    def embedding_rows(self, chunk_rows: np.ndarray) -> np.ndarray:
+        """Traduce posiciones de chunk a filas de la matriz (difieren en modo IVF)."""
+        if self.row_ids is None:
+            return np.asarray(chunk_rows)
+        if self._embedding_rows is None:
+            self._embedding_rows = np.argsort(self.row_ids)
+        return self._embedding_rows[chunk_rows]
+
+    def iter_chunks(self) -> Iterator[Dict]:
+        """Recorre los metadatos de todos los chunks en su orden original."""
+        with open(os.path.join(self.index_dir, CHUNKS_FILE), "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def get_chunk(self, row: int, score: float = 0.0) -> RetrievedChunk:
+        """Lee del fichero mapeado solo la línea del chunk pedido."""
+        start, end = int(self.chunk_offsets[row]), int(self.chunk_offsets[row + 1])
+        data = json.loads(self._chunks_mmap[start:end])
+        return RetrievedChunk(
+            id=data.pop("id"),
+            text=data.pop("text"),
+            score=float(score),
+            source=data.pop("source", ""),
+            metadata=data
+        )
@@ -1,55 +1,514 @@
+import asyncio
 import redis
+import redis.asyncio as aioredis
 import json
 import hashlib
-from typing import Optional
+import threading
+import time
+import uuid
+import zlib
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.sre.config.prompts import PROMPT_VERSION
 from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.tracing import span
+from src.sre.monitoring.metrics import (
+    CACHE_TIER_HITS, L1_CACHE_ENTRIES, L1_CACHE_BYTES,
+    SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SIMILARITY, CACHE_INVALIDATED_KEYS
+)
+from src.sre.utils.text import normalize_query
 
 settings = get_settings()
+logger = get_logger("src.utils.cache")
+
+# Canal pub/sub para invalidar la L1 de todos los workers
+INVALIDATION_CHANNEL = "rag_cache:invalidate"
+# Mensaje del canal con claves concretas a borrar (el resto de mensajes vacían la L1)
+EVICT_MESSAGE_PREFIX = b"keys:"
+
+# Conjuntos de claves por etiqueta (ZSET clave -> expiración), para invalidar en bloque:
+#   prompt:<versión>  doc:<id del documento>  corpus:<versión del corpus>
+TAG_KEY_PREFIX = "rag_cache:tag:"
+PROMPT_VERSION_KEY = "rag_cache:meta:prompt_version"
+
+# Cabecera de 1 byte del formato de los valores guardados en Redis
+_RAW_JSON = b"j"
+_ZLIB_JSON = b"z"
+# Claves borradas por cada UNLINK en clear()
+UNLINK_CHUNK_SIZE = 500
+
+
+def encode_value(value: dict) -> bytes:
+    """JSON compacto; por encima de cierto tamaño, comprimido con zlib."""
+    data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if settings.cache_compression_min_bytes and len(data) >= settings.cache_compression_min_bytes:
+        compressed = zlib.compress(data, settings.cache_compression_level)
+        if len(compressed) < len(data):
+            return _ZLIB_JSON + compressed
+    return _RAW_JSON + data
+
+
+def decode_value(data: bytes) -> dict:
+    header, payload = data[:1], data[1:]
+    if header == _ZLIB_JSON:
+        return json.loads(zlib.decompress(payload))
+    if header == _RAW_JSON:
+        return json.loads(payload)
+    # Valores antiguos: JSON en texto plano sin cabecera
+    return json.loads(data)
+
 
 class RedisCache:
-    """Caché de respuestas RAG."""
-    
+    """Caché de respuestas RAG (cliente asyncio con pool de conexiones)."""
+
     def __init__(self):
-        self.redis_client = redis.Redis(
+        self.pool = aioredis.ConnectionPool(
             host=settings.redis_host,
             port=settings.redis_port,
-            decode_responses=True
+            max_connections=settings.redis_max_connections
         )
+        self.redis_client = aioredis.Redis(connection_pool=self.pool)
         self.ttl = 3600  # 1 hora de vida para la caché
 
-    def _generate_key(self, query: str, context_chunks: list) -> str:
-        """Genera una clave única (hash) basada en la pregunta y el contexto."""
-        # Si cambia el contexto (ej. documentos actualizados), cambia la key
-        context_str = json.dumps(context_chunks, sort_keys=True)
-        combined = f"{query}:{context_str}"
-        return f"rag_cache:{hashlib.md5(combined.encode()).hexdigest()}"
+    def _generate_key(self, query: str, chunk_ids: List[str]) -> str:
+        """
+        Clave de la pregunta normalizada, los ids de sus chunks y la versión del prompt.
 
-    def get(self, query: str, context_chunks: list) -> Optional[dict]:
+        Los ids llevan un hash del contenido del chunk: si un documento cambia, cambian
+        sus ids y la clave, sin tener que serializar ni hashear el texto del contexto.
+        """
+        combined = normalize_query(query) + "\0" + "\x1f".join(chunk_ids)
+        digest = hashlib.blake2b(combined.encode("utf-8"), digest_size=16).hexdigest()
+        return f"rag_cache:{PROMPT_VERSION}:{digest}"
+
+    def _tags(self, documents: Iterable[str]) -> List[str]:
+        return [f"prompt:{PROMPT_VERSION}"] + [f"doc:{doc}" for doc in dict.fromkeys(documents) if doc]
+
+    def _queue_tags(self, pipe, key: str, tags: List[str]):
+        """Añade la clave a los conjuntos de sus etiquetas (en la misma ida y vuelta que el SET)."""
+        now = time.time()
+        for tag in tags:
+            tag_key = TAG_KEY_PREFIX + tag
+            pipe.zadd(tag_key, {key: now + self.ttl})
+            # Los miembros ya caducados se purgan al paso: el conjunto no crece sin límite
+            pipe.zremrangebyscore(tag_key, "-inf", now)
+            pipe.expire(tag_key, self.ttl)
+
+    async def get(self, query: str, chunk_ids: List[str]) -> Optional[dict]:
         """Intenta recuperar respuesta cacheada."""
-        key = self._generate_key(query, context_chunks)
-        cached = self.redis_client.get(key)
+        key = self._generate_key(query, chunk_ids)
+        with span("cache.redis_get") as s:
+            cached = await self.redis_client.get(key)
+            s.set("hit", cached is not None)
         if cached:
-            return json.loads(cached)
+            return decode_value(cached)
         return None
 
-    def set(self, query: str, context_chunks: list, response: dict):
-        """Guarda respuesta en caché."""
-        key = self._generate_key(query, context_chunks)
-        self.redis_client.setex(
-            name=key,
-            time=self.ttl,
-            value=json.dumps(response)
-        )
+    async def get_many(self, items: List[Tuple[str, List[str]]]) -> List[Optional[dict]]:
+        """Varias consultas (pregunta, ids de chunks) en una sola ida y vuelta (MGET)."""
+        if not items:
+            return []
+        keys = [self._generate_key(query, chunk_ids) for query, chunk_ids in items]
+        with span("cache.redis_mget", keys=len(keys)):
+            values = await self.redis_client.mget(keys)
+        return [decode_value(value) if value else None for value in values]
 
-    def clear(self):
+    async def set(self, query: str, chunk_ids: List[str], response: dict, documents: Iterable[str] = ()):
+        """Guarda respuesta en caché, etiquetada con la versión del prompt y sus documentos."""
+        key = self._generate_key(query, chunk_ids)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.set(key, encode_value(response), ex=self.ttl)
+        self._queue_tags(pipe, key, self._tags(documents))
+        with span("cache.redis_set"):
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> List[str]:
+        """
+        Borra las entradas de las etiquetas dadas: trabajo proporcional a las afectadas,
+        sin recorrer el keyspace. Avisa a los workers para que las quiten de su L1.
+        """
+        evicted: List[str] = []
+        for tag in tags:
+            tag_key = TAG_KEY_PREFIX + tag
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.zrange(tag_key, 0, -1)
+            pipe.unlink(tag_key)
+            members, _ = await pipe.execute()
+            keys = [m.decode() if isinstance(m, bytes) else m for m in members]
+            for i in range(0, len(keys), UNLINK_CHUNK_SIZE):
+                await self.redis_client.unlink(*keys[i:i + UNLINK_CHUNK_SIZE])
+            CACHE_INVALIDATED_KEYS.labels(kind=tag.split(":", 1)[0]).inc(len(keys))
+            evicted.extend(keys)
+        if evicted:
+            await publish_eviction(self.redis_client, evicted)
+        logger.info("cache_tags_invalidated", tags=list(tags), keys=len(evicted))
+        return evicted
+
+    async def retire_old_prompt_versions(self) -> List[str]:
+        """Al desplegar un prompt nuevo, libera las entradas de la versión anterior."""
+        previous = await self.redis_client.getset(PROMPT_VERSION_KEY, PROMPT_VERSION)
+        if previous is None:
+            return []
+        previous = previous.decode() if isinstance(previous, bytes) else previous
+        if previous == PROMPT_VERSION:
+            return []
+        return await self.invalidate_tags([f"prompt:{previous}"])
+
+    async def _unlink_pattern(self, pattern: str):
+        """Borra por patrón: SCAN + UNLINK por bloques (borrado no bloqueante en Redis)."""
+        batch = []
+        async for key in self.redis_client.scan_iter(match=pattern, count=UNLINK_CHUNK_SIZE):
+            batch.append(key)
+            if len(batch) >= UNLINK_CHUNK_SIZE:
+                await self.redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            await self.redis_client.unlink(*batch)
+
+    async def clear(self):
         """Limpia todo el caché (útil para tests)."""
-        for key in self.redis_client.scan_iter("rag_cache:*"):
-            self.redis_client.delete(key)
+        await self._unlink_pattern("rag_cache:*")
+
+    async def close(self):
+        await self.pool.disconnect()
+
+class _VectorMirror:
+    """Copia local (por worker) de los embeddings de la caché semántica de una versión."""
+
+    def __init__(self, generation: Optional[str] = None):
+        self.generation = generation  # la de la lista de Redis de la que se copió
+        self.entry_ids = []
+        self.matrix: Optional[np.ndarray] = None
+        self.size = 0
+
+    def append(self, entry_id: str, vector: np.ndarray):
+        if self.matrix is None:
+            self.matrix = np.empty((64, vector.shape[0]), dtype=np.float32)
+        elif self.size == self.matrix.shape[0]:
+            # Crecimiento geométrico: inserciones amortizadas O(1)
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.matrix[self.size] = vector
+        self.entry_ids.append(entry_id)
+        self.size += 1
+
+
+class SemanticCache(RedisCache):
+    """
+    Caché semántica: además de la clave exacta, responde preguntas parecidas.
+
+    Guarda el embedding de cada pregunta junto a la respuesta y busca el vecino
+    más cercano (coseno) entre las preguntas cacheadas de la misma versión del corpus
+    y del prompt: como en la clave exacta, un prompt nuevo no reutiliza respuestas viejas.
+    """
+
+    ENTRY_ID_BYTES = 16
+
+    def __init__(self, threshold: float = None, max_entries: int = None):
+        super().__init__()
+        self.threshold = settings.semantic_cache_threshold if threshold is None else threshold
+        self.max_entries = max_entries or settings.semantic_cache_max_entries
+        self._mirrors: Dict[str, _VectorMirror] = {}  # clave del índice en Redis -> copia local
+        self._lock = asyncio.Lock()
+
+    def _index_key(self, corpus_version: str) -> str:
+        return f"rag_semcache:{PROMPT_VERSION}:{corpus_version}:index"
+
+    def _entry_key(self, corpus_version: str, entry_id: str) -> str:
+        return f"rag_semcache:{PROMPT_VERSION}:{corpus_version}:entry:{entry_id}"
+
+    def _generation_key(self, corpus_version: str) -> str:
+        return self._index_key(corpus_version) + ":gen"
+
+    async def _sync_mirror(self, corpus_version: str) -> _VectorMirror:
+        """
+        Trae solo los vectores añadidos desde la última consulta.
+
+        La lista solo crece mientras no cambie su generación; si cambia (limpiada,
+        invalidada, expirada o rotada) la copia local se rehace entera.
+        """
+        index_key = self._index_key(corpus_version)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.get(self._generation_key(corpus_version))
+        pipe.llen(index_key)
+        generation, length = await pipe.execute()
+        generation = generation.decode() if isinstance(generation, bytes) else generation
+        mirror = self._mirrors.get(index_key)
+        # Camino habitual sin lock: misma lista y mismo tamaño, la copia local vale
+        if mirror is not None and mirror.generation == generation and mirror.size == length:
+            return mirror
+        async with self._lock:
+            mirror = self._mirrors.get(index_key)
+            if mirror is None or mirror.generation != generation or length < mirror.size:
+                mirror = self._mirrors[index_key] = _VectorMirror(generation)
+            new_items = await self.redis_client.lrange(index_key, mirror.size, -1)
+            for item in new_items:
+                mirror.append(
+                    item[:self.ENTRY_ID_BYTES].decode(),
+                    np.frombuffer(item[self.ENTRY_ID_BYTES:], dtype=np.float32)
+                )
+            return mirror
+
+    async def lookup(self, query_vector: np.ndarray, corpus_version: str, threshold: float = None) -> Optional[dict]:
+        """Respuesta de la pregunta cacheada más parecida, si supera el umbral."""
+        with span("cache.semantic_lookup"):
+            return await self._lookup(query_vector, corpus_version, threshold)
+
+    async def _lookup(self, query_vector: np.ndarray, corpus_version: str, threshold: float = None) -> Optional[dict]:
+        mirror = await self._sync_mirror(corpus_version)
+        if mirror.size == 0:
+            SEMANTIC_CACHE_LOOKUPS.labels(result="miss").inc()
+            return None
+
+        scores = mirror.matrix[:mirror.size] @ query_vector
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+        SEMANTIC_CACHE_SIMILARITY.observe(similarity)
+        if similarity < (self.threshold if threshold is None else threshold):
+            SEMANTIC_CACHE_LOOKUPS.labels(result="miss").inc()
+            return None
+
+        cached = await self.redis_client.get(self._entry_key(corpus_version, mirror.entry_ids[best]))
+        if not cached:
+            SEMANTIC_CACHE_LOOKUPS.labels(result="expired").inc()
+            return None
+        SEMANTIC_CACHE_LOOKUPS.labels(result="hit").inc()
+        response = decode_value(cached)
+        response["metadata"]["semantic_similarity"] = similarity
+        return response
+
+    async def store(
+        self,
+        query: str,
+        query_vector: np.ndarray,
+        corpus_version: str,
+        response: dict,
+        documents: Iterable[str] = ()
+    ):
+        """Guarda la respuesta y publica el embedding de la pregunta para los demás workers."""
+        entry_id = hashlib.md5(normalize_query(query).encode()).hexdigest()[:self.ENTRY_ID_BYTES]
+        entry_key = self._entry_key(corpus_version, entry_id)
+        index_key = self._index_key(corpus_version)
+        generation_key = self._generation_key(corpus_version)
+        # NX: una pregunta repetida no duplica su vector en el índice
+        if not await self.redis_client.set(entry_key, encode_value(response), ex=self.ttl, nx=True):
+            return
+        length = await self.redis_client.llen(index_key)
+        rotate = length >= self.max_entries
+        vector = np.asarray(query_vector, dtype=np.float32)
+        pipe = self.redis_client.pipeline(transaction=True)
+        if rotate:
+            # Índice lleno (también de vectores cuyas entradas ya se borraron): se descartan
+            # los más antiguos y cambia la generación para que los workers rehagan su copia
+            keep = self.max_entries - max(1, self.max_entries // 10)
+            pipe.ltrim(index_key, -keep, -1)
+        pipe.rpush(index_key, entry_id.encode() + vector.tobytes())
+        # TTL solo al crearse: con tráfico constante el índice no se renueva sin fin
+        pipe.expire(index_key, self.ttl, nx=True)
+        # Toda la caché semántica de una versión del corpus o del prompt se libera de una vez;
+        # la entrada además cae con sus documentos (el índice solo apunta a ella)
+        self._queue_tags(pipe, entry_key, [f"corpus:{corpus_version}"] + self._tags(documents))
+        index_tags = [f"corpus:{corpus_version}", f"prompt:{PROMPT_VERSION}"]
+        self._queue_tags(pipe, index_key, index_tags)
+        self._queue_tags(pipe, generation_key, index_tags)
+        results = await pipe.execute()
+        new_length = results[1 if rotate else 0]
+        if rotate or new_length == 1:
+            # Lista nueva o rotada: generación nueva (caduca con el índice)
+            await self.redis_client.set(generation_key, uuid.uuid4().hex, ex=self.ttl)
+
+    async def clear(self):
+        await super().clear()
+        await self._unlink_pattern("rag_semcache:*")
+        async with self._lock:
+            self._mirrors.clear()
+
+class LocalCache:
+    """LRU en memoria del proceso, con TTL y límite de entradas y de bytes."""
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl: float = None):
+        self.max_entries = max_entries or settings.l1_cache_max_entries
+        self.max_bytes = max_bytes or settings.l1_cache_max_bytes
+        self.ttl = ttl or settings.l1_cache_ttl_seconds
+        # key -> (expira_en, valor serializado). Se guarda JSON para que quien lo lea
+        # pueda modificar su copia sin alterar la caché.
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+        return json.loads(item[1])
+
+    def set(self, key: str, value: dict):
+        encoded = json.dumps(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, encoded)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+        self._update_gauges()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        self._update_gauges()
+
+    def discard(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+        self._update_gauges()
+
+    def _remove(self, key: str):
+        _, encoded = self._data.pop(key)
+        self._bytes -= len(encoded)
+
+    def _update_gauges(self):
+        L1_CACHE_ENTRIES.set(len(self._data))
+        L1_CACHE_BYTES.set(self._bytes)
+
+
+class TieredCache:
+    """
+    L1 (memoria del worker) delante de la caché Redis (L2), con la misma API.
+
+    La L1 de todos los workers se invalida por pub/sub de Redis cuando se llama a
+    clear() o cambia el corpus; el TTL corto de la L1 acota el desfase si se pierde
+    algún mensaje.
+    """
+
+    LISTENER_RETRY_SECONDS = 5.0
+
+    def __init__(self, l2: RedisCache, l1: LocalCache = None):
+        self.l2 = l2
+        self.l1 = l1 or LocalCache()
+        self._listener: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name):
+        # Métodos propios de la L2 (p. ej. lookup/store de la caché semántica)
+        return getattr(self.l2, name)
+
+    def _ensure_listener(self):
+        """Lanza (o relanza) la tarea que escucha el canal de invalidación."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            pubsub = self.l2.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    data = message.get("data") or b""
+                    if isinstance(data, str):
+                        data = data.encode()
+                    if data.startswith(EVICT_MESSAGE_PREFIX):
+                        self.l1.discard(json.loads(data[len(EVICT_MESSAGE_PREFIX):]))
+                        continue
+                    self.l1.clear()
+                    logger.info("l1_cache_invalidated", reason=data.decode(errors="replace"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("l1_invalidation_listener_error", error=str(e))
+                # Sin mensajes fiables la L1 podría quedarse obsoleta: se vacía y se reintenta
+                self.l1.clear()
+                await asyncio.sleep(self.LISTENER_RETRY_SECONDS)
+            finally:
+                await pubsub.reset()
+
+    async def get(self, query: str, chunk_ids: List[str]) -> Optional[dict]:
+        self._ensure_listener()
+        key = self.l2._generate_key(query, chunk_ids)
+        cached = self.l1.get(key)
+        if cached is not None:
+            CACHE_TIER_HITS.labels(tier="l1").inc()
+            return cached
+        cached = await self.l2.get(query, chunk_ids)
+        if cached is not None:
+            CACHE_TIER_HITS.labels(tier="l2").inc()
+            self.l1.set(key, cached)
+        return cached
+
+    async def get_many(self, items: List[Tuple[str, List[str]]]) -> List[Optional[dict]]:
+        self._ensure_listener()
+        keys = [self.l2._generate_key(query, chunk_ids) for query, chunk_ids in items]
+        results = [self.l1.get(key) for key in keys]
+        CACHE_TIER_HITS.labels(tier="l1").inc(sum(r is not None for r in results))
+        missing = [i for i, r in enumerate(results) if r is None]
+        for i, cached in zip(missing, await self.l2.get_many([items[i] for i in missing])):
+            if cached is not None:
+                CACHE_TIER_HITS.labels(tier="l2").inc()
+                self.l1.set(keys[i], cached)
+                results[i] = cached
+        return results
+
+    async def set(self, query: str, chunk_ids: List[str], response: dict, documents: Iterable[str] = ()):
+        await self.l2.set(query, chunk_ids, response, documents)
+        self.l1.set(self.l2._generate_key(query, chunk_ids), response)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> List[str]:
+        evicted = await self.l2.invalidate_tags(tags)
+        # La L1 propia se limpia ya; la del resto de workers, al recibir el aviso
+        self.l1.discard(evicted)
+        return evicted
+
+    async def clear(self):
+        await self.l2.clear()
+        self.l1.clear()
+        await publish_invalidation(self.l2.redis_client, "clear")
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        await self.l2.close()
+
+
+async def publish_eviction(redis_client, keys: List[str], chunk_size: int = UNLINK_CHUNK_SIZE):
+    """Pide a todos los workers que quiten estas claves de su L1."""
+    try:
+        for i in range(0, len(keys), chunk_size):
+            message = EVICT_MESSAGE_PREFIX + json.dumps(keys[i:i + chunk_size]).encode()
+            await redis_client.publish(INVALIDATION_CHANNEL, message)
+    except redis.RedisError as e:
+        logger.warning("l1_eviction_publish_failed", keys=len(keys), error=str(e))
+
+async def publish_invalidation(redis_client, reason: str):
+    """Pide a todos los workers que vacíen su L1 (clear, corpus nuevo...)."""
+    try:
+        await redis_client.publish(INVALIDATION_CHANNEL, reason)
+    except redis.RedisError as e:
+        logger.warning("l1_invalidation_publish_failed", reason=reason, error=str(e))
 
 # Singleton
 _cache_instance = None
 def get_cache() -> RedisCache:
     global _cache_instance
     if _cache_instance is None:
-        _cache_instance = RedisCache()
-    return _cache_instance
\ No newline at end of file
+        _cache_instance = SemanticCache() if settings.semantic_cache_enabled else RedisCache()
+        if settings.l1_cache_enabled:
+            _cache_instance = TieredCache(_cache_instance)
+    return _cache_instance
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.sre.config.settings import get_settings
+from src.sre.generation.llm_client import get_rag_model
+from src.sre.generation.model_router import get_model_router
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import (
+    CACHE_WARMUP_QUERIES, CACHE_WARMUP_COST, CACHE_WARMUP_PROGRESS, track_llm_metrics
+)
+from src.sre.retrieval.retriever import get_retriever
+from src.sre.utils.cache import get_cache
+from src.sre.utils.text import normalize_query
+
+settings = get_settings()
+logger = get_logger("src.utils.cache_warming")
+
+# Solo un worker calienta la caché al arrancar
+WARMUP_LOCK_KEY = "rag_warmup:lock"
+DEFAULT_TOP_K = 5
+
+
+@dataclass
+class WarmupQuery:
+    query: str
+    top_k: int
+    count: int
+
+
+def _query_from_record(record: dict) -> Optional[Tuple[str, int]]:
+    """Pregunta de un registro: fichero de peticiones o línea de log estructurado."""
+    if "event" in record:
+        if record.get("event") != "request_received":
+            return None
+        query = record.get("query")
+    else:
+        query = record.get("query") or record.get("question")
+    if not isinstance(query, str) or not query.strip():
+        return None
+    return query, int(record.get("top_k") or DEFAULT_TOP_K)
+
+
+def mine_queries(paths: Iterable[str], top_n: int) -> List[WarmupQuery]:
+    """
+    Las top_n preguntas más frecuentes de los ficheros .jsonl (peticiones o logs JSON).
+
+    Se agrupan por forma normalizada y top_k; de cada grupo se calienta la forma
+    literal más repetida, que es la que tiene más opciones de volver a llegar.
+    """
+    groups: Dict[Tuple[str, int], Counter] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # líneas de log no JSON
+                parsed = _query_from_record(record) if isinstance(record, dict) else None
+                if parsed is None:
+                    continue
+                query, top_k = parsed
+                groups.setdefault((normalize_query(query), top_k), Counter())[query] += 1
+
+    ranked = sorted(groups.items(), key=lambda item: sum(item[1].values()), reverse=True)[:top_n]
+    return [
+        WarmupQuery(query=forms.most_common(1)[0][0], top_k=top_k, count=sum(forms.values()))
+        for (_, top_k), forms in ranked
+    ]
+
+
+class _RateLimiter:
+    """Espacia los inicios de las llamadas: como mucho `rate` por segundo."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class WarmupReport:
+    total: int = 0
+    warmed: int = 0
+    cached: int = 0
+    skipped_budget: int = 0
+    failed: int = 0
+    spent_usd: float = 0.0
+    elapsed_s: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+
+class CacheWarmer:
+    """
+    Precalcula respuestas por el camino normal (recuperación + RAGModel) y las guarda
+    en la caché, con límite de concurrencia, de ritmo y de gasto.
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        retriever=None,
+        budget_usd: float = None,
+        concurrency: int = None,
+        rate_per_second: float = None
+    ):
+        self.cache = cache or get_cache()
+        self.retriever = retriever or get_retriever()
+        self.budget_usd = settings.cache_warmup_budget_usd if budget_usd is None else budget_usd
+        self.concurrency = concurrency or settings.cache_warmup_concurrency
+        self.rate_per_second = settings.cache_warmup_rate_per_second if rate_per_second is None else rate_per_second
+        # Gasto comprometido: real de lo ya generado + estimado (peor caso) de lo que está en vuelo
+        self._committed_usd = 0.0
+        self._budget_lock = asyncio.Lock()
+
+    async def _reserve(self, estimate: float) -> bool:
+        async with self._budget_lock:
+            if self._committed_usd + estimate > self.budget_usd:
+                return False
+            self._committed_usd += estimate
+            return True
+
+    async def _settle(self, estimate: float, actual: float):
+        async with self._budget_lock:
+            self._committed_usd += actual - estimate
+
+    async def _warm_one(self, item: WarmupQuery, limiter: _RateLimiter, report: WarmupReport) -> str:
+        chunks = await asyncio.to_thread(self.retriever.retrieve, item.query, item.top_k)
+        context_chunks = [chunk.text for chunk in chunks]
+        chunk_ids = [chunk.id for chunk in chunks]
+        if await self.cache.get(item.query, chunk_ids) is not None:
+            return "cached"
+
+        model = get_rag_model(get_model_router().decide(item.query, context_chunks).model)
+        # Coste conocido antes de llamar: entrada + max_tokens
+        estimate = model.estimate_cost(item.query, context_chunks)
+        if not await self._reserve(estimate):
+            return "skipped_budget"
+
+        actual = 0.0
+        try:
+            await limiter.wait()
+            # Sin hedge ni degradación: el gasto reservado es el de esta única llamada
+            result = await model.agenerate_response(
+                query=item.query, context_chunks=context_chunks, run_name="cache_warmup", resilient=False
+            )
+            actual = result["metrics"]["cost_usd"]
+        finally:
+            await self._settle(estimate, actual)
+
+        track_llm_metrics(
+            model=result["metadata"]["model"],
+            input_tokens=result["metrics"]["input_tokens"],
+            output_tokens=result["metrics"]["output_tokens"],
+            cost=actual
+        )
+        CACHE_WARMUP_COST.inc(actual)
+        report.spent_usd += actual
+        response_data = {
+            "answer": result["answer"],
+            "metrics": result["metrics"],
+            "metadata": {**result["metadata"], "sources": chunk_ids}
+        }
+        documents = [chunk.source for chunk in chunks]
+        await self.cache.set(item.query, chunk_ids, response_data, documents)
+        if settings.semantic_cache_enabled:
+            vector = await asyncio.to_thread(self.retriever.embed_query, item.query)
+            await self.cache.store(item.query, vector, self.retriever.corpus_version, response_data, documents)
+        return "warmed"
+
+    async def warm(self, queries: List[WarmupQuery]) -> WarmupReport:
+        report = WarmupReport(total=len(queries))
+        if not queries:
+            return report
+        start = time.monotonic()
+        limiter = _RateLimiter(self.rate_per_second)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done = 0
+        CACHE_WARMUP_PROGRESS.set(0)
+
+        async def run(item: WarmupQuery):
+            nonlocal done
+            async with semaphore:
+                try:
+                    outcome = await self._warm_one(item, limiter, report)
+                except Exception as e:
+                    outcome = "failed"
+                    report.errors.append(f"{item.query}: {e}")
+                    logger.warning("cache_warmup_query_failed", query=item.query, error=str(e))
+            setattr(report, outcome, getattr(report, outcome) + 1)
+            CACHE_WARMUP_QUERIES.labels(result=outcome).inc()
+            done += 1
+            CACHE_WARMUP_PROGRESS.set(done / report.total)
+
+        await asyncio.gather(*[run(item) for item in queries])
+        report.elapsed_s = time.monotonic() - start
+        logger.info(
+            "cache_warmup_complete",
+            total=report.total,
+            warmed=report.warmed,
+            cached=report.cached,
+            skipped_budget=report.skipped_budget,
+            failed=report.failed,
+            spent_usd=report.spent_usd,
+            elapsed_s=report.elapsed_s
+        )
+        return report
+
+
+def warmup_sources() -> List[str]:
+    return [path.strip() for path in settings.cache_warmup_sources.split(",") if path.strip()]
+
+
+async def warm_cache_on_startup():
+    """Calentamiento en segundo plano al arrancar (un único worker, vía lock en Redis)."""
+    cache = get_cache()
+    try:
+        # Leer los logs es E/S de disco: fuera del event loop
+        queries = await asyncio.to_thread(mine_queries, warmup_sources(), settings.cache_warmup_top_n)
+        if not queries:
+            return
+        lock_ttl = int(settings.cache_warmup_lock_seconds)
+        if not await cache.redis_client.set(WARMUP_LOCK_KEY, "1", nx=True, ex=lock_ttl):
+            logger.info("cache_warmup_skipped", reason="another_worker")
+            return
+        await CacheWarmer(cache).warm(queries)
+    except Exception as e:
+        # El calentamiento nunca debe tumbar el arranque
+        logger.warning("cache_warmup_failed", error=str(e))
@@ -0,0 +1,47 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Módulo que se importa al usarlo por primera vez. Para dependencias pesadas
+    (mlflow, openai) que no hacen falta para arrancar el worker ni en muchos tests.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _load(self) -> ModuleType:
+        module = object.__getattribute__(self, "_module")
+        if module is None:
+            with object.__getattribute__(self, "_lock"):
+                module = object.__getattribute__(self, "_module")
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    object.__setattr__(self, "_module", module)
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return object.__getattribute__(self, "_module") is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    # Para que unittest.mock.patch("x.mlflow.MlflowClient") funcione sobre el proxy
+    def __setattr__(self, attr: str, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr: str):
+        delattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> LazyModule:
+    """`mlflow = lazy_import("mlflow")`: el import real ocurre al primer acceso."""
+    return LazyModule(name)
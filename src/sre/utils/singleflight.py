@@ -0,0 +1,179 @@
+import asyncio
+import time
+import uuid
+import redis
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from src.sre.config.settings import get_settings
+from src.sre.monitoring.logger import get_logger
+from src.sre.monitoring.metrics import SINGLEFLIGHT_REQUESTS
+from src.sre.monitoring.tracing import span
+from src.sre.utils.cache import get_cache
+
+settings = get_settings()
+logger = get_logger("src.utils.singleflight")
+
+LEASE_PREFIX = "rag_lease:"
+
+# Libera el lease solo si sigue siendo nuestro (si expiró, otro worker puede tenerlo)
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Alarga el lease solo si sigue siendo nuestro
+_RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Coalescencia de fallos de caché: una sola generación por clave a la vez.
+
+    - En el worker: las peticiones concurrentes con la misma clave comparten un futuro.
+    - Entre workers: el primero toma un lease corto en Redis (SET NX PX) y genera; el
+      resto sondea la caché hasta que aparece la respuesta. Si el lease desaparece sin
+      respuesta (el líder falló o expiró), otro worker lo toma y genera.
+    - El líder renueva el lease mientras genera: su TTL no tiene que cubrir la peor
+      cadena de plazos, hedges y colas, solo cuánto tardan los demás en notar que cayó.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        lease_seconds: float = None,
+        poll_interval: float = None,
+        max_poll_interval: float = 0.5
+    ):
+        self.redis_client = redis_client
+        self.lease_ms = int((lease_seconds or settings.singleflight_lease_seconds) * 1000)
+        self.poll_interval = poll_interval or settings.singleflight_poll_seconds
+        self.max_poll_interval = max(max_poll_interval, self.poll_interval)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def run(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[dict]],
+        fetch: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Tuple[dict, bool]:
+        """
+        Devuelve (respuesta, compartida).
+
+        generate debe dejar la respuesta en la caché antes de terminar: es lo que
+        leen (con fetch) los seguidores de otros workers.
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            # wait() no propaga la cancelación del líder (p. ej. su cliente se desconectó)
+            with span("singleflight.wait", scope="local"):
+                await asyncio.wait({future})
+            if not future.cancelled():
+                SINGLEFLIGHT_REQUESTS.labels(role="local_follower").inc()
+                return future.result(), True
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result, shared = await self._run_distributed(key, generate, fetch)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita el aviso de "exception never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, shared
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_distributed(self, key, generate, fetch) -> Tuple[dict, bool]:
+        lease_key = LEASE_PREFIX + key
+        token = uuid.uuid4().hex
+        delay = self.poll_interval
+        waited_since = None
+        while True:
+            try:
+                acquired = await self.redis_client.set(lease_key, token, nx=True, px=self.lease_ms)
+            except redis.RedisError as e:
+                # Sin Redis no hay coordinación entre workers: se genera sin lease
+                logger.warning("singleflight_lease_failed", error=str(e))
+                SINGLEFLIGHT_REQUESTS.labels(role="no_lease").inc()
+                return await generate(), False
+
+            if acquired:
+                try:
+                    # Otro líder pudo terminar entre nuestro fallo de caché y el lease
+                    cached = await fetch() if waited_since is not None else None
+                    if cached is not None:
+                        SINGLEFLIGHT_REQUESTS.labels(role="remote_follower").inc()
+                        return cached, True
+                    SINGLEFLIGHT_REQUESTS.labels(role="leader" if waited_since is None else "takeover").inc()
+                    renewal = asyncio.ensure_future(self._renew(lease_key, token))
+                    try:
+                        return await generate(), False
+                    finally:
+                        renewal.cancel()
+                finally:
+                    await self._release(lease_key, token)
+
+            # Seguidor: espera la respuesta del líder mientras su lease siga vivo
+            if waited_since is None:
+                waited_since = time.monotonic()
+            with span("singleflight.wait", scope="remote"):
+                cached = await self._wait_for_leader(lease_key, fetch, delay)
+            if cached is not None:
+                SINGLEFLIGHT_REQUESTS.labels(role="remote_follower").inc()
+                logger.debug(
+                    "singleflight_coalesced", key=key,
+                    waited_ms=(time.monotonic() - waited_since) * 1000
+                )
+                return cached, True
+
+    async def _wait_for_leader(self, lease_key: str, fetch, delay: float) -> Optional[dict]:
+        """Sondea la caché mientras el lease del líder siga vivo; None si desaparece sin respuesta."""
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+            cached = await fetch()
+            if cached is not None:
+                return cached
+            if not await self.redis_client.exists(lease_key):
+                return None
+
+    async def _renew(self, lease_key: str, token: str):
+        """Renueva el lease cada tercio de su TTL hasta que el líder termine (o lo pierda)."""
+        while True:
+            await asyncio.sleep(self.lease_ms / 3000)
+            try:
+                if not await self.redis_client.eval(_RENEW_SCRIPT, 1, lease_key, token, self.lease_ms):
+                    logger.warning("singleflight_lease_lost", key=lease_key)
+                    return
+            except redis.RedisError as e:
+                # Se reintenta en el siguiente tick; si no, el lease expira y otro worker genera
+                logger.warning("singleflight_renew_failed", error=str(e))
+
+    async def _release(self, lease_key: str, token: str):
+        try:
+            await self.redis_client.eval(_RELEASE_SCRIPT, 1, lease_key, token)
+        except redis.RedisError as e:
+            # El lease expira solo; los seguidores esperan como mucho su TTL
+            logger.warning("singleflight_release_failed", error=str(e))
+
+
+# Singleton
+_singleflight_instance = None
+def get_singleflight() -> SingleFlight:
+    global _singleflight_instance
+    if _singleflight_instance is None:
+        _singleflight_instance = SingleFlight(get_cache().redis_client)
+    return _singleflight_instance
@@ -0,0 +1,12 @@
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+# Signos que no cambian el sentido de la pregunta
+_EDGE_PUNCTUATION = "¿?¡!.,;: \"'"
+
+
+def normalize_query(query: str) -> str:
+    """Forma canónica de una pregunta: "¿Altura  de extintores?" == "altura de extintores"."""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _WHITESPACE.sub(" ", query).strip(_EDGE_PUNCTUATION)
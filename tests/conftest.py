@@ -0,0 +1,21 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.sre.api.admission import AdmissionController
+from src.sre.api.dependencies import Services, get_services
+from src.sre.api.main import app
+from src.sre.generation.model_router import ModelRouter
+
+
+@pytest.fixture
+def services():
+    """Clientes de los endpoints sustituidos por dobles (Redis e índice vectorial mockeados)."""
+    fakes = Services(
+        cache=AsyncMock(),
+        singleflight=MagicMock(),
+        model_router=ModelRouter(),
+        retriever=MagicMock(),
+        admission=AdmissionController()
+    )
+    app.dependency_overrides[get_services] = lambda: fakes
+    yield fakes
+    app.dependency_overrides.pop(get_services, None)
@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from src.sre.api.admission import AdmissionController, AdmissionRejected, ConcurrencyLimiter
+from src.sre.api.main import app
+
+
+@pytest.mark.asyncio
+async def test_limiter_queues_fifo_and_sheds_when_full_or_too_slow():
+    limiter = ConcurrencyLimiter("test", limit=1, max_queue=1)
+    await limiter.acquire(max_wait=5.0)
+
+    waiter = asyncio.create_task(limiter.acquire(max_wait=5.0))
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 1
+
+    # Cola llena: rechazo inmediato
+    with pytest.raises(AdmissionRejected) as full:
+        await limiter.acquire(max_wait=5.0)
+    assert full.value.status_code == 503 and full.value.reason == "test_queue_full"
+
+    # El hueco pasa al que esperaba
+    limiter.release(service_seconds=10.0)
+    await waiter
+    assert limiter.active == 1 and limiter.queue_depth == 0
+
+    # Con huecos de ~10 s, no cabe en un presupuesto de 1 s: rechazo sin esperar
+    with pytest.raises(AdmissionRejected) as slow:
+        await limiter.acquire(max_wait=1.0)
+    assert slow.value.reason == "test_wait_exceeds_budget"
+    assert slow.value.headers["Retry-After"] == "10"
+
+
+def test_client_rate_limit():
+    controller = AdmissionController(client_rate=1.0, client_burst=2)
+    controller.check_client("a")
+    controller.check_client("a")
+    with pytest.raises(AdmissionRejected) as limited:
+        controller.check_client("a")
+    assert limited.value.status_code == 429
+    controller.check_client("b")
+
+
+def test_batches_pay_their_full_cost():
+    controller = AdmissionController(client_rate=1.0, client_burst=3)
+    controller.check_client("a", cost=2)
+    # Quedan 1 token: un lote de 2 espera a que se repongan
+    with pytest.raises(AdmissionRejected) as limited:
+        controller.check_client("a", cost=2)
+    assert limited.value.reason == "client_rate_limited"
+    # Más llamadas que el burst: no se admitiría nunca, así que no se invita a reintentar
+    with pytest.raises(AdmissionRejected) as too_big:
+        controller.check_client("b", cost=4)
+    assert (too_big.value.status_code, too_big.value.reason) == (413, "client_cost_exceeds_burst")
+    assert "3" in too_big.value.detail and too_big.value.headers == {}
+
+
+@patch("src.sre.api.routes.settings.singleflight_enabled", False)
+def test_cache_hits_bypass_admission_and_misses_get_429(services):
+    services.retriever.retrieve.return_value = []
+    cached = {"answer": "en caché", "metrics": {}, "metadata": {}}
+    client = TestClient(app)
+    services.admission = AdmissionController(client_rate=0.001, client_burst=1)
+    services.admission.check_client("tester")  # agota el bucket del cliente
+
+    with patch("src.sre.generation.llm_client.RAGModel.agenerate_response", new_callable=AsyncMock) as generate:
+        services.cache.get.return_value = cached
+        hit = client.post("/query", json={"query": "hola"}, headers={"X-Client-Id": "tester"})
+        assert hit.status_code == 200 and hit.json()["answer"] == "en caché"
+
+        services.cache.get.return_value = None
+        miss = client.post("/query", json={"query": "adiós"}, headers={"X-Client-Id": "tester"})
+        assert miss.status_code == 429
+        assert int(miss.headers["Retry-After"]) > 0
+        stream = client.post("/query/stream", json={"query": "adiós"}, headers={"X-Client-Id": "tester"})
+        assert stream.status_code == 429
+        generate.assert_not_called()
+
+
+@patch("src.sre.api.routes.settings.semantic_cache_enabled", False)
+def test_batch_bigger_than_client_burst_gets_413_without_retry_after(services):
+    services.retriever.retrieve_batch.side_effect = lambda queries, top_k, vectors: [[] for _ in queries]
+    services.cache.get_many.side_effect = lambda items: [None for _ in items]
+    services.admission = AdmissionController(client_rate=1.0, client_burst=2)
+
+    with patch("src.sre.generation.llm_client.RAGModel.agenerate_response", new_callable=AsyncMock) as generate:
+        response = TestClient(app).post(
+            "/query/batch", json={"queries": [{"query": q} for q in ("uno", "dos", "tres")]}
+        )
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+    assert "2" in response.json()["detail"]
+    generate.assert_not_called()
@@ -1,5 +1,6 @@
+import json
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from src.sre.api.main import app
 
 client = TestClient(app)
@@ -12,16 +13,17 @@ def test_health_check():
 
 # PATCH 1: Calla a MLflow (evita el error de conexión al puerto 5000)
 @patch("src.sre.generation.llm_client.mlflow")
-# PATCH 2: Calla a Redis (evita el error de caché)
-@patch("src.sre.api.routes.cache")
-# PATCH 3: Calla a OpenAI (evita gastar dinero)
-@patch("src.sre.generation.llm_client.RAGModel.generate_response")
-def test_query_endpoint(mock_generate, mock_cache, mock_mlflow):
+# PATCH 2: Calla a OpenAI (evita gastar dinero)
+@patch("src.sre.generation.llm_client.RAGModel.agenerate_response", new_callable=AsyncMock)
+# PATCH 3: Sin singleflight (el lease entre workers vive en Redis)
+@patch("src.sre.api.routes.settings.singleflight_enabled", False)
+def test_query_endpoint(mock_generate, mock_mlflow, services):
     """
-    Test completo: Mockeamos MLflow, Redis y OpenAI.
+    Test completo: Mockeamos MLflow, Redis y OpenAI (Redis e índice, con el fixture services).
     """
-    # 1. Configurar Mock Caché (Vacía)
-    mock_cache.get.return_value = None 
+    # 1. Configurar Mock Caché (Vacía) y Retriever (sin chunks)
+    services.cache.get.return_value = None
+    services.retriever.retrieve.return_value = []
     
     # 2. Configurar Mock OpenAI (Respuesta Falsa)
     mock_response = {
@@ -29,7 +31,9 @@ def test_query_endpoint(mock_generate, mock_cache, mock_mlflow):
         "metrics": {
             "latency_ms": 100,
             "cost_usd": 0.0,
-            "tokens": 50
+            "tokens": 50,
+            "input_tokens": 35,
+            "output_tokens": 15
         },
         "metadata": {
             "model": "gpt-3.5-turbo",
@@ -57,4 +61,61 @@ def test_query_endpoint(mock_generate, mock_cache, mock_mlflow):
     assert data["answer"] == "Respuesta simulada de test"
     
     # Verificar que el código pasó por el router y llegó a intentar generar
-    mock_generate.assert_called_once()
\ No newline at end of file
+    mock_generate.assert_called_once()
+
+def test_query_stream_endpoint(services):
+    """El stream envía los tokens y termina con el mismo formato que /query."""
+    services.cache.get.return_value = None
+    services.retriever.retrieve.return_value = []
+
+    async def fake_stream(self, query, context_chunks, run_name=None, slot=None):
+        for token in ["Hola", " mundo"]:
+            yield "token", token
+        yield "done", {
+            "answer": "Hola mundo",
+            "metrics": {"latency_ms": 10, "cost_usd": 0.0, "tokens": 5, "input_tokens": 4, "output_tokens": 1},
+            "metadata": {"model": "gpt-3.5-turbo", "prompt_version": "v1.0", "run_id": "run-1"}
+        }
+
+    with patch("src.sre.generation.llm_client.RAGModel.astream_response", fake_stream):
+        response = client.post("/query/stream", json={"query": "Test query", "top_k": 1})
+
+    assert response.status_code == 200
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: token", "event: token", "event: done"]
+    done = json.loads(events[-1][1][len("data: "):])
+    assert done["answer"] == "Hola mundo"
+    assert done["metadata"]["run_id"] == "run-1"
+    services.cache.set.assert_called_once()
+
+
+@patch("src.sre.api.routes.settings.singleflight_enabled", False)
+def test_query_batch_endpoint(services):
+    """Deduplica, resuelve caché en bloque y devuelve errores por elemento, en orden."""
+    services.retriever.retrieve_batch.side_effect = lambda queries, top_k, vectors: [[] for _ in queries]
+    cached = {"answer": "De caché", "metrics": {}, "metadata": {"model": "gpt-3.5-turbo"}}
+    services.cache.get_many.side_effect = lambda items: [cached if q == "Cacheada" else None for q, _ in items]
+
+    async def fake_generate(query, context_chunks, run_name=None, slot=None):
+        if query == "Falla":
+            raise RuntimeError("OpenAI caído")
+        return {
+            "answer": f"Respuesta a {query}",
+            "metrics": {"latency_ms": 10, "cost_usd": 0.0, "tokens": 5, "input_tokens": 4, "output_tokens": 1},
+            "metadata": {"model": "gpt-3.5-turbo", "prompt_version": "v1.0", "run_id": "run"}
+        }
+
+    queries = ["¿Altura de extintores?", "Cacheada", "altura de  extintores", "Falla"]
+    with patch("src.sre.generation.llm_client.RAGModel.agenerate_response", side_effect=fake_generate) as mock_generate:
+        response = client.post("/query/batch", json={"queries": [{"query": q} for q in queries]})
+
+    assert response.status_code == 200
+    data = response.json()
+    results = data["results"]
+    assert results[0]["response"]["answer"] == "Respuesta a ¿Altura de extintores?"
+    assert results[2] == results[0]  # duplicada tras normalizar
+    assert results[1]["response"]["answer"] == "De caché"
+    assert results[3]["response"] is None and "OpenAI caído" in results[3]["error"]
+    assert data["metadata"] == {"total": 4, "unique": 3, "cache_hits": 1, "errors": 1}
+    assert mock_generate.call_count == 2
+    services.retriever.retrieve_batch.assert_called_once()
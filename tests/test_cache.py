@@ -0,0 +1,297 @@
+import json
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.sre.utils.cache import (
+    PROMPT_VERSION_KEY, LocalCache, RedisCache, SemanticCache, TieredCache, decode_value, encode_value
+)
+
+
+class FakeRedis:
+    """Redis asyncio en memoria con lo justo para la caché (sin TTL real)."""
+
+    def __init__(self, *args, **kwargs):
+        self.data = {}
+        self.round_trips = 0
+
+    async def get(self, key):
+        self.round_trips += 1
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        self.round_trips += 1
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def unlink(self, *keys):
+        self.round_trips += 1
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def scan_iter(self, match, count=None):
+        prefix = match.rstrip("*")
+        for key in [key for key in list(self.data) if key.startswith(prefix)]:
+            yield key
+
+    async def llen(self, key):
+        return len(self.data.get(key, []))
+
+    async def lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value)
+        return len(self.data[key])
+
+    async def ltrim(self, key, start, end):
+        items = self.data.get(key, [])
+        self.data[key] = items[start:] if end == -1 else items[start:end + 1]
+
+    async def expire(self, key, seconds, nx=False):
+        return True
+
+    async def getset(self, key, value):
+        previous = self.data.get(key)
+        self.data[key] = value.encode()
+        return previous
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zremrangebyscore(self, key, low, high):
+        members = self.data.get(key, {})
+        for member in [m for m, score in members.items() if score <= high]:
+            del members[member]
+
+    async def zrange(self, key, start, end):
+        return [m.encode() for m in sorted(self.data.get(key, {}), key=self.data[key].get)]
+
+    async def publish(self, channel, message):
+        return 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        self.client.round_trips += 1
+        return [await getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_value_encoding_compresses_large_answers():
+    small = {"answer": "corta"}
+    large = {"answer": "Los extintores se colocarán a 1,20 m. " * 200}
+    assert encode_value(small)[:1] == b"j"
+    encoded = encode_value(large)
+    assert encoded[:1] == b"z" and len(encoded) < len(json.dumps(large))
+    assert decode_value(encode_value(small)) == small and decode_value(encoded) == large
+    # Valores escritos por versiones anteriores (JSON en texto plano)
+    assert decode_value(json.dumps(small).encode()) == small
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_redis_cache_bulk_operations(mock_redis):
+    shared = mock_redis.return_value = FakeRedis()
+    cache = RedisCache()
+    for i in range(3):
+        await cache.set(f"q{i}", ["ctx"], {"answer": str(i)})
+
+    shared.round_trips = 0
+    results = await cache.get_many([("q0", ["ctx"]), ("q9", ["ctx"]), ("q2", ["ctx"])])
+    assert [r and r["answer"] for r in results] == ["0", None, "2"]
+    assert shared.round_trips == 1
+
+    await cache.clear()
+    assert shared.data == {}
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_semantic_cache_hits_similar_questions(mock_redis):
+    mock_redis.return_value = FakeRedis()
+    cache = SemanticCache(threshold=0.9)
+    response = {"answer": "A 1,20 m", "metrics": {}, "metadata": {}}
+
+    await cache.store("¿Altura de extintores?", _unit([1, 0, 0]), "v1", response)
+    hit = await cache.lookup(_unit([1, 0.1, 0]), "v1")
+    assert hit["answer"] == "A 1,20 m"
+    assert hit["metadata"]["semantic_similarity"] > 0.9
+
+    # Pregunta distinta o versión de corpus distinta: fallo
+    assert await cache.lookup(_unit([0, 1, 0]), "v1") is None
+    assert await cache.lookup(_unit([1, 0.1, 0]), "v2") is None
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_semantic_cache_sees_entries_from_other_workers(mock_redis):
+    mock_redis.return_value = FakeRedis()
+    worker_a, worker_b = SemanticCache(), SemanticCache()
+    assert await worker_b.lookup(_unit([0, 0, 1]), "v1") is None
+
+    await worker_a.store("pasillos", _unit([0, 0, 1]), "v1", {"answer": "1 m", "metrics": {}, "metadata": {}})
+    assert (await worker_b.lookup(_unit([0, 0, 1]), "v1"))["answer"] == "1 m"
+
+
+def test_local_cache_enforces_entry_and_byte_limits():
+    cache = LocalCache(max_entries=2, max_bytes=10_000, ttl=60)
+    for i in range(3):
+        cache.set(f"k{i}", {"answer": str(i)})
+    assert cache.get("k0") is None and len(cache) == 2
+
+    small = LocalCache(max_entries=100, max_bytes=60, ttl=60)
+    small.set("a", {"answer": "x" * 20})
+    small.set("b", {"answer": "y" * 20})
+    assert small.get("a") is None and small.get("b")["answer"] == "y" * 20
+    assert small.size_bytes <= 60
+
+
+def test_local_cache_returns_copies():
+    cache = LocalCache(max_entries=10, max_bytes=10_000, ttl=60)
+    cache.set("k", {"metadata": {}})
+    cache.get("k")["metadata"]["source"] = "cache"
+    assert cache.get("k") == {"metadata": {}}
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_tiered_cache_serves_repeats_from_l1(mock_redis):
+    shared = mock_redis.return_value = FakeRedis()
+    tiered = TieredCache(RedisCache(), LocalCache(max_entries=10, max_bytes=10_000, ttl=60))
+    tiered._ensure_listener = lambda: None  # sin pub/sub en el test
+
+    await tiered.set("q", ["ctx"], {"answer": "a"})
+    tiered.l1.clear()
+    shared.round_trips = 0
+    assert (await tiered.get("q", ["ctx"]))["answer"] == "a"  # L2
+    assert (await tiered.get("q", ["ctx"]))["answer"] == "a"  # L1
+    assert shared.round_trips == 1
+
+    await tiered.clear()
+    assert await tiered.get("q", ["ctx"]) is None
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_keys_use_normalized_query_and_chunk_ids(mock_redis):
+    mock_redis.return_value = FakeRedis()
+    cache = RedisCache()
+    await cache.set("¿Altura de extintores?", ["si.md#0-ab12"], {"answer": "a"}, ["si.md"])
+    assert (await cache.get("altura de extintores", ["si.md#0-ab12"]))["answer"] == "a"
+    # El chunk cambió (otro hash de contenido): otra clave
+    assert await cache.get("altura de extintores", ["si.md#0-cd34"]) is None
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_tag_invalidation_evicts_only_affected_entries(mock_redis):
+    shared = mock_redis.return_value = FakeRedis()
+    tiered = TieredCache(RedisCache(), LocalCache(max_entries=10, max_bytes=10_000, ttl=60))
+    tiered._ensure_listener = lambda: None
+    await tiered.set("extintores", ["si.md#0-a"], {"answer": "si"}, ["si.md"])
+    await tiered.set("rampas", ["sua.md#0-b"], {"answer": "sua"}, ["sua.md"])
+    await tiered.set("ambos", ["si.md#1-c", "sua.md#1-d"], {"answer": "mixta"}, ["si.md", "sua.md"])
+
+    evicted = await tiered.invalidate_tags(["doc:si.md"])
+    assert len(evicted) == 2
+    assert await tiered.get("extintores", ["si.md#0-a"]) is None
+    assert await tiered.get("ambos", ["si.md#1-c", "sua.md#1-d"]) is None
+    assert (await tiered.get("rampas", ["sua.md#0-b"]))["answer"] == "sua"
+
+    # Cambio de versión del prompt: se liberan las entradas de la versión anterior
+    shared.data[PROMPT_VERSION_KEY] = b"0.9.0"
+    shared.data["rag_cache:tag:prompt:0.9.0"] = {"rag_cache:0.9.0:viejo": 1e12}
+    shared.data["rag_cache:0.9.0:viejo"] = b"j{}"
+    assert await tiered.retire_old_prompt_versions() == ["rag_cache:0.9.0:viejo"]
+    assert "rag_cache:0.9.0:viejo" not in shared.data
+    assert await tiered.retire_old_prompt_versions() == []
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_semantic_cache_full_index_rotates_oldest_vectors(mock_redis):
+    mock_redis.return_value = fake = FakeRedis()
+    writer, reader = SemanticCache(max_entries=2), SemanticCache(threshold=0.9)
+    response = {"answer": "1 m", "metrics": {}, "metadata": {}}
+
+    await writer.store("¿Ancho de pasillos?", _unit([1, 0, 0]), "v1", response)
+    # Misma pregunta con otra forma: misma entrada, no se duplica el vector
+    await writer.store("  ¿ancho de PASILLOS? ", _unit([1, 0, 0]), "v1", response)
+    await writer.store("¿Altura de extintores?", _unit([0, 1, 0]), "v1", {**response, "answer": "1,20 m"})
+    assert await reader.lookup(_unit([1, 0, 0]), "v1") is not None
+
+    # Lleno: sale el vector más antiguo, entra el nuevo y el otro worker rehace su copia
+    await writer.store("¿Ancho de rampas?", _unit([0, 0, 1]), "v1", {**response, "answer": "1,5 m"})
+    assert len(fake.data[writer._index_key("v1")]) == 2
+    assert (await reader.lookup(_unit([0, 0, 1]), "v1"))["answer"] == "1,5 m"
+    assert await reader.lookup(_unit([1, 0, 0]), "v1") is None
+    assert (await reader.lookup(_unit([0, 1, 0]), "v1"))["answer"] == "1,20 m"
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_semantic_cache_workers_rebuild_after_clear_and_invalidation(mock_redis):
+    mock_redis.return_value = FakeRedis()
+    worker_a, worker_b = SemanticCache(threshold=0.9), SemanticCache(threshold=0.9)
+    response = {"answer": "vieja", "metrics": {}, "metadata": {}}
+
+    await worker_a.store("uno", _unit([1, 0, 0]), "v1", response)
+    await worker_a.store("dos", _unit([0, 1, 0]), "v1", response)
+    assert (await worker_b.lookup(_unit([1, 0, 0]), "v1"))["answer"] == "vieja"
+
+    # La lista se recrea con el mismo tamaño: B no puede fiarse solo de LLEN
+    await worker_a.clear()
+    await worker_a.store("tres", _unit([0, 0, 1]), "v1", {**response, "answer": "nueva"})
+    await worker_a.store("cuatro", _unit([1, 1, 0]), "v1", {**response, "answer": "nueva"})
+    assert (await worker_b.lookup(_unit([0, 0, 1]), "v1"))["answer"] == "nueva"
+    assert await worker_b.lookup(_unit([1, 0, 0]), "v1") is None
+
+    # Lo mismo al invalidar la versión del corpus y volver a llenar
+    await worker_a.invalidate_tags(["corpus:v1"])
+    await worker_a.store("uno", _unit([1, 0, 0]), "v1", {**response, "answer": "otra"})
+    await worker_a.store("dos", _unit([0, 1, 0]), "v1", {**response, "answer": "otra"})
+    assert (await worker_b.lookup(_unit([1, 0, 0]), "v1"))["answer"] == "otra"
+    assert await worker_b.lookup(_unit([0, 0, 1]), "v1") is None
+
+
+@pytest.mark.asyncio
+@patch("src.sre.utils.cache.aioredis.Redis")
+async def test_semantic_cache_misses_after_prompt_change(mock_redis):
+    mock_redis.return_value = fake = FakeRedis()
+    cache = SemanticCache(threshold=0.9)
+    response = {"answer": "A 1,20 m", "metrics": {}, "metadata": {}}
+
+    with patch("src.sre.utils.cache.PROMPT_VERSION", "1.0.0"):
+        await cache.store("¿Altura de extintores?", _unit([1, 0, 0]), "v1", response, ["si.md"])
+        assert (await cache.lookup(_unit([1, 0, 0]), "v1"))["answer"] == "A 1,20 m"
+    with patch("src.sre.utils.cache.PROMPT_VERSION", "2.0.0"):
+        assert await cache.lookup(_unit([1, 0, 0]), "v1") is None
+
+    # La entrada queda etiquetada como las exactas: cae al retirar su prompt o su documento
+    entry_key = next(key for key in fake.data if ":entry:" in key)
+    assert entry_key in fake.data["rag_cache:tag:prompt:1.0.0"]
+    assert entry_key in fake.data["rag_cache:tag:doc:si.md"]
@@ -0,0 +1,81 @@
+import json
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from src.sre.utils.cache_warming import CacheWarmer, WarmupQuery, mine_queries
+
+
+class DictCache:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, query, chunk_ids):
+        return self.data.get(query)
+
+    async def set(self, query, chunk_ids, response, documents=()):
+        self.data[query] = response
+
+
+class FakeRetriever:
+    def retrieve(self, query, top_k):
+        return [SimpleNamespace(id="c1", text="Extintores cada 15 m.", source="si.md")]
+
+
+class FakeModel:
+    """Cada llamada cuesta 0,01 $ (estimado: 0,015 $ en el peor caso)."""
+
+    def __init__(self):
+        self.calls = []
+        self.resilient = []
+
+    def estimate_cost(self, query, context_chunks):
+        return 0.015
+
+    async def agenerate_response(self, query, context_chunks, run_name=None, resilient=True):
+        self.calls.append(query)
+        self.resilient.append(resilient)
+        return {
+            "answer": f"respuesta a {query}",
+            "metrics": {"latency_ms": 1, "cost_usd": 0.01, "tokens": 30, "input_tokens": 20, "output_tokens": 10},
+            "metadata": {"model": "gpt-3.5-turbo", "prompt_version": "v1", "run_id": None}
+        }
+
+
+def test_mine_queries_ranks_normalized_questions_from_requests_and_logs(tmp_path):
+    requests = tmp_path / "requests.jsonl"
+    requests.write_text("\n".join(json.dumps(r) for r in [
+        {"query": "¿Altura de extintores?"},
+        {"query": "altura de extintores"},
+        {"question": "Ancho de rampas", "top_k": 3},
+    ]), encoding="utf-8")
+    logs = tmp_path / "api.log"
+    logs.write_text("\n".join([
+        json.dumps({"event": "request_received", "query": "¿Altura de extintores?"}),
+        json.dumps({"event": "cache_hit", "query": "Ancho de rampas"}),
+        "texto sin formato JSON",
+    ]), encoding="utf-8")
+
+    queries = mine_queries([str(requests), str(logs)], top_n=5)
+    assert [(q.query, q.top_k, q.count) for q in queries] == [
+        ("¿Altura de extintores?", 5, 3),
+        ("Ancho de rampas", 3, 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_warmer_skips_cached_answers_and_respects_the_budget():
+    cache, model = DictCache(), FakeModel()
+    cache.data["ya en caché"] = {"answer": "previa"}
+    queries = [WarmupQuery(q, 5, 1) for q in ["ya en caché", "uno", "dos", "tres", "cuatro"]]
+
+    with patch("src.sre.utils.cache_warming.get_rag_model", return_value=model):
+        warmer = CacheWarmer(cache, FakeRetriever(), budget_usd=0.035, concurrency=1, rate_per_second=0)
+        report = await warmer.warm(queries)
+
+    # 0,035 $ de presupuesto: caben tres llamadas (la última con su estimación de 0,015 $)
+    assert (report.cached, report.warmed, report.skipped_budget) == (1, 3, 1)
+    assert model.calls == ["uno", "dos", "tres"]
+    # Sin hedge ni degradación: cada reserva cubre exactamente una llamada
+    assert model.resilient == [False, False, False]
+    assert report.spent_usd == pytest.approx(0.03)
+    assert cache.data["uno"]["metadata"]["sources"] == ["c1"]
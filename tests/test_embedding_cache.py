@@ -0,0 +1,72 @@
+import numpy as np
+from unittest.mock import patch
+from src.sre.retrieval.embedding_cache import CachedEmbedder, EmbeddingCache
+
+
+class CountingEmbedder:
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return np.array([np.random.default_rng(len(t)).normal(size=8) for t in texts], dtype=np.float32)
+
+
+def test_repeated_texts_are_embedded_once(tmp_path):
+    inner = CountingEmbedder()
+    embedder = CachedEmbedder(inner, EmbeddingCache(str(tmp_path)))
+
+    first = embedder.embed(["extintores", "rampas", "extintores"])
+    second = embedder.embed(["rampas", "  extintores "])
+    assert inner.texts == ["extintores", "rampas"]
+    assert np.allclose(first[0], second[1], atol=1e-3)
+    assert np.allclose(np.linalg.norm(second, axis=1), 1.0, atol=1e-3)
+
+
+def test_cache_survives_restarts_and_is_shared_between_workers(tmp_path):
+    worker_a = CachedEmbedder(CountingEmbedder(), EmbeddingCache(str(tmp_path), refresh_seconds=0))
+    worker_b_inner = CountingEmbedder()
+    worker_b = CachedEmbedder(worker_b_inner, EmbeddingCache(str(tmp_path), refresh_seconds=0))
+    worker_b.embed(["otra consulta"])
+
+    vector = worker_a.embed(["evacuación"])[0]
+    # El otro worker lo lee de los segmentos en disco (float16) sin llamar a la API
+    assert np.allclose(worker_b.embed(["evacuación"])[0], vector, atol=1e-3)
+    assert worker_b_inner.texts == ["otra consulta"]
+
+    restarted_inner = CountingEmbedder()
+    restarted = CachedEmbedder(restarted_inner, EmbeddingCache(str(tmp_path)))
+    restarted.embed(["evacuación", "otra consulta"])
+    assert restarted_inner.texts == []
+
+
+def test_models_do_not_share_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("model-a", ["texto"], np.ones((1, 4), dtype=np.float32))
+    assert cache.get_many("model-b", ["texto"]) == [None]
+    assert cache.get_many("model-a", ["texto"])[0] is not None
+
+
+def test_failed_write_does_not_misalign_later_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("model", ["primero"], np.array([[1, 0, 0, 0]], dtype=np.float32))
+
+    real_open = open
+    def failing_keys_open(path, mode="r", *args, **kwargs):
+        # Los vectores se escriben y las claves no (disco lleno entre las dos escrituras)
+        if str(path).endswith(".keys") and "a" in mode:
+            raise OSError("No space left on device")
+        return real_open(path, mode, *args, **kwargs)
+
+    with patch("builtins.open", failing_keys_open):
+        cache.put_many("model", ["perdido"], np.array([[0, 1, 0, 0]], dtype=np.float32))
+    cache.put_many("model", ["segundo"], np.array([[0, 0, 1, 0]], dtype=np.float32))
+
+    # Otro worker lee los segmentos: cada clave con su vector
+    reader = EmbeddingCache(str(tmp_path))
+    first, lost, second = reader.get_many("model", ["primero", "perdido", "segundo"])
+    assert np.allclose(first, [1, 0, 0, 0], atol=1e-3)
+    assert lost is None
+    assert np.allclose(second, [0, 0, 1, 0], atol=1e-3)
@@ -0,0 +1,78 @@
+import hashlib
+import numpy as np
+from src.sre.data.chunking import chunk_document
+from src.sre.data.ingestion import IngestionPipeline
+from src.sre.retrieval.retriever import Retriever
+
+
+class FakeEmbedder:
+    """Embeddings deterministas (hash del texto) que cuentan cuántos textos se piden."""
+    model_name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += len(texts)
+        seeds = [int(hashlib.md5(t.encode()).hexdigest()[:8], 16) for t in texts]
+        return np.array([np.random.default_rng(s).normal(size=16) for s in seeds], dtype=np.float32)
+
+
+DB_SI = """DB-SI 4 Instalaciones de protección contra incendios
+
+Los extintores portátiles se colocarán a una altura máxima de 1,20 m.
+
+1.2 Señalización
+
+Los medios manuales de extinción deben señalizarse con señales fotoluminiscentes.
+"""
+
+
+def test_chunks_follow_sections():
+    chunks = list(chunk_document("db-si.md", DB_SI))
+    assert [c["section"] for c in chunks] == ["DB-SI 4 Instalaciones de protección contra incendios", "1.2 Señalización"]
+    assert chunks[0]["text"].startswith("DB-SI 4")
+    assert all(c["id"].startswith("db-si.md#") for c in chunks)
+
+
+def test_long_sections_are_windowed():
+    body = " ".join(f"Frase número {i} del documento." for i in range(400))
+    chunks = list(chunk_document("long.txt", body, max_chars=500, overlap=50))
+    assert len(chunks) > 1
+    assert all(len(c["text"]) <= 560 for c in chunks)
+
+
+def test_incremental_ingestion_only_embeds_changed_documents(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "db-si.md").write_text(DB_SI, encoding="utf-8")
+    (corpus / "sua.txt").write_text("Sección SUA 1\n\nRiesgo de caídas.\fPágina 2.", encoding="utf-8")
+    embedder = FakeEmbedder()
+    pipeline = IngestionPipeline(str(corpus), str(tmp_path / "index"), embedder=embedder)
+
+    first = pipeline.run()
+    assert sorted(first.added) == ["db-si.md", "sua.txt"]
+    assert embedder.calls == first.chunks_embedded == 3
+
+    second = pipeline.run()
+    assert not second.changed and embedder.calls == 3
+
+    (corpus / "sua.txt").write_text("Sección SUA 1\n\nRiesgo de caídas en rampas.", encoding="utf-8")
+    third = pipeline.run()
+    assert third.updated == ["sua.txt"]
+    assert third.chunks_reused == 2 and third.chunks_embedded == 1
+
+    retriever = Retriever(index_dir=str(tmp_path / "index"), embedder=embedder)
+    hits = retriever.retrieve("Sección SUA 1\nRiesgo de caídas en rampas.", top_k=1)
+    assert hits[0].source == "sua.txt"
+
+
+def test_process_pool_mode(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(4):
+        (corpus / f"doc{i}.md").write_text(DB_SI, encoding="utf-8")
+    report = IngestionPipeline(
+        str(corpus), str(tmp_path / "index"), embedder=FakeEmbedder(), workers=2
+    ).run()
+    assert report.chunks_embedded == 8
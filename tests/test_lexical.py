@@ -0,0 +1,63 @@
+import numpy as np
+from src.sre.retrieval.lexical import LexicalIndex, build_lexical_index, reciprocal_rank_fusion, tokenize
+from src.sre.retrieval.retriever import Retriever
+from src.sre.retrieval.vector_index import build_index
+
+CHUNKS = [
+    {"id": "db-si.md#0", "text": "DB-SI 4 Instalaciones de protección contra incendios. Extintores portátiles.", "source": "db-si.md"},
+    {"id": "db-si.md#1", "text": "DB-SI 3 Evacuación de ocupantes. Recorridos de evacuación y puertas.", "source": "db-si.md"},
+    {"id": "db-sua.md#0", "text": "DB SUA 1 Seguridad frente al riesgo de caídas. 1.2 Rampas y escaleras.", "source": "db-sua.md"},
+    {"id": "db-he.md#0", "text": "DB-HE 1 Limitación de la demanda energética del edificio.", "source": "db-he.md"},
+]
+
+
+class CountingEmbedder:
+    model_name = "fake"
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += len(texts)
+        return np.ones((len(texts), self.dim), dtype=np.float32)
+
+
+def _build(tmp_path):
+    embeddings = np.random.default_rng(0).normal(size=(len(CHUNKS), 8)).astype(np.float32)
+    build_index(str(tmp_path), embeddings, CHUNKS)
+    build_lexical_index(str(tmp_path))
+    return str(tmp_path)
+
+
+def test_tokenizer_keeps_cte_references():
+    terms = tokenize("¿Qué dice el DB SI 4 sobre los extintores y la evacuación?")
+    assert "db-si_4" in terms and "extintor" in terms and "evacuacion" in terms
+    assert "que" not in terms and "los" not in terms
+    assert "1.2" in tokenize("Apartado 1.2 del DB-SUA")
+
+
+def test_bm25_ranks_exact_code_first(tmp_path):
+    index = LexicalIndex(_build(tmp_path))
+    rows, scores = index.search("DB-SI 3 evacuación", top_k=3)
+    assert rows[0] == 1
+    assert np.all(np.diff(scores) <= 0)
+    assert index.search("SUA", top_k=5)[0].tolist() == [2]
+    assert index.search("palabra inexistente", top_k=5)[0].size == 0
+
+
+def test_hybrid_retrieval_skips_embedding_for_exact_lookups(tmp_path):
+    embedder = CountingEmbedder()
+    retriever = Retriever(index_dir=_build(tmp_path), embedder=embedder)
+
+    hits = retriever.retrieve("DB-SI 4", top_k=2)
+    assert hits[0].id == "db-si.md#0" and embedder.calls == 0
+
+    hits = retriever.retrieve("¿Cómo se calculan los recorridos de evacuación en un edificio?", top_k=2)
+    assert embedder.calls == 1 and hits[0].id == "db-si.md#1"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([2, 4, -1])])
+    assert fused[0][0] == 2
+    assert {row for row, _ in fused} == {1, 2, 3, 4}
@@ -0,0 +1,41 @@
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from src.sre.generation.llm_client import RAGModel, get_rag_model
+
+
+class SlowCompletions:
+    """Imita chat.completions de AsyncOpenAI con una latencia fija."""
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(0.2)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Respuesta"))],
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+        )
+
+
+def test_models_are_reused_per_name():
+    assert get_rag_model("gpt-4") is get_rag_model("gpt-4")
+    assert get_rag_model("gpt-4") is not get_rag_model("gpt-3.5-turbo")
+
+
+@pytest.mark.asyncio
+@patch("src.sre.generation.llm_client.get_tracking_queue")
+async def test_async_generation_runs_concurrently(mock_tracking):
+    model = RAGModel("gpt-3.5-turbo")
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=SlowCompletions()))
+
+    with patch("src.sre.generation.llm_client.get_async_openai_client", return_value=fake_client):
+        start = time.perf_counter()
+        results = await asyncio.gather(*[model.agenerate_response("q", ["ctx"]) for _ in range(5)])
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.6  # 5 llamadas de 0.2 s en paralelo, no en serie
+    assert results[0]["metrics"]["tokens"] == 120
+    # El tracking solo se encola: un run por petición, con su id en la respuesta
+    submitted = [call.args[0] for call in mock_tracking.return_value.submit.call_args_list]
+    assert len(submitted) == 5
+    assert results[0]["metadata"]["run_id"] == submitted[0].request_id
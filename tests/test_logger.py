@@ -0,0 +1,34 @@
+import logging
+import pytest
+import structlog
+from unittest.mock import patch
+from src.sre.monitoring import logger as log_module
+from src.sre.monitoring.logger import EventSampler, _parse_rules, get_logger
+
+
+def test_get_logger_configures_once():
+    get_logger("a")
+    handlers = list(logging.getLogger().handlers)
+    with patch.object(log_module.structlog, "configure") as configure:
+        get_logger("b")
+    configure.assert_not_called()
+    assert logging.getLogger().handlers == handlers
+
+
+def test_event_sampler_rate_limits_and_samples():
+    sampler = EventSampler(_parse_rules("cache_hit=0"), _parse_rules("request_received=2"))
+
+    kept = 0
+    for _ in range(10):
+        try:
+            sampler(None, "info", {"event": "request_received"})
+            kept += 1
+        except structlog.DropEvent:
+            pass
+    assert kept == 2
+
+    with pytest.raises(structlog.DropEvent):
+        sampler(None, "info", {"event": "cache_hit"})
+    # Los avisos y errores no se descartan, ni los eventos sin regla
+    assert sampler(None, "warning", {"event": "cache_hit"})["event"] == "cache_hit"
+    assert sampler(None, "info", {"event": "other"})["event"] == "other"
@@ -0,0 +1,73 @@
+from unittest.mock import patch
+from src.sre.generation.model_router import ModelRouter
+
+COMPLEX = "Compara la evacuación en uso docente y hospitalario"
+
+
+def _warm(router, model, latency_ms, n=30, ok=True):
+    for _ in range(n):
+        router.record(model, latency_ms, ok=ok)
+
+
+def test_static_routing_reasons():
+    router = ModelRouter()
+    assert router.decide("¿Altura de extintores?", []).reason == "default"
+    decision = router.decide(COMPLEX, [])
+    assert (decision.model, decision.reason) == ("gpt-4", "complex_keywords")
+    assert router.decide("x", ["a" * 4000]).reason == "large_context"
+
+
+def test_slow_model_is_skipped_when_it_would_break_the_budget():
+    router = ModelRouter()
+    _warm(router, "gpt-4", 6000)
+    _warm(router, "gpt-3.5-turbo", 900)
+
+    decision = router.decide(COMPLEX, [], latency_budget_ms=3000)
+    assert (decision.model, decision.reason) == ("gpt-3.5-turbo", "slo_latency_budget")
+    # Con un presupuesto holgado (o sin presupuesto) manda la complejidad
+    assert router.decide(COMPLEX, [], latency_budget_ms=10000).model == "gpt-4"
+    assert router.decide(COMPLEX, []).model == "gpt-4"
+
+
+def test_no_fallback_without_enough_samples():
+    router = ModelRouter()
+    _warm(router, "gpt-4", 6000, n=3)
+    assert router.decide(COMPLEX, [], latency_budget_ms=3000).model == "gpt-4"
+
+
+def test_errors_and_rate_limits_move_traffic():
+    router = ModelRouter()
+    _warm(router, "gpt-4", 1000, n=20)
+    _warm(router, "gpt-4", 1000, n=10, ok=False)
+    assert router.decide(COMPLEX, []).reason == "slo_error_rate"
+
+    router = ModelRouter()
+    router.record_rate_limit("gpt-4", remaining=3, limit=500)
+    assert router.decide(COMPLEX, []).reason == "slo_rate_limit"
+    router.record_rate_limit("gpt-4", remaining=400, limit=500)
+    assert router.decide(COMPLEX, []).model == "gpt-4"
+
+
+def test_stale_rate_limit_headers_stop_diverting_traffic():
+    router = ModelRouter()
+    now = [1000.0]
+    with patch("src.sre.generation.model_router.time.monotonic", lambda: now[0]):
+        router.record_rate_limit("gpt-4", remaining=3, limit=500)
+        assert router.decide(COMPLEX, []).reason == "slo_rate_limit"
+        # Sin respuestas nuevas de gpt-4, la lectura caduca con la ventana y el modelo vuelve
+        now[0] += router.model_stats("gpt-4").window_seconds + 1
+        assert router.decide(COMPLEX, []).model == "gpt-4"
+
+        # Si OpenAI dice cuándo repone el cupo, se usa ese plazo (si es menor)
+        router.record_rate_limit("gpt-4", remaining=3, limit=500, reset_seconds=2)
+        assert router.decide(COMPLEX, []).reason == "slo_rate_limit"
+        now[0] += 3
+        assert router.decide(COMPLEX, []).model == "gpt-4"
+
+
+def test_parse_ratelimit_reset_header():
+    from src.sre.generation.llm_client import _parse_reset
+    assert _parse_reset("6m0s") == 360
+    assert _parse_reset("20ms") == 0.02
+    assert _parse_reset("1.5s") == 1.5
+    assert _parse_reset(None) is None
@@ -0,0 +1,47 @@
+import asyncio
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from src.sre.api import debug
+from src.sre.monitoring.profiler import SamplingProfiler
+
+
+def blocking_work(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_profile_attributes_loop_blocking_stack():
+    profiler = SamplingProfiler(hz=200, lag_threshold_ms=20.0)
+
+    async def block_later():
+        await asyncio.sleep(0.05)
+        blocking_work(0.2)
+
+    task = asyncio.create_task(block_later())
+    result = await profiler.profile(0.5)
+    await task
+
+    assert result.samples > 0
+    assert result.loop_lag["max_ms"] >= 100
+    assert any("test_profiler:blocking_work" in stack for stack in result.blocking_stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in result.collapsed().splitlines())
+
+
+def test_profile_endpoint_requires_token():
+    app = FastAPI()
+    app.include_router(debug.router)
+    client = TestClient(app)
+    with patch.object(debug.settings, "debug_profile_token", "secret"):
+        assert client.get("/debug/profile?seconds=0.1").status_code == 403
+        assert client.get("/debug/profile?seconds=0.1", headers={"X-Debug-Token": "nope"}).status_code == 403
+
+        response = client.get("/debug/profile?seconds=0.1&format=json", headers={"X-Debug-Token": "secret"})
+        assert response.status_code == 200
+        assert "loop_lag" in response.json()
+
+    # Sin token configurado nadie puede usarlo
+    with patch.object(debug.settings, "debug_profile_token", None):
+        assert client.get("/debug/profile?seconds=0.1", headers={"X-Debug-Token": ""}).status_code == 403
@@ -0,0 +1,240 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from src.sre.generation import resilience
+from src.sre.generation.llm_client import RAGModel
+from src.sre.generation.resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, HedgeBudget, hedged
+
+
+class FakeCompletions:
+    def __init__(self, delay: float, answer: str):
+        self.delay = delay
+        self.answer = answer
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        )
+
+
+def _api_error(error_class, status_code):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return error_class("error", response=httpx.Response(status_code, request=request), body=None)
+
+
+@pytest.mark.asyncio
+async def test_only_provider_failures_count_against_the_circuit():
+    async def failing(error):
+        raise error
+
+    with patch.dict(resilience._breakers, clear=True), \
+            patch.object(resilience.settings, "circuit_failure_threshold", 2):
+        # Peticiones mal formadas de un cliente: no abren el circuito para los demás
+        for _ in range(5):
+            with pytest.raises(openai.BadRequestError):
+                await resilience.guarded_call("test-model", lambda: failing(_api_error(openai.BadRequestError, 400)))
+        breaker = resilience.get_circuit_breaker("test-model")
+        assert (breaker.state, breaker.failures) == ("closed", 0)
+
+        for error in (_api_error(openai.InternalServerError, 503), _api_error(openai.RateLimitError, 429)):
+            with pytest.raises(type(error)):
+                await resilience.guarded_call("test-model", lambda: failing(error))
+        assert breaker.state == "open"
+
+
+class FakeStream:
+    """Stream de OpenAI: cada token llega tras su retardo."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.closed = False
+
+    async def __aiter__(self):
+        for delay, token in self.tokens:
+            await asyncio.sleep(delay)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeStreamCompletions:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.streams = []
+
+    async def create(self, **kwargs):
+        self.streams.append(FakeStream(self.tokens))
+        return self.streams[-1]
+
+
+def test_circuit_breaker_opens_fails_fast_and_recovers():
+    breaker = CircuitBreaker("test-model", failure_threshold=2, reset_seconds=0)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # Pasado el reset entra una llamada de prueba; la siguiente espera a su resultado
+    breaker.reset_seconds = 60
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.check()
+    assert rejected.value.headers["Retry-After"] == "60"
+    breaker.reset_seconds = 0
+    breaker.check()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_when_primary_is_slow_and_primary_is_cancelled():
+    primary_cancelled = asyncio.Event()
+
+    async def primary():
+        try:
+            await asyncio.sleep(1.0)
+            return "primary"
+        except asyncio.CancelledError:
+            primary_cancelled.set()
+            raise
+
+    async def hedge():
+        await asyncio.sleep(0.01)
+        return "hedge"
+
+    result, hedge_won = await hedged("test-model", primary, hedge, 0.05, HedgeBudget(ratio=0))
+    assert (result, hedge_won) == ("hedge", True)
+    # La perdedora ya terminó de cancelarse al volver hedged()
+    assert primary_cancelled.is_set()
+
+    # Sin presupuesto no hay hedge: se espera a la principal
+    empty = HedgeBudget(ratio=0, max_tokens=0)
+    result, hedge_won = await hedged("test-model", lambda: asyncio.sleep(0.1, "primary"), hedge, 0.01, empty)
+    assert (result, hedge_won) == ("primary", False)
+
+
+@pytest.mark.asyncio
+@patch("src.sre.generation.llm_client.get_tracking_queue")
+async def test_deadline_degrades_to_fallback_model(mock_tracking):
+    clients = {
+        "gpt-4": SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(1.0, "lenta"))),
+        "gpt-3.5-turbo": SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(0.01, "rápida"))),
+    }
+    with patch("src.sre.generation.llm_client.get_async_openai_client", side_effect=clients.get), \
+            patch.object(resilience.settings, "llm_model_deadlines", "gpt-4=0.05"), \
+            patch.object(resilience.settings, "llm_hedge_enabled", False), \
+            patch.dict(resilience._breakers, clear=True):
+        result = await RAGModel("gpt-4").agenerate_response("q", ["ctx"])
+
+    assert result["answer"] == "rápida"
+    assert result["metadata"]["model"] == "gpt-3.5-turbo"
+    assert result["metadata"]["degraded_from"] == "gpt-4"
+
+    # Sin resiliencia (calentamiento de caché) el error llega tal cual, sin segunda llamada
+    with patch("src.sre.generation.llm_client.get_async_openai_client", side_effect=clients.get), \
+            patch.object(resilience.settings, "llm_model_deadlines", "gpt-4=0.05"), \
+            patch.dict(resilience._breakers, clear=True):
+        with pytest.raises(DeadlineExceeded):
+            await RAGModel("gpt-4").agenerate_response("q", ["ctx"], resilient=False)
+
+
+@pytest.mark.asyncio
+@patch("src.sre.generation.llm_client.get_tracking_queue")
+async def test_hedge_and_degrade_take_a_slot_of_their_own_model(mock_tracking):
+    from contextlib import asynccontextmanager
+    slots = []
+
+    @asynccontextmanager
+    async def slot(model_name):
+        slots.append(("in", model_name))
+        try:
+            yield
+        finally:
+            slots.append(("out", model_name))
+
+    clients = {
+        "gpt-4": SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(1.0, "lenta"))),
+        "gpt-3.5-turbo": SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(0.01, "rápida"))),
+    }
+    with patch("src.sre.generation.llm_client.get_async_openai_client", side_effect=clients.get), \
+            patch.object(resilience.settings, "llm_model_deadlines", "gpt-4=0.05"), \
+            patch.object(resilience.settings, "llm_hedge_enabled", False), \
+            patch.dict(resilience._breakers, clear=True):
+        await RAGModel("gpt-4").agenerate_response("q", ["ctx"], slot=slot)
+    # La degradación no ocupa el hueco de gpt-4: se libera antes de pedir el del respaldo
+    assert slots == [("in", "gpt-4"), ("out", "gpt-4"), ("in", "gpt-3.5-turbo"), ("out", "gpt-3.5-turbo")]
+
+    slots.clear()
+    with patch("src.sre.generation.llm_client.get_async_openai_client", side_effect=clients.get), \
+            patch("src.sre.generation.llm_client.hedge_delay", return_value=0.01), \
+            patch.dict(resilience._breakers, clear=True):
+        result = await RAGModel("gpt-4").agenerate_response("q", ["ctx"], slot=slot)
+    # El hedge al modelo barato corre a la vez que la principal, cada uno en su hueco
+    assert result["metadata"]["hedged_from"] == "gpt-4"
+    assert slots[:3] == [("in", "gpt-4"), ("in", "gpt-3.5-turbo"), ("out", "gpt-3.5-turbo")]
+
+
+@pytest.mark.asyncio
+@patch("src.sre.generation.llm_client.get_tracking_queue")
+async def test_stream_deadlines_cover_first_token_and_gaps_between_chunks(mock_tracking):
+    slow = FakeStreamCompletions([(1.0, "lenta")])
+    fast = FakeStreamCompletions([(0, "rápida"), (0, "!")])
+    clients = {
+        "gpt-4": SimpleNamespace(chat=SimpleNamespace(completions=slow)),
+        "gpt-3.5-turbo": SimpleNamespace(chat=SimpleNamespace(completions=fast)),
+    }
+    with patch("src.sre.generation.llm_client.get_async_openai_client", side_effect=clients.get), \
+            patch.object(resilience.settings, "llm_model_deadlines", "gpt-4=0.05"), \
+            patch.dict(resilience._breakers, clear=True):
+        events = [item async for item in RAGModel("gpt-4").astream_response("q", ["ctx"])]
+        # Sin primer token en plazo: cuenta como fallo y, sin nada enviado, responde el respaldo
+        assert [payload for event, payload in events if event == "token"] == ["rápida", "!"]
+        assert resilience.get_circuit_breaker("gpt-4").failures == 1
+        assert slow.streams[0].closed
+
+    stalled = FakeStreamCompletions([(0, "Hola"), (1.0, " mundo")])
+    clients["gpt-3.5-turbo"] = SimpleNamespace(chat=SimpleNamespace(completions=stalled))
+    with patch("src.sre.generation.llm_client.get_async_openai_client", side_effect=clients.get), \
+            patch.object(resilience.settings, "llm_stream_idle_seconds", 0.05), \
+            patch.dict(resilience._breakers, clear=True):
+        tokens = []
+        with pytest.raises(DeadlineExceeded):
+            async for event, payload in RAGModel("gpt-3.5-turbo").astream_response("q", ["ctx"]):
+                tokens.append(payload)
+        # El stream se corta si deja de llegar texto a mitad de respuesta
+        assert tokens == ["Hola"]
+        assert resilience.get_circuit_breaker("gpt-3.5-turbo").failures == 1
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_closes_the_upstream_stream():
+    completions = FakeStreamCompletions([(0, "Hola"), (0, " mundo")])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    with patch("src.sre.generation.llm_client.get_async_openai_client", return_value=client), \
+            patch.dict(resilience._breakers, clear=True):
+        events = RAGModel("gpt-3.5-turbo").astream_response("q", ["ctx"])
+        assert await events.__anext__() == ("token", "Hola")
+        await events.aclose()
+        # Se deja de generar (y de cobrar) y no cuenta como fallo del modelo
+        assert completions.streams[0].closed
+        assert resilience.get_circuit_breaker("gpt-3.5-turbo").failures == 0
+
+
+@patch("src.sre.api.routes.settings.singleflight_enabled", False)
+def test_unavailable_model_returns_503_with_retry_after(services):
+    from src.sre.api.main import app
+    services.cache.get.return_value = None
+    services.retriever.retrieve.return_value = []
+    error = CircuitOpen("gpt-3.5-turbo", "circuit_open", 12.5)
+    with patch("src.sre.generation.llm_client.RAGModel.agenerate_response", AsyncMock(side_effect=error)):
+        response = TestClient(app).post("/query", json={"query": "hola"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
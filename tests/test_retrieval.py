@@ -0,0 +1,64 @@
+import numpy as np
+from src.sre.retrieval.vector_index import VectorIndex, build_index
+from src.sre.retrieval.retriever import Retriever
+
+
+def _random_corpus(n_rows: int, dim: int = 32, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n_rows, dim)).astype(np.float32)
+    chunks = [{"id": f"doc#{i}", "text": f"chunk {i}", "source": "doc"} for i in range(n_rows)]
+    return embeddings, chunks
+
+
+def test_flat_search_matches_brute_force(tmp_path):
+    embeddings, chunks = _random_corpus(500)
+    build_index(str(tmp_path), embeddings, chunks)
+    index = VectorIndex(str(tmp_path), block_size=64)
+
+    queries = embeddings[[3, 42, 499]]
+    rows, scores = index.search(queries, top_k=5)
+
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normed[[3, 42, 499]] @ normed.T), axis=1)[:, :5]
+    assert rows.tolist() == expected.tolist()
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    assert index.get_chunk(rows[1, 0]).id == "doc#42"
+
+
+def test_ivf_search_finds_exact_neighbour(tmp_path):
+    embeddings, chunks = _random_corpus(2000, seed=1)
+    build_index(str(tmp_path), embeddings, chunks, n_clusters=16)
+    index = VectorIndex(str(tmp_path))
+    assert index.is_partitioned
+
+    rows, _ = index.search(embeddings[[7, 1500]], top_k=3, nprobe=4)
+    assert rows[0, 0] == 7
+    assert rows[1, 0] == 1500
+
+
+def test_retriever_without_index_returns_nothing(tmp_path):
+    retriever = Retriever(index_dir=str(tmp_path / "missing"), embedder=object())
+    assert retriever.retrieve("¿Altura de extintores?", top_k=3) == []
+
+
+def test_retriever_swaps_published_version_and_closes_old_after_readers(tmp_path):
+    from src.sre.retrieval.vector_index import publish_index
+    root = tmp_path / "index"
+    root.mkdir()
+    for version, seed in (("v1", 0), ("v2", 1)):
+        embeddings, chunks = _random_corpus(50, seed=seed)
+        build_index(str(root / version), embeddings, chunks, corpus_version=version)
+    publish_index(str(root), str(root / "v1"))
+
+    retriever = Retriever(index_dir=str(root), embedder=object())
+    assert retriever.index.corpus_version == "v1"
+
+    with retriever._reading() as (old, _):
+        # Publicar no cambia nada hasta la siguiente comprobación de CURRENT
+        publish_index(str(root), str(root / "v2"))
+        assert retriever.index is old
+        retriever.refresh(force=True)
+        assert retriever.corpus_version == "v2"
+        # La búsqueda en curso sigue usando el índice anterior, aún abierto
+        assert not old._chunks_mmap.closed
+    assert old._chunks_mmap.closed
@@ -0,0 +1,106 @@
+import asyncio
+import time
+import pytest
+from src.sre.utils.singleflight import SingleFlight
+
+
+class FakeLeaseRedis:
+    """Lo justo de Redis para los leases: SET NX PX, EXISTS y los scripts de renovar y liberar."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _expire(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key)
+
+    async def set(self, key, value, nx=False, px=None):
+        self._expire(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        if px:
+            self.expires[key] = time.monotonic() + px / 1000
+        return True
+
+    async def exists(self, key):
+        self._expire(key)
+        return int(key in self.data)
+
+    async def eval(self, script, numkeys, key, token, *args):
+        self._expire(key)
+        if self.data.get(key) != token:
+            return 0
+        if "pexpire" in script:
+            self.expires[key] = time.monotonic() + int(args[0]) / 1000
+        else:
+            del self.data[key]
+            self.expires.pop(key, None)
+        return 1
+
+
+class Worker:
+    """Un worker con su SingleFlight; la caché (dict) y Redis son compartidos."""
+
+    def __init__(self, redis_client, cache, fail=False, lease_seconds=5, duration=0.05):
+        self.flight = SingleFlight(redis_client, lease_seconds=lease_seconds, poll_interval=0.01)
+        self.cache = cache
+        self.fail = fail
+        self.duration = duration
+        self.calls = 0
+
+    async def generate(self):
+        self.calls += 1
+        await asyncio.sleep(self.duration)
+        if self.fail:
+            raise RuntimeError("LLM caído")
+        self.cache["k"] = {"answer": f"respuesta {self.calls}"}
+        return self.cache["k"]
+
+    async def fetch(self):
+        return self.cache.get("k")
+
+    def run(self):
+        return self.flight.run("k", self.generate, self.fetch)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_in_one_worker_share_one_call():
+    worker = Worker(FakeLeaseRedis(), {})
+    results = await asyncio.gather(*[worker.run() for _ in range(5)])
+    assert worker.calls == 1
+    assert [shared for _, shared in results].count(False) == 1
+    assert all(result == {"answer": "respuesta 1"} for result, _ in results)
+
+
+@pytest.mark.asyncio
+async def test_followers_in_other_workers_reuse_the_leader_answer():
+    redis_client, cache = FakeLeaseRedis(), {}
+    leader, follower = Worker(redis_client, cache), Worker(redis_client, cache)
+    (first, first_shared), (second, second_shared) = await asyncio.gather(leader.run(), follower.run())
+    assert (leader.calls, follower.calls) == (1, 0)
+    assert first == second and not first_shared and second_shared
+    assert redis_client.data == {}  # lease liberado
+
+
+@pytest.mark.asyncio
+async def test_follower_takes_over_when_the_leader_fails():
+    redis_client, cache = FakeLeaseRedis(), {}
+    leader, follower = Worker(redis_client, cache, fail=True), Worker(redis_client, cache)
+    outcomes = await asyncio.gather(leader.run(), follower.run(), return_exceptions=True)
+    assert isinstance(outcomes[0], RuntimeError)
+    assert outcomes[1] == ({"answer": "respuesta 1"}, False)
+    assert follower.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_leader_renews_its_lease_while_generating():
+    redis_client, cache = FakeLeaseRedis(), {}
+    # La generación dura bastante más que el TTL del lease
+    leader = Worker(redis_client, cache, lease_seconds=0.1, duration=0.4)
+    follower = Worker(redis_client, cache, lease_seconds=0.1)
+    await asyncio.gather(leader.run(), follower.run())
+    assert (leader.calls, follower.calls) == (1, 0)
+    assert redis_client.data == {}
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from src.sre.api import startup
+from src.sre.api.main import app
+from src.sre.api.startup import StartupReport, run_startup_warmup
+
+
+def test_importing_app_does_not_load_heavy_dependencies():
+    # En un proceso aparte: otros tests ya pueden haber importado mlflow/openai
+    code = (
+        "import sys, src.sre.api.main; "
+        "print(','.join(m for m in ('mlflow', 'openai') if m in sys.modules))"
+    )
+    env = {**os.environ, "OPENAI_API_KEY": "sk-test"}
+    env.pop("PINECONE_API_KEY", None)
+    env.pop("PINECONE_ENVIRONMENT", None)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    assert output.stdout.strip() == ""
+
+
+def test_importing_app_does_not_build_clients():
+    # Caché, retriever y admisión se construyen en el lifespan (ver api/dependencies.py)
+    code = (
+        "import src.sre.api.main; "
+        "from src.sre.utils import cache; from src.sre.retrieval import retriever; from src.sre.api import admission; "
+        "print(cache._cache_instance, retriever._retriever_instance, admission._admission_instance)"
+    )
+    env = {**os.environ, "OPENAI_API_KEY": "sk-test"}
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    assert output.stdout.strip() == "None None None"
+
+
+@pytest.mark.asyncio
+async def test_ready_only_after_warmup_and_reports_phases():
+    report = StartupReport()
+    client = TestClient(app)
+    with patch("src.sre.api.routes.get_startup_report", return_value=report):
+        assert client.get("/ready").status_code == 503
+
+        with patch.object(startup, "_warm_imports", AsyncMock(return_value="ok")), \
+                patch.object(startup, "_warm_redis", AsyncMock(side_effect=ConnectionError("down"))), \
+                patch.object(startup, "_warm_llm", AsyncMock(return_value="ok")), \
+                patch.object(startup, "_warm_index", AsyncMock(return_value="no index")):
+            await run_startup_warmup(report)
+
+        response = client.get("/ready")
+    assert response.status_code == 200
+    phases = response.json()["phases"]
+    assert set(phases) == {"imports", "redis", "llm", "index"}
+    # Una fase fallida queda en el informe pero no bloquea la disponibilidad
+    assert phases["redis"]["status"] == "failed" and phases["index"]["detail"] == "no index"
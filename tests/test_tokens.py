@@ -0,0 +1,58 @@
+from src.sre.config.pricing import compute_cost, get_model_pricing
+from src.sre.config.settings import get_settings
+from src.sre.generation.tokens import adaptive_max_tokens, count_tokens, plan_prompt
+
+settings = get_settings()
+
+TEMPLATE = "Contexto:\n{context}\n\nPregunta: {query}"
+
+
+def test_budget_keeps_ranked_chunks_and_drops_the_rest():
+    chunks = ["primero " * 100, "segundo " * 100, "tercero " * 100]
+    full = plan_prompt("gpt-3.5-turbo", "Eres un experto.", TEMPLATE, "¿rampas?", chunks, budget=10000)
+    assert full.chunks_used == 3 and full.chunks_dropped == 0
+
+    per_chunk = count_tokens(chunks[0], "gpt-3.5-turbo")
+    plan = plan_prompt(
+        "gpt-3.5-turbo", "Eres un experto.", TEMPLATE, "¿rampas?", chunks, budget=per_chunk + 150
+    )
+    # El primero entra entero, el segundo recortado y el tercero se descarta
+    assert plan.chunks_used == 2 and plan.chunks_trimmed == 1 and plan.chunks_dropped == 1
+    assert plan.input_tokens <= per_chunk + 150
+    assert "primero" in plan.user_prompt and "tercero" not in plan.user_prompt
+    assert plan.messages[1]["content"] == plan.user_prompt
+
+
+def test_max_tokens_adapts_to_context_window():
+    assert adaptive_max_tokens("gpt-4", 1000) == 1000
+    # Con la ventana casi llena solo queda el hueco restante, aunque sea menor que el mínimo
+    assert adaptive_max_tokens("gpt-4", 7800) == 392
+    assert adaptive_max_tokens("gpt-4", 8100) == 92
+
+
+def test_plan_leaves_minimum_output_room_in_the_window():
+    chunks = ["norma " * 2000] * 5
+    plan = plan_prompt("gpt-4", "Eres un experto.", TEMPLATE, "¿rampas?", chunks)
+    assert plan.input_tokens + plan.max_tokens <= get_model_pricing("gpt-4")["context_window"]
+    assert plan.max_tokens >= settings.llm_min_output_tokens
+
+
+def test_pricing_table_lookup_and_cost():
+    assert get_model_pricing("gpt-4o-mini-2024-07-18") is get_model_pricing("gpt-4o-mini")
+    assert get_model_pricing("gpt-4-0613") is get_model_pricing("gpt-4")
+    assert get_model_pricing("modelo-desconocido") is get_model_pricing("gpt-3.5-turbo")
+    assert compute_cost("gpt-4", 1000, 1000) == 0.03 + 0.06
+
+
+def test_max_tokens_follows_question_type_and_context_used():
+    big_context = ["rampas de acceso " * 400]
+    short = plan_prompt("gpt-4", "Eres un experto.", TEMPLATE, "¿rampas?", [])
+    simple = plan_prompt("gpt-4", "Eres un experto.", TEMPLATE, "¿rampas?", big_context)
+    detailed = plan_prompt("gpt-4", "Eres un experto.", TEMPLATE, "Compara rampas y ascensores", big_context)
+
+    # Sin contexto basta el mínimo; con contexto, el tope de una pregunta simple
+    assert short.max_tokens == settings.llm_min_output_tokens
+    assert simple.max_tokens == settings.llm_output_tokens_default
+    # Una comparativa con mucho contexto llega al tope del modelo
+    assert detailed.max_tokens == get_model_pricing("gpt-4")["max_output_tokens"]
+    assert short.max_tokens < simple.max_tokens < detailed.max_tokens
@@ -0,0 +1,65 @@
+import json
+import pytest
+from prometheus_client import REGISTRY
+from unittest.mock import patch
+from src.sre.monitoring import tracing
+from src.sre.monitoring.tracing import TraceExporter, set_trace_attribute, span, traced
+
+
+def _stage_count(stage):
+    return REGISTRY.get_sample_value("rag_stage_latency_seconds_count", {"stage": stage}) or 0
+
+
+@traced("test_endpoint")
+async def handler():
+    with span("retrieval", top_k=3):
+        with span("cache.redis_get"):
+            pass
+    set_trace_attribute("run_id", "abc123")
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_sampled_request_exports_nested_spans(tmp_path):
+    exporter = TraceExporter(str(tmp_path / "traces.jsonl"), "jsonl")
+    with patch.object(tracing.settings, "trace_sample_rate", 1.0), \
+            patch.object(tracing, "get_trace_exporter", return_value=exporter):
+        assert await handler() == "ok"
+    exporter.shutdown()
+
+    trace = json.loads((tmp_path / "traces.jsonl").read_text(encoding="utf-8"))
+    assert trace["name"] == "test_endpoint" and trace["attributes"] == {"run_id": "abc123"}
+    spans = {s["name"]: s for s in trace["spans"]}
+    assert spans["test_endpoint"]["parent_id"] is None
+    assert spans["retrieval"]["parent_id"] == spans["test_endpoint"]["span_id"]
+    assert spans["cache.redis_get"]["parent_id"] == spans["retrieval"]["span_id"]
+    assert spans["retrieval"]["attributes"] == {"top_k": 3}
+
+
+@pytest.mark.asyncio
+async def test_unsampled_requests_only_feed_the_stage_histograms():
+    before = _stage_count("retrieval")
+    with patch.object(tracing.settings, "trace_sample_rate", 0.0), \
+            patch.object(tracing, "get_trace_exporter") as mock_exporter:
+        await handler()
+    mock_exporter.assert_not_called()
+    assert _stage_count("retrieval") == before + 1
+
+
+def test_otlp_export_format(tmp_path):
+    trace = tracing.Trace("query")
+    token = tracing._current_trace.set(trace)
+    try:
+        with span("query"):
+            with span("llm.completion", model="gpt-4", max_tokens=1000):
+                pass
+    finally:
+        tracing._current_trace.reset(token)
+
+    body = tracing._to_otlp(trace)
+    spans = body["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    llm = next(s for s in spans if s["name"] == "llm.completion")
+    root = next(s for s in spans if s["name"] == "query")
+    assert llm["parentSpanId"] == root["spanId"] and len(root["traceId"]) == 32
+    assert {"key": "max_tokens", "value": {"intValue": "1000"}} in llm["attributes"]
+    assert int(llm["endTimeUnixNano"]) >= int(llm["startTimeUnixNano"])
@@ -0,0 +1,45 @@
+import threading
+from unittest.mock import MagicMock, patch
+from src.sre.monitoring.tracking import TrackedRun, TrackingQueue
+
+
+def _run(**kwargs):
+    return TrackedRun(
+        run_name="test",
+        params={"model": "gpt-3.5-turbo"},
+        metrics={"latency_ms": 10.0},
+        artifacts={"final_prompt.txt": "prompt"},
+        **kwargs
+    )
+
+
+@patch("src.sre.monitoring.tracking.get_experiment_id", return_value="0")
+@patch("src.sre.monitoring.tracking.mlflow.MlflowClient")
+def test_runs_are_sent_in_background_and_flushed(mock_client_cls, mock_experiment):
+    client = mock_client_cls.return_value
+    tracking = TrackingQueue(max_size=10, flush_interval=0.05, artifact_sample_rate=1.0)
+
+    for _ in range(3):
+        assert tracking.submit(_run())
+    tracking.shutdown(timeout=5)
+
+    assert client.create_run.call_count == 3
+    assert client.log_batch.call_count == 3
+    assert client.log_text.call_count == 3
+
+
+@patch("src.sre.monitoring.tracking.get_experiment_id", return_value="0")
+@patch("src.sre.monitoring.tracking.mlflow.MlflowClient")
+def test_queue_is_bounded_and_sheds_artifacts(mock_client_cls, mock_experiment):
+    # MLflow "colgado": el hilo se queda en el primer envío
+    release = threading.Event()
+    mock_client_cls.return_value.create_run.side_effect = lambda *a, **k: release.wait(5) and MagicMock()
+    tracking = TrackingQueue(max_size=4, batch_size=1, flush_interval=0.05, artifact_sample_rate=1.0)
+
+    results = [tracking.submit(_run()) for _ in range(10)]
+    assert results.count(False) >= 5  # el resto se descarta, la petición nunca espera
+
+    queued = list(tracking._queue.queue)
+    assert any(not run.artifacts for run in queued)  # con la cola llena no se suben prompts
+    release.set()
+    tracking.shutdown(timeout=5)